@@ -1,7 +1,28 @@
+import atexit
+import os
+import cPickle as pickle
 from friendly_name_mixin import FriendlyNameFromClassMixin
 from simple_plugins import PluginMount
-from sympy import cos, cosh, diff, Float, pi, sin, sinh, tan, tanh
-from . import a, y, mu_m
+from sympy import cos, cosh, diff, exp, Float, mpmath, pi, sin, sinh, tan, tanh
+from . import a, y, mu_m, PROJECT_SETTINGS_DIR, DEFAULT_DECIMAL_PRECISION
+from .compilers import compile_function, estimate_cancellation_digits
+from .file_utils import locked, write_atomically
+
+try:
+    import numpy
+except ImportError: #pragma: no cover
+    numpy = None
+
+
+# Leaves at least 9 correct digits in `float64` mode shapes
+MAX_FLOAT64_CANCELLATION_DIGITS = 6
+
+MODE_SHAPE_FORMS = ('standard', 'decaying')
+
+# Decaying exponentials, bounded by 1 for all `0 <= y <= a`
+_exp_mu_m = exp(-mu_m)
+_exp_from_left = exp(-mu_m*y/a)
+_exp_from_right = exp(-mu_m*(1-y/a))
 
 
 class BaseBeamType(FriendlyNameFromClassMixin):
@@ -9,6 +30,7 @@ class BaseBeamType(FriendlyNameFromClassMixin):
     characteristic_function = None
     
     dont_improve_mu_m_for_modes = ()
+    mode_shape_form = 'standard'
     mu_m_initial_search_width = pi/10
     mu_m_increase_search_width_by = Float(1.05)
     
@@ -27,24 +49,195 @@ class BaseBeamType(FriendlyNameFromClassMixin):
     
     def mu_m_initial_guess(self, mode):
         raise NotImplementedError
+    
+    _compiled_characteristic_functions_cache = None
+    def compiled_characteristic_function(self, order=0, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Returns the `order`-th derivative of the characteristic function,
+        compiled into an `mpmath` function of `mu_m`
+        """
+        if self._compiled_characteristic_functions_cache is None:
+            self._compiled_characteristic_functions_cache = {}
+        
+        key = (order, decimal_precision)
+        if key not in self._compiled_characteristic_functions_cache:
+            expr = diff(self.characteristic_function, mu_m, order) if order else self.characteristic_function
+            self._compiled_characteristic_functions_cache[key] = compile_function(
+                expr, ('mu_m',), 'mpmath', decimal_precision
+            )
+        
+        return self._compiled_characteristic_functions_cache[key]
+    
+    def mu_m_asymptotic_map(self, mu_m_guess, epsilon):
+        """
+        Contraction `g`, whose fixed point `epsilon = g(epsilon)` gives the
+        root `mu_m = mu_m_guess + epsilon` of the characteristic equation
+        """
+        raise NotImplementedError
+    
+    def mu_m_asymptotic_lipschitz_bound(self, mu_m_guess, radius):
+        """Upper bound of `|g'(epsilon)|` for all `|epsilon| <= radius`"""
+        raise NotImplementedError
    
     def Y_m(self, mode):
         raise NotImplementedError
     
-    _Y_M_DERIVATIVES_CACHE_MAX_ORDER = 2
+    def Y_m_decaying(self, mode):
+        """
+        `Y_m` rewritten with exponentials decaying away from the beam ends, so
+        it can be evaluated without the cancellation of exponentially growing
+        terms. Same as `Y_m` for mode shapes without such terms.
+        """
+        return self.Y_m(mode)
+    
     _Y_m_derivatives_cache = None
-    def Y_m_derivative_from_cache(self, mode, order):
+    def Y_m_derivative_from_cache(self, mode, order, form='standard'):
         if self._Y_m_derivatives_cache is None:
             self._Y_m_derivatives_cache = {}
-            cache_keys = [None] + list(self.dont_improve_mu_m_for_modes)
-            for n in range(1, self._Y_M_DERIVATIVES_CACHE_MAX_ORDER+1):
-                self._Y_m_derivatives_cache[n] = dict(
-                    (k, diff(self.Y_m(k), y, n)) 
-                    for k in cache_keys
-                )
         
-        key = mode if mode in self.dont_improve_mu_m_for_modes else None
-        return self._Y_m_derivatives_cache[order][key]
+        key = (mode if mode in self.dont_improve_mu_m_for_modes else None, order, form)
+        if key not in self._Y_m_derivatives_cache:
+            self._Y_m_derivatives_cache[key] = derivatives_cache.get(self, mode, order, form)
+        
+        return self._Y_m_derivatives_cache[key]
+    
+    def mode_shape(self, mode, order=0, form=None):
+        """
+        Returns the `order`-th derivative of `Y_m` in the given `form`,
+        defaulting to the `mode_shape_form` of this beam type
+        """
+        form = form or self.mode_shape_form
+        if form not in MODE_SHAPE_FORMS:
+            raise ValueError(
+                "Unsupported mode shape form '%s', expected one of: %s" %
+                (form, ', '.join(MODE_SHAPE_FORMS))
+            )
+        
+        if not order:
+            return self.Y_m(mode) if form == 'standard' else self.Y_m_decaying(mode)
+        
+        return self.Y_m_derivative_from_cache(mode, order, form)
+    
+    _compiled_mode_shapes_cache = None
+    def compiled_mode_shape(self, mode, order=0, module='numpy', decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Returns the `order`-th derivative of `Y_m` compiled into a numeric
+        `f(mu_m, y, a)` function, shared by all modes with the same `Y_m`
+        """
+        if self._compiled_mode_shapes_cache is None:
+            self._compiled_mode_shapes_cache = {}
+        
+        key = (
+            mode if mode in self.dont_improve_mu_m_for_modes else None,
+            order, self.mode_shape_form, module, decimal_precision
+        )
+        if key not in self._compiled_mode_shapes_cache:
+            expr = self.mode_shape(mode, order)
+            self._compiled_mode_shapes_cache[key] = compile_function(
+                expr, ('mu_m', 'y', 'a'), module, decimal_precision
+            )
+        
+        return self._compiled_mode_shapes_cache[key]
+    
+    def chebyshev_series(self, mode, order=0, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Returns the Chebyshev series of the `order`-th derivative of `Y_m` for
+        `a=1`, in terms of `t = 2*y/a - 1`
+        """
+        # Imported here to avoid a circular import
+        from .chebyshev import chebyshev_cache
+        
+        return chebyshev_cache.get(self, mode, order, decimal_precision)
+    
+    def evaluate(self, modes, y_values, order=0, a=1., dtype='float64', decimal_precision=DEFAULT_DECIMAL_PRECISION, method='compiled'):
+        """
+        Evaluates the `order`-th derivative of `Y_m` for all `modes` at all
+        `y_values`, with `mu_m` taken from the best roots cache. Returns a
+        `len(modes) x len(y_values)` array, either a `numpy` array of
+        `float64` or an `mpmath.matrix` of `mpf` evaluated to
+        `decimal_precision`. With `method='chebyshev'` the mode shapes are
+        evaluated from their Chebyshev series.
+        """
+        # Imported here to avoid a circular import
+        from .characteristic_equation_solvers import find_best_root
+        
+        if dtype not in ('float64', 'mpf'):
+            raise ValueError("Unsupported dtype '%s', expected 'float64' or 'mpf'" % dtype)
+        
+        if method not in ('compiled', 'chebyshev'):
+            raise ValueError("Unsupported method '%s', expected 'compiled' or 'chebyshev'" % method)
+        
+        if dtype == 'float64' and numpy is None: #pragma: no cover
+            raise ImportError("NumPy is required to evaluate into 'float64' arrays")
+        
+        modes = list(modes)
+        if method == 'chebyshev':
+            result = mpmath.matrix(len(modes), len(y_values))
+            with mpmath.workdps(decimal_precision):
+                a = mpmath.mpf(a)
+                ts = [2*mpmath.mpf(y_value)/a - 1 for y_value in y_values]
+                for row, mode in enumerate(modes):
+                    series = self.chebyshev_series(mode, order, decimal_precision)
+                    for j, t in enumerate(ts):
+                        result[row, j] = series(t) / a**order
+            
+            return numpy.array(result.tolist(), dtype=float) if dtype == 'float64' else result
+        
+        roots = [find_best_root(self, mode, decimal_precision) for mode in modes]
+        
+        # Modes sharing the same `Y_m` are evaluated together
+        groups = {}
+        for row, mode in enumerate(modes):
+            key = mode if mode in self.dont_improve_mu_m_for_modes else None
+            groups.setdefault(key, []).append(row)
+        
+        if dtype == 'float64':
+            result = numpy.empty((len(modes), len(y_values)))
+            y_values = numpy.asarray(y_values, dtype=float)
+            for rows in groups.values():
+                mode = modes[rows[0]]
+                expr = self.mode_shape(mode, order)
+                mu_m_max = max(roots[row] for row in rows)
+                if estimate_cancellation_digits(expr, {'y': 'a', 'mu_m': mu_m_max}) > MAX_FLOAT64_CANCELLATION_DIGITS:
+                    # Cancellation of the exponentially growing terms would
+                    # wipe out most of the `float64` accuracy
+                    mpf_values = self.evaluate(
+                        [modes[row] for row in rows], y_values.tolist(), order, a, 'mpf', decimal_precision
+                    )
+                    for i, row in enumerate(rows):
+                        result[row] = [float(mpf_values[i, j]) for j in range(len(y_values))]
+                    continue
+                
+                f = self.compiled_mode_shape(mode, order, 'numpy', decimal_precision)
+                mu = numpy.array([float(roots[row]) for row in rows])[:, numpy.newaxis]
+                with numpy.errstate(all='ignore'):
+                    result[rows] = f(mu, y_values[numpy.newaxis, :], float(a)) * \
+                        numpy.ones((len(rows), len(y_values)))
+            
+            return result
+        
+        result = mpmath.matrix(len(modes), len(y_values))
+        for rows in groups.values():
+            mode = modes[rows[0]]
+            expr = self.mode_shape(mode, order)
+            
+            # Extra working precision absorbs the cancellation of the
+            # exponentially growing terms
+            working_precision = decimal_precision + estimate_cancellation_digits(
+                expr, {'y': 'a', 'mu_m': max(roots[row] for row in rows)}
+            )
+            f = self.compiled_mode_shape(mode, order, 'mpmath', working_precision)
+            with mpmath.workdps(working_precision):
+                a_value = mpmath.mpf(a)
+                y_mpf = [mpmath.mpf(y_value) for y_value in y_values]
+                for row in rows:
+                    mu = mpmath.mpf(roots[row])
+                    for j, y_value in enumerate(y_mpf):
+                        value = f(mu, y_value, a_value)
+                        with mpmath.workdps(decimal_precision):
+                            result[row, j] = +value
+        
+        return result
 
 
 class SimplySupportedBeam(BaseBeamType):
@@ -53,6 +246,12 @@ class SimplySupportedBeam(BaseBeamType):
     
     def mu_m_initial_guess(self, mode):
         return mode * pi
+    
+    def mu_m_asymptotic_map(self, mu_m_guess, epsilon): #@UnusedVariable
+        return mpmath.mpf(0) # Initial guess is the exact root
+    
+    def mu_m_asymptotic_lipschitz_bound(self, mu_m_guess, radius): #@UnusedVariable
+        return mpmath.mpf(0)
    
     def Y_m(self, mode): #@UnusedVariable
         return sin(mu_m*y/a)
@@ -62,8 +261,17 @@ class ClampedClampedBeam(BaseBeamType):
     id = 2 #@ReservedAssignment
     characteristic_function = cos(mu_m)*cosh(mu_m) - 1
     
+    mode_shape_form = 'decaying'
+    
     def mu_m_initial_guess(self, mode):
         return (2*mode + 1) * pi/2
+    
+    def mu_m_asymptotic_map(self, mu_m_guess, epsilon):
+        # `cos(mu_m_guess + epsilon) = -sin(mu_m_guess)*sin(epsilon)`
+        return mpmath.asin(-1/(mpmath.sin(mu_m_guess)*mpmath.cosh(mu_m_guess+epsilon)))
+    
+    def mu_m_asymptotic_lipschitz_bound(self, mu_m_guess, radius):
+        return 1/mpmath.cosh(mu_m_guess-radius)
    
     def Y_m(self, mode): #@UnusedVariable
         return 1/(cos(mu_m)-cosh(mu_m)) * (
@@ -72,14 +280,32 @@ class ClampedClampedBeam(BaseBeamType):
             - cos (mu_m*y/a)*sin (mu_m) + cosh(mu_m*y/a)*sin (mu_m)
             + cos (mu_m*y/a)*sinh(mu_m) - cosh(mu_m*y/a)*sinh(mu_m)
         )
+    
+    def Y_m_decaying(self, mode): #@UnusedVariable
+        # `sigma = (sin(mu_m)-sinh(mu_m)) / (cos(mu_m)-cosh(mu_m))`
+        sigma = (2*sin(mu_m)*_exp_mu_m - 1 + _exp_mu_m**2) / (2*cos(mu_m)*_exp_mu_m - 1 - _exp_mu_m**2)
+        return (
+              sin(mu_m*y/a) - sigma*cos(mu_m*y/a)
+            + (sigma+1)/2 * _exp_from_left
+            - (sin(mu_m) - cos(mu_m) + _exp_mu_m) / (1 - 2*cos(mu_m)*_exp_mu_m + _exp_mu_m**2) * _exp_from_right
+        )
 
 
 class ClampedFreeBeam(BaseBeamType):
     id = 3 #@ReservedAssignment
     characteristic_function = cos(mu_m)*cosh(mu_m) + 1
     
+    mode_shape_form = 'decaying'
+    
     def mu_m_initial_guess(self, mode):
         return (2*mode - 1) * pi/2
+    
+    def mu_m_asymptotic_map(self, mu_m_guess, epsilon):
+        # `cos(mu_m_guess + epsilon) = -sin(mu_m_guess)*sin(epsilon)`
+        return mpmath.asin(1/(mpmath.sin(mu_m_guess)*mpmath.cosh(mu_m_guess+epsilon)))
+    
+    def mu_m_asymptotic_lipschitz_bound(self, mu_m_guess, radius):
+        return 1/mpmath.cosh(mu_m_guess-radius)
    
     def Y_m(self, mode): #@UnusedVariable
         return 1/(cos(mu_m)+cosh(mu_m)) * (
@@ -88,17 +314,40 @@ class ClampedFreeBeam(BaseBeamType):
             - cos (mu_m*y/a)*sin (mu_m) + cosh(mu_m*y/a)*sin (mu_m)
             - cos (mu_m*y/a)*sinh(mu_m) + cosh(mu_m*y/a)*sinh(mu_m)
         )
+    
+    def Y_m_decaying(self, mode): #@UnusedVariable
+        # `sigma = (sin(mu_m)+sinh(mu_m)) / (cos(mu_m)+cosh(mu_m))`
+        sigma = (2*sin(mu_m)*_exp_mu_m + 1 - _exp_mu_m**2) / (2*cos(mu_m)*_exp_mu_m + 1 + _exp_mu_m**2)
+        return (
+              sin(mu_m*y/a) - sigma*cos(mu_m*y/a)
+            + (sigma+1)/2 * _exp_from_left
+            + (sin(mu_m) - cos(mu_m) - _exp_mu_m) / (1 + 2*cos(mu_m)*_exp_mu_m + _exp_mu_m**2) * _exp_from_right
+        )
 
 
 class ClampedSimplySupportedBeam(BaseBeamType):
     id = 4 #@ReservedAssignment
     characteristic_function = tan(mu_m) - tanh(mu_m)
     
+    mode_shape_form = 'decaying'
+    
     def mu_m_initial_guess(self, mode):
         return (4*mode + 1) * pi/4
+    
+    def mu_m_asymptotic_map(self, mu_m_guess, epsilon):
+        # `tan(mu_m_guess + epsilon) = (1 + tan(epsilon))/(1 - tan(epsilon))`
+        return -mpmath.atan(mpmath.exp(-2*(mu_m_guess+epsilon)))
+    
+    def mu_m_asymptotic_lipschitz_bound(self, mu_m_guess, radius):
+        return 2*mpmath.exp(-2*(mu_m_guess-radius))
    
     def Y_m(self, mode): #@UnusedVariable
         return 1/sinh(mu_m) * (sin(mu_m*y/a)*sinh(mu_m) - sinh(mu_m*y/a)*sin(mu_m))
+    
+    def Y_m_decaying(self, mode): #@UnusedVariable
+        # `sinh(mu_m*y/a) / sinh(mu_m)`
+        ratio = (_exp_from_right - _exp_mu_m*_exp_from_left) / (1 - _exp_mu_m**2)
+        return sin(mu_m*y/a) - sin(mu_m)*ratio
 
 
 class SimplySupportedFreeBeam(ClampedSimplySupportedBeam):
@@ -119,6 +368,15 @@ class SimplySupportedFreeBeam(ClampedSimplySupportedBeam):
             return y/a
         
         return 1/sinh(mu_m) * (sin(mu_m*y/a)*sinh(mu_m) + sinh(mu_m*y/a)*sin(mu_m))
+    
+    def Y_m_decaying(self, mode):
+        # Special case for this mode
+        if mode == 1:
+            return y/a
+        
+        # `sinh(mu_m*y/a) / sinh(mu_m)`
+        ratio = (_exp_from_right - _exp_mu_m*_exp_from_left) / (1 - _exp_mu_m**2)
+        return sin(mu_m*y/a) + sin(mu_m)*ratio
 
 
 class FreeFreeBeam(ClampedClampedBeam):
@@ -148,3 +406,117 @@ class FreeFreeBeam(ClampedClampedBeam):
             - cos (mu_m*y/a)*sin (mu_m) + cosh(mu_m*y/a)*sin (mu_m)
             - cos (mu_m*y/a)*sinh(mu_m) + cosh(mu_m*y/a)*sinh(mu_m)
         )
+    
+    def Y_m_decaying(self, mode):
+        # Special case for these modes
+        if mode == 1:
+            return Float(1)
+        elif mode == 2:
+            return 1 - 2*y/a
+        
+        # `sigma = (sin(mu_m)+sinh(mu_m)) / (cos(mu_m)+cosh(mu_m))`
+        sigma = (2*sin(mu_m)*_exp_mu_m + 1 - _exp_mu_m**2) / (2*cos(mu_m)*_exp_mu_m + 1 + _exp_mu_m**2)
+        return (
+              sin(mu_m*y/a) - sigma*cos(mu_m*y/a)
+            + (sigma+1)/2 * _exp_from_left
+            + (sin(mu_m) - cos(mu_m) - _exp_mu_m) / (1 + 2*cos(mu_m)*_exp_mu_m + _exp_mu_m**2) * _exp_from_right
+        )
+
+
+class DerivativesCache(object):
+    """
+    Lazily filled store of the mode shape derivatives, keyed by beam type,
+    mode shape form, mode-specific boundary condition and order. New
+    derivatives are persisted to disk in a single batch by `flush`, so new
+    processes load them instead of differentiating again.
+    """
+    disk_cache_dir = os.path.join(PROJECT_SETTINGS_DIR, 'cache', 'derivatives')
+    max_order = 4
+    
+    def __init__(self, disk_cache_dir=None, max_order=None):
+        self.disk_cache_dir = disk_cache_dir or self.disk_cache_dir
+        self.max_order = max_order or self.max_order
+        if not os.path.exists(self.disk_cache_dir):
+            os.makedirs(self.disk_cache_dir)
+        
+        self._derivatives = None
+        self._unsaved = {}
+    
+    @property
+    def disk_cache_filename(self):
+        return os.path.join(self.disk_cache_dir, 'derivatives.pickle')
+    
+    def _read_disk_cache(self):
+        try:
+            with open(self.disk_cache_filename, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return {}
+    
+    def flush(self):
+        """Saves the derivatives differentiated since the last save"""
+        if not self._unsaved:
+            return
+        
+        filename = self.disk_cache_filename
+        with locked(filename):
+            # Keep the derivatives saved by other processes in the meantime
+            derivatives = self._read_disk_cache()
+            derivatives.update(self._unsaved)
+            write_atomically(filename, lambda f: pickle.dump(derivatives, f, protocol=pickle.HIGHEST_PROTOCOL))
+        
+        self._derivatives.update(derivatives)
+        self._unsaved = {}
+    
+    def get(self, beam_type, mode, order, form='standard'):
+        """
+        Returns the `order`-th derivative of `Y_m` in the given `form`,
+        differentiating it on a cache miss
+        """
+        if not 0 <= order <= self.max_order:
+            raise ValueError(
+                "Derivative order %d is out of the supported [0, %d] range" %
+                (order, self.max_order)
+            )
+        
+        Y_m = beam_type.Y_m(mode) if form == 'standard' else beam_type.Y_m_decaying(mode)
+        if not order:
+            return Y_m
+        
+        if self._derivatives is None:
+            self._derivatives = self._read_disk_cache()
+        
+        key = (
+            beam_type.id, form,
+            mode if mode in beam_type.dont_improve_mu_m_for_modes else None,
+            order
+        )
+        
+        # Derivatives of a since changed `Y_m` are stale
+        if key not in self._derivatives or self._derivatives[key][0] != Y_m:
+            derivative = diff(self.get(beam_type, mode, order-1, form), y)
+            self._derivatives[key] = self._unsaved[key] = (Y_m, derivative)
+        
+        return self._derivatives[key][1]
+    
+    def regenerate(self, max_order=None):
+        """Differentiates all mode shapes of all beam types, up to `max_order`"""
+        max_order = max_order or self.max_order
+        self.max_order = max(self.max_order, max_order)
+        for beam_type in BaseBeamType.plugins.instances: #@UndefinedVariable
+            # First mode without a mode-specific boundary condition stands in
+            # for all the others
+            modes = list(beam_type.dont_improve_mu_m_for_modes)
+            modes.append(max(modes or [0]) + 1)
+            
+            for form in MODE_SHAPE_FORMS:
+                for mode in modes:
+                    self.get(beam_type, mode, max_order, form)
+        
+        self.flush()
+
+
+derivatives_cache = DerivativesCache()
+
+# Derivatives differentiated on demand are saved once, on exit
+atexit.register(lambda: derivatives_cache.flush())
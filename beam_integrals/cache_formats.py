@@ -0,0 +1,184 @@
+"""
+Indexed binary format of the best roots cache, which is memory mapped and
+only decodes the roots that are actually requested.
+
+Layout (all integers are little-endian):
+    * header: magic, format version and the number of index entries
+    * index: `(beam_type_id, mode, offset, length)` entries, sorted
+    * data: one record per index entry, with the root and its error encoded
+      exactly as `;` separated values
+"""
+import collections
+import mmap
+import os
+import struct
+from sympy import Float, Integer, nan
+from sympy.mpmath.libmp import MPZ
+from . import exceptions as exc
+
+
+MAGIC = 'BIROOTS\0'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sHI')
+_INDEX_ENTRY = struct.Struct('<HIQI')
+
+
+def encode_value(value):
+    if value is nan:
+        return 'nan'
+
+    if isinstance(value, Float):
+        sign, man, exp, bc = value._mpf_
+        return 'f%d,%x,%d,%d,%d' % (sign, man, exp, bc, value._prec)
+
+    if isinstance(value, Integer):
+        return 'i%d' % value.p
+
+    raise TypeError("Unable to encode '%r'" % value)
+
+def decode_value(data):
+    if data == 'nan':
+        return nan
+
+    if data.startswith('i'):
+        return Integer(int(data[1:]))
+
+    sign, man, exp, bc, prec = data[1:].split(',')
+    return Float._new((int(sign), MPZ(man, 16), int(exp), int(bc)), int(prec))
+
+def write_roots_file(f, results):
+    """
+    Writes the `{beam_type_id: mode_list}` results to the open file `f`,
+    skipping any `None` holes in the mode lists
+    """
+    records = []
+    for beam_type_id in sorted(results):
+        for mode, result in enumerate(results[beam_type_id], 1):
+            if result is not None:
+                records.append((beam_type_id, mode, ';'.join(encode_value(x) for x in result)))
+
+    f.write(_HEADER.pack(MAGIC, VERSION, len(records)))
+
+    offset = _HEADER.size + len(records)*_INDEX_ENTRY.size
+    for beam_type_id, mode, data in records:
+        f.write(_INDEX_ENTRY.pack(beam_type_id, mode, offset, len(data)))
+        offset += len(data)
+
+    for _, _, data in records:
+        f.write(data)
+
+def write_journal_entry(f, beam_type_id, mode, result):
+    """Appends a single root to the journal `f`, syncing it to disk"""
+    f.write('%d %d %s\n' % (beam_type_id, mode, ';'.join(encode_value(x) for x in result)))
+    f.flush()
+    os.fsync(f.fileno())
+
+def read_journal(f):
+    """
+    Reads the `{(beam_type_id, mode): result}` journal entries, ignoring a
+    partially written last entry
+    """
+    entries = {}
+    for line in f:
+        if not line.endswith('\n'):
+            break # Interrupted while writing
+
+        beam_type_id, mode, data = line.split()
+        entries[int(beam_type_id), int(mode)] = tuple(decode_value(x) for x in data.split(';'))
+
+    return entries
+
+
+class _ModeList(collections.Sequence):
+    """Mode list of a single beam type, decoding roots on first access"""
+
+    def __init__(self, roots_file, beam_type_id, length):
+        self._roots_file = roots_file
+        self._beam_type_id = beam_type_id
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._length
+        if not 0 <= idx < self._length:
+            raise IndexError(idx)
+
+        # Mode list is 0 indexed, `None` marks the modes missing from the file
+        return self._roots_file.root(self._beam_type_id, idx+1)
+
+
+class RootsFile(collections.Mapping):
+    """
+    Read-only `{beam_type_id: mode_list}` mapping backed by a memory mapped
+    roots file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # Empty file
+                raise exc.UnsupportedCacheFormatError("'%s' is empty" % filename)
+
+        if len(self._mmap) < _HEADER.size:
+            raise exc.UnsupportedCacheFormatError("'%s' is truncated" % filename)
+
+        magic, version, count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise exc.UnsupportedCacheFormatError("'%s' isn't a roots file" % filename)
+        if version != VERSION:
+            raise exc.UnsupportedCacheFormatError(
+                "'%s' has an unsupported format version %d (expected %d)" %
+                (filename, version, VERSION)
+            )
+
+        self._index = {}
+        lengths = {}
+        for i in range(count):
+            beam_type_id, mode, offset, length = _INDEX_ENTRY.unpack_from(
+                self._mmap, _HEADER.size + i*_INDEX_ENTRY.size
+            )
+            self._index[beam_type_id, mode] = offset, length
+            lengths[beam_type_id] = max(lengths.get(beam_type_id, 0), mode)
+
+        self._mode_lists = dict(
+            (beam_type_id, _ModeList(self, beam_type_id, length))
+            for beam_type_id, length in lengths.items()
+        )
+        self._decoded = {}
+
+    def root(self, beam_type_id, mode):
+        """Returns the `(root, error)` tuple, or `None` if missing"""
+        key = beam_type_id, mode
+        result = self._decoded.get(key)
+        if result is None:
+            if key not in self._index:
+                return None
+
+            offset, length = self._index[key]
+            result = self._decoded[key] = tuple(
+                decode_value(x) for x in self._mmap[offset:offset+length].split(';')
+            )
+
+        return result
+
+    def __getitem__(self, beam_type_id):
+        return self._mode_lists[beam_type_id]
+
+    def __iter__(self):
+        return iter(self._mode_lists)
+
+    def __len__(self):
+        return len(self._mode_lists)
+
+    def to_dict(self):
+        """Decodes all of the roots into a `{beam_type_id: mode_list}` dict"""
+        return dict(
+            (beam_type_id, list(mode_list))
+            for beam_type_id, mode_list in self.items()
+        )
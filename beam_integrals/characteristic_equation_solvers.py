@@ -1,18 +1,71 @@
+import atexit
+from bisect import bisect_left
+import collections
+from functools import partial
+import itertools
+import math
 import multiprocessing
 from operator import itemgetter
 import os
 import cPickle as pickle
+import re
+import tempfile
+import threading
+import time
 from friendly_name_mixin import FriendlyNameFromClassMixin
 from simple_plugins import AttrDict, PluginMount
-from sympy import Abs, Float, nan, mpmath, sign
+from sympy import Abs, Float, nan, mpmath
 from . import PROJECT_SETTINGS_DIR, DEFAULT_MAX_MODE, DEFAULT_DECIMAL_PRECISION
 from . import exceptions as exc
 from .beam_types import BaseBeamType
+from .cache_formats import read_journal, RootsFile, write_journal_entry, write_roots_file
+from .compilers import compile_function, estimate_cancellation_digits
+from .file_utils import locked, write_atomically
+
+try:
+    import numpy
+except ImportError: #pragma: no cover
+    numpy = None
+
+
+# Extra working precision of the characteristic functions of all beam types,
+# absorbing the rounding errors of nearly cancelling terms, e.g. `tan - tanh`
+GUARD_DIGITS = 3
+
+_extra_digits_cache = {}
+def _extra_digits(beam_type, mu_m):
+    # Estimated at the next integer, so nearby `mu_m` share the estimate
+    bound = int(math.ceil(abs(float(mu_m))))
+    cache_key = (beam_type.id, bound)
+    if cache_key not in _extra_digits_cache:
+        _extra_digits_cache[cache_key] = GUARD_DIGITS + estimate_cancellation_digits(
+            beam_type.characteristic_function, {'mu_m': bound}
+        )
+    
+    return _extra_digits_cache[cache_key]
+
+def characteristic_function(beam_type, decimal_precision=DEFAULT_DECIMAL_PRECISION, order=0):
+    """
+    Returns the `order`-th derivative of the beam type's characteristic
+    function, as a numeric function of `mu_m` evaluated to `decimal_precision`
+    """
+    compiled = beam_type.compiled_characteristic_function(order, decimal_precision)
+    
+    def f(mu_m):
+        # Extra working precision also absorbs the cancellation of the
+        # exponentially growing terms
+        with mpmath.workdps(decimal_precision + _extra_digits(beam_type, mu_m)):
+            return compiled(mpmath.mpf(mu_m))
+    
+    return f
 
 
 class BaseRootfinder(FriendlyNameFromClassMixin):
     max_iterations = 100
     
+    # Event which, once set, stops the rootfinder at its next evaluation
+    cancelled = None
+    
     __metaclass__ = PluginMount
     
     class Meta:
@@ -23,14 +76,18 @@ class BaseRootfinder(FriendlyNameFromClassMixin):
     def solver_name(self):
         return self.name.lower().split()[0]
     
-    def _get_f(self, beam_type, decimal_precision):
-        def f(mu_m):
-            return beam_type.characteristic_function.evalf(
-                n=decimal_precision,
-                subs={'mu_m': mu_m}
-            )
+    def _get_f(self, beam_type, decimal_precision, order=0):
+        f = characteristic_function(beam_type, decimal_precision, order)
+        if self.cancelled is None:
+            return f
+        
+        def cancellable_f(mu_m):
+            if self.cancelled.is_set():
+                raise exc.RootfinderCancelledError("%s: cancelled" % self.name)
+            
+            return f(mu_m)
         
-        return f
+        return cancellable_f
     
     def find_root(self, beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
         if mode in beam_type.dont_improve_mu_m_for_modes:
@@ -39,7 +96,8 @@ class BaseRootfinder(FriendlyNameFromClassMixin):
         else:
             mu_m = self.improve_mu_m(beam_type, mode, decimal_precision, **kwargs)
             f = self._get_f(beam_type, decimal_precision)
-            mu_m_error = Abs(f(mu_m))
+            with mpmath.workdps(decimal_precision):
+                mu_m_error = Abs(Float(f(mu_m), decimal_precision))
         
         return mu_m, mu_m_error
     
@@ -93,7 +151,7 @@ class BaseIntervalBasedRootfinder(BaseRootfinder):
                         beam_type, a, b, mode
                 ))
             
-            if sign(f_a) == -sign(f_b):
+            if mpmath.sign(f_a) == -mpmath.sign(f_b):
                 break
             
             search_width *= beam_type.mu_m_increase_search_width_by
@@ -132,22 +190,284 @@ class SecantRootfinder(BaseStartingPointBasedRootfinder):
     pass
 
 
+class NewtonRootfinder(BaseStartingPointBasedRootfinder):
+    def improve_mu_m(self, beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
+        kwargs.setdefault('df', self._get_f(beam_type, decimal_precision, order=1))
+        return super(NewtonRootfinder, self).improve_mu_m(beam_type, mode, decimal_precision, **kwargs)
+
+
+class HalleyRootfinder(BaseStartingPointBasedRootfinder):
+    def improve_mu_m(self, beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs): #@UnusedVariable
+        # Not using `mpmath.findroot`, as its Halley solver mistakes the first
+        # derivative for the second one
+        f, df, d2f = [self._get_f(beam_type, decimal_precision, order) for order in range(3)]
+        
+        # Same guard bits and tolerance as `mpmath.findroot`
+        with mpmath.workprec(mpmath.libmp.dps_to_prec(decimal_precision) + 20): #@UndefinedVariable
+            mu_m = mpmath.mpf(self.x0(beam_type, mode, decimal_precision))
+            tolerance = mpmath.eps * 2**10
+            previous_step = mpmath.inf
+            for _ in range(self.max_iterations):
+                f_mu_m, df_mu_m = f(mu_m), df(mu_m)
+                step = 2*f_mu_m*df_mu_m / (2*df_mu_m**2 - f_mu_m*d2f(mu_m))
+                
+                # Steps which stopped shrinking are down to the rounding noise
+                # of the characteristic function
+                if abs(step) >= abs(previous_step):
+                    break
+                
+                mu_m -= step
+                if abs(step) <= abs(mu_m) * tolerance:
+                    break
+                
+                previous_step = step
+            
+            # If not converted to `sympy.Float` precision will be lost after
+            # the original `mpmath` context is restored
+            return Float(mu_m, decimal_precision)
+
+
+def find_asymptotic_root(beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION, max_terms=10, radius=0.5):
+    """
+    Finds the root as the fixed point of the beam type's asymptotic map,
+    without running any rootfinder. Returns `None` unless the rigorous error
+    bound of the contraction mapping theorem, after at most `max_terms`
+    terms, beats the `decimal_precision`.
+    """
+    if mode in beam_type.dont_improve_mu_m_for_modes:
+        return None
+    
+    # Guard digits absorb the rounding errors
+    working_precision = decimal_precision + 10
+    with mpmath.workdps(working_precision):
+        mu_m_guess = mpmath.mpf(beam_type.mu_m_initial_guess(mode).evalf(n=working_precision))
+        radius = mpmath.mpf(radius)
+        try:
+            g = lambda epsilon: beam_type.mu_m_asymptotic_map(mu_m_guess, epsilon)
+            L = beam_type.mu_m_asymptotic_lipschitz_bound(mu_m_guess, radius)
+        except NotImplementedError:
+            return None
+        
+        # `g` has to map `|epsilon| <= radius` into itself
+        previous, epsilon = mpmath.mpf(0), g(0)
+        if L >= 1 or abs(epsilon) > (1-L)*radius:
+            return None
+        
+        tolerance = abs(mu_m_guess) * mpmath.mpf(10)**-decimal_precision
+        for _ in range(max_terms):
+            error = L/(1-L) * abs(epsilon-previous) + mpmath.eps
+            if error < tolerance:
+                mu_m = Float(mu_m_guess+epsilon, decimal_precision)
+                f = characteristic_function(beam_type, decimal_precision)
+                return mu_m, Abs(Float(f(mu_m), decimal_precision))
+            
+            previous, epsilon = epsilon, g(epsilon)
+    
+    return None
+
 def find_root_candidates(beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
     return dict(
         (name, rootfinder(beam_type, mode, decimal_precision, **kwargs))
         for name, rootfinder in BaseRootfinder.plugins.id_to_instance.items()
     )
 
+# Number of races won, as `{beam_type_id: {solver_name: wins}}`
+rootfinder_wins = {}
+
+def record_rootfinder_win(beam_type_id, solver_name, wins=1):
+    beam_type_wins = rootfinder_wins.setdefault(beam_type_id, {})
+    beam_type_wins[solver_name] = beam_type_wins.get(solver_name, 0) + wins
+
+def preferred_rootfinders(beam_type):
+    """Solver names, ordered by the number of races won for `beam_type`"""
+    beam_type_wins = rootfinder_wins.get(beam_type.id, {})
+    return sorted(
+        BaseRootfinder.plugins.valid_ids, #@UndefinedVariable
+        key=lambda name: (-beam_type_wins.get(name, 0), name)
+    )
+
+def _meets_tolerance(beam_type, result, decimal_precision, tolerance=None):
+    mu_m, mu_m_error = result
+    if tolerance is None:
+        # Residual caused by rounding the exact root to `decimal_precision`
+        df = characteristic_function(beam_type, decimal_precision, order=1)
+        with mpmath.workdps(decimal_precision):
+            tolerance = abs(mu_m * df(mu_m)) * mpmath.mpf(10)**-(decimal_precision-1)
+    
+    return mu_m_error <= tolerance
+
+_race_cancelled = None
+
+def _init_race_pool(cancelled): #pragma: no cover
+    global _race_cancelled
+    _race_cancelled = cancelled
+
+def _race_worker(args): #pragma: no cover
+    name, beam_type_id, mode, decimal_precision, kwargs = args
+    rootfinder = BaseRootfinder.plugins.id_to_instance[name] #@UndefinedVariable
+    beam_type = BaseBeamType.plugins.id_to_instance[beam_type_id] #@UndefinedVariable
+    
+    rootfinder.cancelled = _race_cancelled
+    try:
+        return name, rootfinder(beam_type, mode, decimal_precision, **kwargs)
+    except exc.RootfinderCancelledError:
+        return name, None # Race already won
+
+_race_pool = None
+_race_pool_lock = threading.Lock()
+
+def _get_race_pool():
+    """
+    Returns the `(pool, cancelled)` shared by all concurrent races, started on
+    first use, as starting the processes costs more than racing cheap roots
+    """
+    global _race_pool
+    
+    # Forked children can't use their parent's pool
+    if _race_pool is None or _race_pool[2] != os.getpid():
+        cancelled = multiprocessing.Event()
+        pool = multiprocessing.Pool(
+            len(BaseRootfinder.plugins.valid_ids), #@UndefinedVariable
+            initializer=_init_race_pool, initargs=(cancelled,)
+        )
+        _race_pool = pool, cancelled, os.getpid()
+    
+    return _race_pool[:2]
+
+@atexit.register
+def _close_race_pool():
+    if _race_pool is not None and _race_pool[2] == os.getpid():
+        pool, _, _ = _race_pool
+        pool.close()
+        pool.join()
+
+def _pick_race_winner(candidates, beam_type, mode, decimal_precision, tolerance):
+    best = None
+    for name, result in candidates:
+        # Special case for these modes, all rootfinders return the same root
+        if mode in beam_type.dont_improve_mu_m_for_modes:
+            return name, result
+        
+        if _meets_tolerance(beam_type, result, decimal_precision, tolerance):
+            return name, result
+        
+        if best is None or result[1] < best[1][1]:
+            best = name, result
+    
+    return best
+
+def race_root_candidates(beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION,
+    tolerance=None, concurrent=False, **kwargs):
+    """
+    Runs the rootfinders in the beam type's preferred order, or all at once
+    if `concurrent`, until one's residual meets the `tolerance` (defaults to
+    the precision floor). Returns the `(solver_name, (mu_m, mu_m_error))` of
+    the winner, or of the best candidate if none meets the `tolerance`.
+    """
+    tasks = [
+        (name, beam_type.id, mode, decimal_precision, kwargs)
+        for name in preferred_rootfinders(beam_type)
+    ]
+    
+    if not concurrent:
+        return _pick_race_winner(itertools.imap(_race_worker, tasks), beam_type, mode, decimal_precision, tolerance)
+    
+    with _race_pool_lock:
+        pool, cancelled = _get_race_pool()
+        candidates = pool.imap_unordered(_race_worker, tasks)
+        try:
+            return _pick_race_winner(candidates, beam_type, mode, decimal_precision, tolerance)
+        finally:
+            # Terminating busy workers may leave the pool's queues locked, so
+            # the rootfinders still running are cancelled and waited for,
+            # leaving the pool idle for the next race
+            cancelled.set()
+            while True:
+                try:
+                    next(candidates)
+                except StopIteration:
+                    break
+                except Exception:
+                    pass # Already lost the race
+            
+            cancelled.clear()
+
+def refine_root(beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION,
+    mu_m=None, start_decimal_precision=15, **kwargs):
+    """
+    Finds the root at a low `start_decimal_precision`, unless `mu_m` is
+    already that accurate, and refines it with Newton steps while doubling
+    the working precision until it reaches `decimal_precision`
+    """
+    if mode in beam_type.dont_improve_mu_m_for_modes:
+        mu_m = beam_type.mu_m_initial_guess(mode).evalf(n=decimal_precision)
+        return mu_m, nan # characteristic equation is not defined for this `mode`
+    
+    if mu_m is None:
+        mu_m = min(
+            find_root_candidates(beam_type, mode, start_decimal_precision, **kwargs).values(),
+            key=itemgetter(1)
+        )[0]
+    
+    precision = start_decimal_precision
+    while True:
+        # Last step is repeated at the full precision, in case the root wasn't
+        # as accurate as assumed
+        last_step = precision == decimal_precision
+        precision = min(2*precision, decimal_precision)
+        
+        f = characteristic_function(beam_type, precision)
+        df = characteristic_function(beam_type, precision, order=1)
+        with mpmath.workdps(precision):
+            mu_m = mpmath.mpf(mu_m)
+            mu_m -= f(mu_m)/df(mu_m)
+        
+        if last_step:
+            break
+    
+    f = characteristic_function(beam_type, decimal_precision)
+    with mpmath.workdps(decimal_precision):
+        # If not converted to `sympy.Float` precision will be lost after the
+        # original `mpmath` context is restored
+        return Float(mu_m, decimal_precision), Abs(Float(f(mu_m), decimal_precision))
+
 def find_best_root(beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION,
-    include_error=False, use_cache=True, cache_instance=None, **kwargs):
+    include_error=False, use_cache=True, cache_instance=None, precision_ladder=False,
+    start_decimal_precision=None, race=False, race_tolerance=None,
+    race_concurrently=False, **kwargs):
+    """
+    Finds the best root, or gets it from the cache if `use_cache` is set.
+    With `precision_ladder` set the root is found at a low precision, or
+    taken from the `start_decimal_precision` cache, and then refined. With
+    `race` set the first rootfinder meeting the `race_tolerance` wins.
+    """
     if use_cache:
         cache_instance = cache_instance or best_roots_cache
         result = cache_instance.get(beam_type, mode, decimal_precision)
     else:
-        result = min(
-            find_root_candidates(beam_type, mode, decimal_precision, **kwargs).values(),
-            key=itemgetter(1)
-        )
+        result = find_asymptotic_root(beam_type, mode, decimal_precision)
+        if result is None and precision_ladder:
+            if start_decimal_precision is None:
+                result = refine_root(beam_type, mode, decimal_precision, **kwargs)
+            else:
+                cache_instance = cache_instance or best_roots_cache
+                result = refine_root(
+                    beam_type, mode, decimal_precision,
+                    mu_m=cache_instance.get(beam_type, mode, start_decimal_precision)[0],
+                    start_decimal_precision=start_decimal_precision,
+                    **kwargs
+                )
+        elif result is None and race:
+            solver_name, result = race_root_candidates(
+                beam_type, mode, decimal_precision, race_tolerance,
+                race_concurrently, **kwargs
+            )
+            record_rootfinder_win(beam_type.id, solver_name)
+        elif result is None:
+            result = min(
+                find_root_candidates(beam_type, mode, decimal_precision, **kwargs).values(),
+                key=itemgetter(1)
+            )
     
     return result if include_error else result[0]
 
@@ -159,57 +479,732 @@ def _init_pool(*data): #pragma: no cover
 
 def _worker(mode): #pragma: no cover
     c = _pool_data
-    return find_best_root(
+    
+    # Races won in this worker are sent back, to be recorded in the parent
+    wins_before = dict(rootfinder_wins.get(c.beam_type.id, {}))
+    result = find_best_root(
         c.beam_type, mode, c.decimal_precision, include_error=c.include_error,
         use_cache=False, **c.kwargs
     )
+    wins = dict(
+        (name, count - wins_before.get(name, 0))
+        for name, count in rootfinder_wins.get(c.beam_type.id, {}).items()
+    )
+    
+    return result, wins
 
 def find_best_roots(beam_type, max_mode=DEFAULT_MAX_MODE,
-    decimal_precision=DEFAULT_DECIMAL_PRECISION, include_error=True, **kwargs):
+    decimal_precision=DEFAULT_DECIMAL_PRECISION, include_error=True, min_mode=1, **kwargs):
     pool = multiprocessing.Pool(
         initializer=_init_pool,
         initargs=(beam_type, decimal_precision, include_error, kwargs)
     )
-    results = pool.map(func=_worker, iterable=range(1, max_mode+1))
+    results = pool.map(func=_worker, iterable=range(min_mode, max_mode+1))
+    
+    pool.close()
+    pool.join()
+    
+    for _, wins in results:
+        for solver_name, count in wins.items():
+            if count:
+                record_rootfinder_win(beam_type.id, solver_name, count)
+    
+    return [result for result, _ in results]
+
+def _sweep_values(beam_type, grid, decimal_precision):
+    # Vectorised float evaluation, when the exponential terms don't overflow
+    if numpy is not None:
+        f = compile_function(beam_type.characteristic_function, ('mu_m',), 'numpy')
+        with numpy.errstate(all='ignore'):
+            values = f(numpy.array(grid, dtype=float)) * numpy.ones(len(grid))
+        
+        if numpy.all(numpy.isfinite(values)):
+            return [float(value) for value in values]
+    
+    f = characteristic_function(beam_type, decimal_precision)
+    return [f(mu_m) for mu_m in grid]
+
+def sweep_brackets(beam_type, max_mode=DEFAULT_MAX_MODE, decimal_precision=15):
+    """
+    Sweeps `mu_m` up to the `max_mode` root once, looking for sign changes
+    of the characteristic function, and narrows them down by bisection at
+    the low `decimal_precision`. Sign changes caused by poles are skipped.
+    Returns a `{mode: (a, b)}` dict of brackets, one for each mode whose root
+    is defined, or raises if any mode has a missing or multiple roots.
+    """
+    modes = [
+        mode for mode in range(1, max_mode+1)
+        if mode not in beam_type.dont_improve_mu_m_for_modes
+    ]
+    if not modes:
+        return {}
+    
+    guesses = [float(beam_type.mu_m_initial_guess(mode).evalf()) for mode in modes]
+    step = float(beam_type.mu_m_initial_search_width)
+    
+    # Roots and poles tend to rational multiples of `pi`, so grid points are
+    # offset by an irrational fraction of the step to stay clear of them
+    offset = step * (math.sqrt(2) - 1)
+    grid = [offset + i*step for i in range(int((guesses[-1]+step)/step) + 1)]
+    values = _sweep_values(beam_type, grid, decimal_precision)
+    
+    f = characteristic_function(beam_type, decimal_precision)
+    brackets = {}
+    for i in range(len(grid)-1):
+        if mpmath.sign(values[i]) != -mpmath.sign(values[i+1]):
+            continue
+        
+        with mpmath.workdps(decimal_precision):
+            a, b = mpmath.mpf(grid[i]), mpmath.mpf(grid[i+1])
+            f_a = f(a)
+            scale = abs(f_a) + abs(f(b))
+            while b - a > b * mpmath.mpf(10)**(2-decimal_precision):
+                mid = (a + b)/2
+                f_mid = f(mid)
+                if mpmath.sign(f_mid) == mpmath.sign(f_a):
+                    a, f_a = mid, f_mid
+                else:
+                    b = mid
+            
+            # Characteristic function blows up near poles, instead of vanishing
+            if abs(f(a)) + abs(f(b)) > scale:
+                continue
+        
+        # Assign the root to the mode with the closest initial guess
+        idx = bisect_left(guesses, float(a))
+        if idx == len(guesses) or (idx > 0 and float(a) - guesses[idx-1] < guesses[idx] - float(a)):
+            idx -= 1
+        
+        mode = modes[idx]
+        if mode in brackets:
+            raise exc.MultipleRootsError(
+                "%s: Found multiple roots in area [%s, %s] for mode = %d" % (
+                    beam_type, brackets[mode][0], b, mode
+            ))
+        
+        brackets[mode] = a, b
+    
+    missing_modes = sorted(set(modes) - set(brackets))
+    if missing_modes:
+        raise exc.MissingRootError(
+            "%s: No root found for mode = %d" % (beam_type, missing_modes[0])
+        )
+    
+    return brackets
+
+def _refine_worker(args): #pragma: no cover
+    beam_type_id, mode, decimal_precision, mu_m, start_decimal_precision = args
+    beam_type = BaseBeamType.plugins.id_to_instance[beam_type_id] #@UndefinedVariable
+    return refine_root(beam_type, mode, decimal_precision, mu_m, start_decimal_precision)
+
+def enumerate_roots(beam_type, max_mode=DEFAULT_MAX_MODE,
+    decimal_precision=DEFAULT_DECIMAL_PRECISION, include_error=True,
+    sweep_decimal_precision=15, processes=None, min_mode=1):
+    """
+    Finds the roots of modes `min_mode` to `max_mode` from a single sweep,
+    and refines them in parallel with the precision ladder
+    """
+    brackets = sweep_brackets(beam_type, max_mode, sweep_decimal_precision)
+    
+    # Only accurate to about the bisection tolerance
+    start_decimal_precision = sweep_decimal_precision - 3
+    
+    tasks = []
+    for mode in range(min_mode, max_mode+1):
+        mu_m = None
+        if mode in brackets:
+            a, b = brackets[mode]
+            mu_m = Float((a+b)/2, sweep_decimal_precision)
+        
+        tasks.append((beam_type.id, mode, decimal_precision, mu_m, start_decimal_precision))
+    
+    pool = multiprocessing.Pool(processes)
+    results = pool.map(_refine_worker, tasks)
     
     pool.close()
     pool.join()
+    return results if include_error else [mu_m for mu_m, _ in results]
+
+def _init_scheduler_pool(*data): #pragma: no cover
+    global _scheduler_pool_data
+    
+    data_keys = 'decimal_precision, refine_from, kwargs'.split(', ')
+    _scheduler_pool_data = AttrDict(zip(data_keys, data))
+
+def _scheduled_worker(task): #pragma: no cover
+    c = _scheduler_pool_data
+    beam_type_id, mode, mu_m = task
+    beam_type = BaseBeamType.plugins.id_to_instance[beam_type_id] #@UndefinedVariable
+    
+    if c.refine_from is not None:
+        return task, refine_root(beam_type, mode, c.decimal_precision, mu_m, c.refine_from), {}
+    
+    # Races won in this worker are sent back, to be recorded in the parent
+    wins_before = dict(rootfinder_wins.get(beam_type_id, {}))
+    result = find_best_root(
+        beam_type, mode, c.decimal_precision, include_error=True, use_cache=False, **c.kwargs
+    )
+    wins = dict(
+        (name, count - wins_before.get(name, 0))
+        for name, count in rootfinder_wins.get(beam_type_id, {}).items()
+    )
+    
+    return task, result, wins
+
+def _root_cost(task):
+    beam_type_id, mode, mu_m = task
+    beam_type = BaseBeamType.plugins.id_to_instance[beam_type_id] #@UndefinedVariable
+    if mode in beam_type.dont_improve_mu_m_for_modes:
+        return 0
+    
+    # Roots already bracketed only need refining, while the asymptotic fast
+    # path doesn't converge for lower modes, which need the full rootfinders
+    return 1 if mu_m is not None else 1 + 1./mode
+
+def schedule_roots(tasks, decimal_precision=DEFAULT_DECIMAL_PRECISION, processes=None,
+    progress=None, refine_from=None, callback=None, **kwargs):
+    """
+    Finds the roots of `(beam_type_id, mode, mu_m)` tasks, from all beam
+    types together, on a single pool of `processes` workers. Most expensive
+    tasks are sent out first, one at a time, so idle workers pick up the
+    remaining ones. With `refine_from` set the `mu_m` roots, accurate to
+    that decimal precision, are refined with the precision ladder, otherwise
+    `mu_m` is ignored and `kwargs` are passed on to `find_best_root`.
+    
+    Calls `callback(beam_type_id, mode, result)` as soon as each root is
+    found, and `progress(done, total, eta)` after it, with the ETA in
+    seconds. Returns a `{(beam_type_id, mode): (mu_m, mu_m_error)}` dict.
+    """
+    tasks = sorted(tasks, key=_root_cost, reverse=True)
+    results = {}
+    if not tasks:
+        return results
+    
+    pool = multiprocessing.Pool(
+        processes=processes,
+        initializer=_init_scheduler_pool,
+        initargs=(decimal_precision, refine_from, kwargs)
+    )
+    try:
+        started = time.time()
+        for task, result, wins in pool.imap_unordered(_scheduled_worker, tasks):
+            beam_type_id, mode, _ = task
+            results[beam_type_id, mode] = result
+            for solver_name, count in wins.items():
+                if count:
+                    record_rootfinder_win(beam_type_id, solver_name, count)
+            
+            if callback is not None:
+                callback(beam_type_id, mode, result)
+            
+            if progress is not None:
+                done = len(results)
+                elapsed = time.time() - started
+                progress(done, len(tasks), elapsed/done * (len(tasks) - done))
+        
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    
     return results
 
+def _file_signature(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    
+    return st.st_ino, st.st_size, st.st_mtime
+
+def _missing_modes(mode_list, max_mode):
+    # Roots computed on demand may leave holes in the mode list
+    return [
+        mode for mode in range(1, max_mode+1)
+        if mode > len(mode_list) or mode_list[mode-1] is None
+    ]
+
+
+class _LRUDict(object):
+    """
+    Thread safe dict holding at most `max_size` items, evicting the least
+    recently used
+    """
+    
+    def __init__(self, max_size):
+        self.max_size = max_size
+        
+        # Maps keys to `(last_used, value)`, as `collections.OrderedDict` isn't
+        # available on Python 2.6
+        self._items = {}
+        self._clock = itertools.count()
+        self._lock = threading.RLock()
+    
+    def __contains__(self, key):
+        return key in self._items
+    
+    def __getitem__(self, key):
+        with self._lock:
+            _, value = self._items[key]
+            self._items[key] = (next(self._clock), value)
+            return value
+    
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items[key] = (next(self._clock), value)
+            while len(self._items) > self.max_size:
+                least_recently_used = min(self._items, key=lambda item: self._items[item][0])
+                del self._items[least_recently_used]
+    
+    def __delitem__(self, key):
+        with self._lock:
+            del self._items[key]
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def keys(self):
+        with self._lock:
+            return self._items.keys()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            
+            return self[key]
+    
+    def pop(self, key, *default):
+        with self._lock:
+            if key not in self._items and default:
+                return default[0]
+            
+            return self._items.pop(key)[1]
+
+
+class _RoundedModeList(collections.Sequence):
+    def __init__(self, roots, beam_type_id):
+        self._roots = roots
+        self._beam_type_id = beam_type_id
+    
+    def __len__(self):
+        return len(self._roots.source[self._beam_type_id])
+    
+    def __getitem__(self, idx):
+        length = len(self)
+        if idx < 0:
+            idx += length
+        if not 0 <= idx < length:
+            raise IndexError(idx)
+        
+        return self._roots.root(self._beam_type_id, idx+1)
+
+
+class _RoundedRoots(collections.Mapping):
+    """
+    `{beam_type_id: mode_list}` mapping of the `source` roots, found at a
+    higher precision, rounded to `decimal_precision` on first access
+    """
+    
+    def __init__(self, source, decimal_precision):
+        self.source = source
+        self.decimal_precision = decimal_precision
+        self._rounded = {}
+    
+    def root(self, beam_type_id, mode):
+        """Returns the `(root, error)` tuple, or `None` if missing"""
+        key = beam_type_id, mode
+        if key not in self._rounded:
+            result = self.source.root(beam_type_id, mode)
+            if result is None:
+                return None
+            
+            if isinstance(result[0], Float):
+                beam_type = BaseBeamType.plugins.id_to_instance[beam_type_id] #@UndefinedVariable
+                f = characteristic_function(beam_type, self.decimal_precision)
+                with mpmath.workdps(self.decimal_precision):
+                    mu_m = mpmath.mpf(result[0])
+                    mu_m_error = result[1] if result[1] is nan else Abs(Float(f(mu_m), self.decimal_precision))
+                    result = Float(mu_m, self.decimal_precision), mu_m_error
+            
+            self._rounded[key] = result
+        
+        return self._rounded[key]
+    
+    def __getitem__(self, beam_type_id):
+        if beam_type_id not in self.source:
+            raise KeyError(beam_type_id)
+        
+        return _RoundedModeList(self, beam_type_id)
+    
+    def __iter__(self):
+        return iter(self.source)
+    
+    def __len__(self):
+        return len(self.source)
+
+
+class SharedRoots(object):
+    """
+    Handle of the roots published by a parent process, which its workers
+    attach to. Workers share the memory mapped roots file instead of each
+    loading their own copy.
+    """
+    
+    def __init__(self, filename, decimal_precision, temporary=False):
+        self.filename = filename
+        self.decimal_precision = decimal_precision
+        self.temporary = temporary
+    
+    def attach(self, cache_instance=None):
+        if self.filename is not None:
+            cache_instance = cache_instance or best_roots_cache
+            cache_instance._ram_cache[self.decimal_precision] = RootsFile(self.filename)
+    
+    def close(self):
+        if self.temporary and os.path.exists(self.filename):
+            os.remove(self.filename)
+
 
 class BestRootsCache(object):
     disk_cache_dir = os.path.join(PROJECT_SETTINGS_DIR, 'cache', 'characteristic-equations')
-    _ram_cache = {}
     
-    def __init__(self, disk_cache_dir=None):
+    # Only the most recently used precisions are kept in RAM
+    _ram_cache = _LRUDict(max_size=4)
+    _load_lock = threading.Lock()
+    
+    def __init__(self, disk_cache_dir=None, compute_on_miss=False):
         self.disk_cache_dir = disk_cache_dir or self.disk_cache_dir
+        self.compute_on_miss = compute_on_miss
         if not os.path.exists(self.disk_cache_dir):
             os.makedirs(self.disk_cache_dir)
     
     def disk_cache_filename(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        return os.path.join(
+            self.disk_cache_dir,
+            "best-roots.decimal-precision=%d.roots" % decimal_precision
+        )
+    
+    def legacy_disk_cache_filename(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
         return os.path.join(
             self.disk_cache_dir,
             "best-roots.decimal-precision=%d.pickle" % decimal_precision
         )
     
-    def regenerate(self, max_mode=DEFAULT_MAX_MODE, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
-        results = dict(
-            (beam_type.id, find_best_roots(beam_type, max_mode, decimal_precision, **kwargs))
+    def convert_legacy_disk_cache(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """Converts the old pickled cache into the indexed roots file format"""
+        filename = self.legacy_disk_cache_filename(decimal_precision)
+        try:
+            with open(filename, 'rb') as f:
+                results = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError), e:
+            raise exc.UnableToLoadBestRootsCacheError(
+                "Unable to load cache from '%s': %s" % (filename, e)
+            )
+        
+        self._save_disk_cache(results, decimal_precision)
+    
+    def _cached_decimal_precisions(self, extension):
+        pattern = re.compile(r'^best-roots\.decimal-precision=(\d+)\.%s$' % extension)
+        return sorted(
+            int(match.group(1))
+            for match in (pattern.match(f) for f in os.listdir(self.disk_cache_dir))
+            if match
+        )
+    
+    def cached_decimal_precisions(self):
+        return self._cached_decimal_precisions('roots')
+    
+    def convert_legacy_disk_caches(self):
+        """Converts all of the old pickled caches found in the cache dir"""
+        decimal_precisions = self._cached_decimal_precisions('pickle')
+        for decimal_precision in decimal_precisions:
+            self.convert_legacy_disk_cache(decimal_precision)
+        
+        return decimal_precisions
+    
+    def journal_filename(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        return self.disk_cache_filename(decimal_precision) + '.journal'
+    
+    def rootfinder_wins_filename(self):
+        return os.path.join(self.disk_cache_dir, "rootfinder-wins.pickle")
+    
+    def _load_rootfinder_wins(self):
+        try:
+            with open(self.rootfinder_wins_filename(), 'rb') as f:
+                wins = pickle.load(f)
+        except (IOError, pickle.UnpicklingError):
+            return # Nothing learned from past runs
+        
+        # Saved wins already include the ones recorded before saving
+        for beam_type_id, beam_type_wins in wins.items():
+            known_wins = rootfinder_wins.setdefault(beam_type_id, {})
+            for solver_name, count in beam_type_wins.items():
+                known_wins[solver_name] = max(known_wins.get(solver_name, 0), count)
+    
+    def regenerate(self, max_mode=DEFAULT_MAX_MODE, decimal_precision=DEFAULT_DECIMAL_PRECISION,
+        resume=False, **kwargs):
+        """
+        Regenerates the cache for all beam types, racing the rootfinders in
+        the order learned from past runs unless `race=False` is passed. Pass
+        `precision_ladder=True` to refine low precision roots instead,
+        optionally taken from the existing `start_decimal_precision` cache,
+        or `sweep=True` to find the roots of all modes from a single sweep.
+        
+        Concurrent regenerations are serialized by a file lock, and skipped
+        if another one already regenerated the cache in the meantime.
+        
+        Roots are checkpointed to a journal as they're found, which is
+        compacted into the cache once done. With `resume` set the roots
+        already in the journal of an interrupted regeneration are reused.
+        """
+        filename = self.disk_cache_filename(decimal_precision)
+        signature = _file_signature(filename)
+        with locked(filename):
+            if _file_signature(filename) != signature and self._covers(max_mode, decimal_precision):
+                return
+            
+            journal_filename = self.journal_filename(decimal_precision)
+            journal = {}
+            if resume and os.path.exists(journal_filename):
+                with open(journal_filename, 'rb') as f:
+                    journal = read_journal(f)
+            
+            with open(journal_filename, 'wb') as f:
+                # Rewritten, to drop any partially written last entry
+                for (beam_type_id, mode), result in sorted(journal.items()):
+                    write_journal_entry(f, beam_type_id, mode, result)
+                
+                min_modes = dict(
+                    (beam_type, 1)
+                    for beam_type in BaseBeamType.plugins.instances #@UndefinedVariable
+                )
+                results = self._find_roots(
+                    min_modes, max_mode, decimal_precision, skip=journal,
+                    callback=partial(write_journal_entry, f), **kwargs
+                )
+            
+            self._save_disk_cache(results, decimal_precision)
+            os.remove(journal_filename)
+    
+    def extend(self, max_mode=DEFAULT_MAX_MODE, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
+        """
+        Extends the cache up to `max_mode`, only finding the roots of modes
+        and beam types missing from it. Accepts the same options as
+        `regenerate`.
+        """
+        with locked(self.disk_cache_filename(decimal_precision)):
+            cached = self._read_disk_cache(decimal_precision) or {}
+            min_modes = {}
+            for beam_type in BaseBeamType.plugins.instances: #@UndefinedVariable
+                missing_modes = _missing_modes(cached.get(beam_type.id, ()), max_mode)
+                if missing_modes:
+                    min_modes[beam_type] = missing_modes[0]
+            
+            if not min_modes:
+                return # Nothing's missing
+            
+            results = self._find_roots(min_modes, max_mode, decimal_precision, **kwargs)
+            self._write_back(
+                dict(
+                    (beam_type.id, dict(enumerate(results[beam_type.id], min_mode)))
+                    for beam_type, min_mode in min_modes.items()
+                ),
+                decimal_precision
+            )
+    
+    def _covers(self, max_mode, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        cached = self._read_disk_cache(decimal_precision) or {}
+        return not any(
+            _missing_modes(cached.get(beam_type.id, ()), max_mode)
             for beam_type in BaseBeamType.plugins.instances #@UndefinedVariable
         )
+    
+    def prefetch(self, max_mode=DEFAULT_MAX_MODE, decimal_precision=DEFAULT_DECIMAL_PRECISION,
+        beam_types=None, processes=None):
+        """
+        Finds the roots missing from the cache up to `max_mode` ahead of
+        need, in a background pool, and writes them back to the cache.
+        Returns the background thread, which can be joined.
+        """
+        cached = self._read_disk_cache(decimal_precision) or {}
+        beam_types = beam_types or BaseBeamType.plugins.instances #@UndefinedVariable
+        tasks = [
+            (beam_type.id, mode, None)
+            for beam_type in beam_types
+            for mode in _missing_modes(cached.get(beam_type.id, ()), max_mode)
+        ]
+        
+        def run():
+            results = schedule_roots(tasks, decimal_precision, processes, race=True)
+            
+            updates = {}
+            for (beam_type_id, mode), result in results.items():
+                updates.setdefault(beam_type_id, {})[mode] = result
+            if updates:
+                self._write_back(updates, decimal_precision)
+        
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        
+        return thread
+    
+    def _find_roots(self, min_modes, max_mode, decimal_precision, processes=None,
+        progress=None, callback=None, skip=(), **kwargs):
+        """
+        Finds the roots of modes `min_mode` to `max_mode` for each of the
+        `{beam_type: min_mode}`, except for the `(beam_type_id, mode)` roots
+        to `skip`. Returns the `{beam_type_id: mode_list}` dict.
+        """
+        # Modes of all beam types are scheduled together, on a single pool
+        if kwargs.pop('sweep', False):
+            sweep_decimal_precision = kwargs.pop('sweep_decimal_precision', 15)
+            tasks = []
+            for beam_type, min_mode in min_modes.items():
+                brackets = sweep_brackets(beam_type, max_mode, sweep_decimal_precision)
+                for mode in range(min_mode, max_mode+1):
+                    mu_m = None
+                    if mode in brackets:
+                        a, b = brackets[mode]
+                        mu_m = Float((a+b)/2, sweep_decimal_precision)
+                    tasks.append((beam_type.id, mode, mu_m))
+            
+            # Swept roots are only refined, so the rootfinder options don't apply
+            unsupported = sorted(
+                name for name, value in kwargs.items()
+                if value is not None and value is not False
+            )
+            if unsupported:
+                raise ValueError(
+                    "Options %s can't be used with 'sweep'" % ', '.join(map(repr, unsupported))
+                )
+            
+            # Only accurate to about the bisection tolerance
+            kwargs = dict(kwargs, refine_from=sweep_decimal_precision-3, race=False)
+        else:
+            tasks = [
+                (beam_type.id, mode, None)
+                for beam_type, min_mode in min_modes.items()
+                for mode in range(min_mode, max_mode+1)
+            ]
+            
+            kwargs.setdefault('race', True)
+            if kwargs['race']:
+                self._load_rootfinder_wins()
+            
+            if kwargs.get('start_decimal_precision') is not None:
+                # Load the starting roots before forking, so workers don't have to
+                kwargs.setdefault('cache_instance', self)
+                if kwargs['start_decimal_precision'] not in self._ram_cache:
+                    self._load_disk_cache(kwargs['start_decimal_precision'])
+        
+        tasks = [task for task in tasks if task[:2] not in skip]
+        roots = schedule_roots(
+            tasks, decimal_precision, processes, progress, callback=callback, **kwargs
+        )
+        results = dict(
+            (beam_type.id, [
+                roots[beam_type.id, mode] if (beam_type.id, mode) in roots else skip[beam_type.id, mode]
+                for mode in range(min_mode, max_mode+1)
+            ])
+            for beam_type, min_mode in min_modes.items()
+        )
+        
+        if kwargs['race']:
+            write_atomically(
+                self.rootfinder_wins_filename(),
+                lambda f: pickle.dump(rootfinder_wins, f, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+        
+        return results
+    
+    def _write_back(self, updates, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Merges the `{beam_type_id: {mode: result}}` updates into the cache
+        file, locked against concurrent writers
+        """
+        with locked(self.disk_cache_filename(decimal_precision)):
+            results = self._read_disk_cache(decimal_precision)
+            if results is None:
+                # Seeded from the higher precision cache the new file replaces,
+                # so the roots it's holding aren't lost
+                rounded_roots = self._rounded_down_cache(decimal_precision)
+                results = dict(
+                    (beam_type_id, list(mode_list))
+                    for beam_type_id, mode_list in (rounded_roots or {}).items()
+                )
+            
+            for beam_type_id, mode_results in updates.items():
+                mode_list = list(results.get(beam_type_id, ()))
+                mode_list.extend([None] * (max(mode_results) - len(mode_list)))
+                for mode, result in mode_results.items():
+                    mode_list[mode-1] = result
+                
+                results[beam_type_id] = mode_list
+            
+            self._save_disk_cache(results, decimal_precision)
+    
+    def _read_disk_cache(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        try:
+            return RootsFile(self.disk_cache_filename(decimal_precision)).to_dict()
+        except (IOError, exc.UnsupportedCacheFormatError):
+            return None
+    
+    def _save_disk_cache(self, results, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        write_atomically(
+            self.disk_cache_filename(decimal_precision),
+            lambda f: write_roots_file(f, results)
+        )
         
-        with open(self.disk_cache_filename(decimal_precision), 'wb') as f:
-            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Clear out the old RAM cache, including the rounded down precisions
+        for cached_decimal_precision in self._ram_cache.keys():
+            if cached_decimal_precision <= decimal_precision:
+                self._ram_cache.pop(cached_decimal_precision, None)
+    
+    def _rounded_down_cache(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Returns the roots of the nearest higher precision cache rounded down
+        to `decimal_precision`, or `None` if there's no such cache
+        """
+        for higher_decimal_precision in self.cached_decimal_precisions():
+            if higher_decimal_precision > decimal_precision:
+                try:
+                    higher_roots = RootsFile(self.disk_cache_filename(higher_decimal_precision))
+                except (IOError, exc.UnsupportedCacheFormatError):
+                    continue
+                
+                return _RoundedRoots(higher_roots, decimal_precision)
         
-        if decimal_precision in self._ram_cache: # Clear out the old RAM cache
-            del self._ram_cache[decimal_precision]
+        return None
     
     def _load_disk_cache(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
         filename = self.disk_cache_filename(decimal_precision)
+        
+        # Without a cache for this precision the roots are rounded down from
+        # the nearest higher precision cache
+        if not os.path.exists(filename):
+            roots = self._rounded_down_cache(decimal_precision)
+            if roots is not None:
+                self._ram_cache[decimal_precision] = roots
+                return roots
+        
         try:
-            with open(filename, 'rb') as f:
-                self._ram_cache[decimal_precision] = pickle.load(f)
-        except (IOError, pickle.UnpicklingError), e:
+            # Roots are only decoded when requested
+            roots = self._ram_cache[decimal_precision] = RootsFile(filename)
+            return roots
+        except (IOError, exc.UnsupportedCacheFormatError), e:
+            if os.path.exists(self.legacy_disk_cache_filename(decimal_precision)):
+                raise exc.UnableToLoadBestRootsCacheError(
+                    "Unable to load cache from '%s': %s. You'll need to "\
+                    "convert the old cache by calling the console app "\
+                    "'beam_integrals best-roots-of-characteristic-equations-convert-cache' "\
+                    "or by using "\
+                    "'beam_integrals.characteristic_equation_solvers.best_roots_cache.convert_legacy_disk_caches' "\
+                    "Python API call." %
+                    (filename, e)
+                )
+            
             raise exc.UnableToLoadBestRootsCacheError(
                 "Unable to load cache from '%s': %s. You'll need to "\
                 "regenerate the cache by calling the console app "\
@@ -220,16 +1215,87 @@ class BestRootsCache(object):
                 (filename, e)
             )
     
+    def publish(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Publishes the roots of `decimal_precision` for worker processes,
+        returning a picklable `SharedRoots` handle, which has to be closed
+        once the workers are done
+        """
+        try:
+            roots = self._roots(decimal_precision)
+        except exc.UnableToLoadBestRootsCacheError:
+            if not self.compute_on_miss:
+                raise
+            
+            return SharedRoots(None, decimal_precision) # Nothing to share yet
+        
+        if isinstance(roots, RootsFile):
+            return SharedRoots(roots.filename, decimal_precision)
+        
+        # Rounded down roots are only shared once rounded
+        fd, filename = tempfile.mkstemp(
+            prefix='shared-roots.', suffix='.roots', dir=self.disk_cache_dir
+        )
+        with os.fdopen(fd, 'wb') as f:
+            write_roots_file(f, dict(
+                (beam_type_id, list(mode_list))
+                for beam_type_id, mode_list in roots.items()
+            ))
+        
+        return SharedRoots(filename, decimal_precision, temporary=True)
+    
     def get(self, beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION):
-        if decimal_precision not in self._ram_cache:
-            self._load_disk_cache(decimal_precision)
+        """
+        Gets the best root from the cache. With `compute_on_miss` set roots
+        missing from the cache are found inline, and written back to it.
+        """
+        # Fast path for cache hits, without any exception handling
+        roots = self._ram_cache.get(decimal_precision)
+        if roots is not None and mode > 0:
+            result = roots.root(beam_type.id, mode)
+            if result is not None:
+                return result
+        
+        try:
+            return self._get(beam_type, mode, decimal_precision)
+        except (exc.UnableToLoadBestRootsCacheError, exc.BeamTypeNotFoundInCacheError,
+            exc.ModeNotFoundInCacheError):
+            if not self.compute_on_miss:
+                raise
+        
+        result = find_best_root(
+            beam_type, mode, decimal_precision, include_error=True, use_cache=False, race=True
+        )
+        self._write_back({beam_type.id: {mode: result}}, decimal_precision)
+        
+        return result
+    
+    def _roots(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        try:
+            return self._ram_cache[decimal_precision]
+        except KeyError:
+            pass
+        
+        # Concurrent callers wait on a single load
+        with self._load_lock:
+            if decimal_precision in self._ram_cache:
+                return self._ram_cache[decimal_precision]
+            
+            return self._load_disk_cache(decimal_precision)
+    
+    def _get(self, beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        roots = self._roots(decimal_precision)
         
         try:
             if mode <= 0:
                 raise exc.InvalidModeError("Mode has to be a positive number (%s given)" % mode)
             
             # Mode list is 0 indexed
-            return self._ram_cache[decimal_precision][beam_type.id][mode-1]
+            result = roots[beam_type.id][mode-1]
+            if result is None:
+                raise IndexError # Hole left by roots computed on demand
+            
+            return result
         except KeyError:
             # Old version cache, doesn't support this beam type
             raise exc.BeamTypeNotFoundInCacheError(
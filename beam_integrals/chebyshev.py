@@ -0,0 +1,287 @@
+"""
+Chebyshev expansions of the mode shapes on the normalised coordinate `y/a`,
+which are evaluated with the Clenshaw recurrence and integrated as products of
+Chebyshev series, instead of with `evalf` and adaptive quadrature.
+"""
+import atexit
+import os
+import cPickle as pickle
+from sympy import Float, mpmath, Number
+from sympy.core.sympify import SympifyError
+from . import DEFAULT_DECIMAL_PRECISION
+from . import characteristic_equation_solvers as ces
+from .beam_types import BaseBeamType
+from .characteristic_equation_solvers import find_best_root
+from .compilers import estimate_cancellation_digits
+from .exceptions import UnsupportedExpressionError
+from .file_utils import locked, write_atomically
+
+
+MIN_DEGREE = 16
+
+# Extra digits absorbing the rounding errors of the transform
+GUARD_DIGITS = 5
+
+# Trailing coefficients which must be negligible before the series is trusted
+TAIL_LENGTH = 8
+
+
+class ChebyshevSeries(object):
+    """
+    Sum of `c_k * T_k(t)` terms on `-1 <= t <= 1`, which supports addition
+    and multiplication with other series and numbers
+    """
+
+    def __init__(self, coefficients):
+        self.coefficients = list(coefficients) or [mpmath.mpf(0)]
+
+    @staticmethod
+    def _coerce(other):
+        if isinstance(other, ChebyshevSeries):
+            return other
+
+        if isinstance(other, Number):
+            other = mpmath.mpf(other) if other.is_Float else mpmath.mpf(other.p)/other.q
+        elif not isinstance(other, (int, long, float, mpmath.mpf)):
+            raise TypeError("Unsupported operand type: %s" % type(other))
+
+        return ChebyshevSeries([other])
+
+    def __add__(self, other):
+        try:
+            other = self._coerce(other)
+        except TypeError:
+            return NotImplemented
+
+        coefficients = list(self.coefficients)
+        coefficients.extend([0] * (len(other.coefficients)-len(coefficients)))
+        for k, c in enumerate(other.coefficients):
+            coefficients[k] += c
+
+        return ChebyshevSeries(coefficients)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return ChebyshevSeries([-c for c in self.coefficients])
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __mul__(self, other):
+        try:
+            other = self._coerce(other)
+        except TypeError:
+            return NotImplemented
+
+        if len(other.coefficients) == 1:
+            return ChebyshevSeries([c * other.coefficients[0] for c in self.coefficients])
+
+        # `T_i * T_j = (T_(i+j) + T_|i-j|) / 2`
+        coefficients = [mpmath.mpf(0)] * (len(self.coefficients)+len(other.coefficients)-1)
+        for i, c1 in enumerate(self.coefficients):
+            for j, c2 in enumerate(other.coefficients):
+                half = mpmath.mpf(c1)*c2 / 2
+                coefficients[i+j] += half
+                coefficients[abs(i-j)] += half
+
+        return ChebyshevSeries(coefficients)
+
+    __rmul__ = __mul__
+
+    def __call__(self, t):
+        """Evaluates the series at `t` with the Clenshaw recurrence"""
+        b1 = b2 = 0
+        for c in reversed(self.coefficients[1:]):
+            b1, b2 = 2*t*b1 - b2 + c, b1
+
+        return t*b1 - b2 + self.coefficients[0]
+
+    def integrate(self):
+        """
+        Integrates the series over `[-1, 1]`, returning a `(result, error)`
+        tuple, where `error` bounds the rounding error
+        """
+        # Integrals of `T_k` vanish for odd `k`, and are `2/(1-k**2)` otherwise
+        terms = [mpmath.mpf(c) * 2 / (1 - k**2) for k, c in enumerate(self.coefficients) if k % 2 == 0]
+        return mpmath.fsum(terms), mpmath.fsum(terms, absolute=True) * mpmath.eps
+
+
+def chebyshev_coefficients(f, decimal_precision=DEFAULT_DECIMAL_PRECISION, min_degree=MIN_DEGREE):
+    """
+    Returns the Chebyshev coefficients of `f` on `-1 <= t <= 1`, interpolating
+    at the Chebyshev-Lobatto points and doubling the degree until the trailing
+    coefficients are negligible at `decimal_precision`
+    """
+    degree = min_degree
+    values = {}
+    with mpmath.workdps(decimal_precision + GUARD_DIGITS):
+        while True:
+            # Points of the previous degree are reused by the doubled one
+            values = dict((2*j, value) for j, value in values.items())
+            for j in range(degree+1):
+                if j not in values:
+                    values[j] = f(mpmath.cos(mpmath.pi*j/degree))
+
+            cosines = [mpmath.cos(mpmath.pi*k/degree) for k in range(2*degree)]
+            coefficients = []
+            for k in range(degree+1):
+                c = mpmath.fsum(
+                    values[j] * cosines[j*k % (2*degree)] * (1 if 0 < j < degree else 0.5)
+                    for j in range(degree+1)
+                ) * 2 / degree
+                coefficients.append(c if 0 < k < degree else c/2)
+
+            tolerance = max(abs(c) for c in coefficients) * mpmath.mpf(10)**-decimal_precision
+            if all(abs(c) <= tolerance for c in coefficients[-TAIL_LENGTH:]):
+                break
+
+            degree *= 2
+
+        while len(coefficients) > 1 and abs(coefficients[-1]) <= tolerance:
+            coefficients.pop()
+
+    return coefficients
+
+
+class ChebyshevCache(object):
+    """
+    Chebyshev coefficients of the mode shapes and their derivatives, stored
+    next to the best roots cache they were computed from. New coefficients
+    are persisted to disk in a single batch by `flush`.
+    """
+    _ram_cache = {}
+    _unsaved = {}
+
+    def __init__(self, disk_cache_dir=None):
+        self._disk_cache_dir = disk_cache_dir
+
+    @property
+    def disk_cache_dir(self):
+        return self._disk_cache_dir or ces.best_roots_cache.disk_cache_dir
+
+    def disk_cache_filename(self, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        return os.path.join(
+            self.disk_cache_dir,
+            "chebyshev.decimal-precision=%d.pickle" % decimal_precision
+        )
+
+    def _read_disk_cache(self, decimal_precision):
+        try:
+            with open(self.disk_cache_filename(decimal_precision), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return {}
+
+    def flush(self):
+        """Saves the coefficients computed since the last save"""
+        for cache_key, coefficients in self._unsaved.items():
+            disk_cache_dir, decimal_precision = cache_key
+            if disk_cache_dir != self.disk_cache_dir:
+                continue
+
+            filename = self.disk_cache_filename(decimal_precision)
+            with locked(filename):
+                # Keep the coefficients saved by other processes in the meantime
+                merged = self._read_disk_cache(decimal_precision)
+                merged.update(coefficients)
+                write_atomically(filename, lambda f: pickle.dump(merged, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+            self._coefficients(decimal_precision).update(merged)
+            del self._unsaved[cache_key]
+
+    def _coefficients(self, decimal_precision):
+        cache_key = (self.disk_cache_dir, decimal_precision)
+        if cache_key not in self._ram_cache:
+            self._ram_cache[cache_key] = self._read_disk_cache(decimal_precision)
+
+        return self._ram_cache[cache_key]
+
+    def _compute(self, beam_type, mode, order, mu_m, decimal_precision):
+        expr = beam_type.mode_shape(mode, order)
+        working_precision = decimal_precision + GUARD_DIGITS + estimate_cancellation_digits(
+            expr, {'y': 'a', 'mu_m': mu_m}
+        )
+        compiled = beam_type.compiled_mode_shape(mode, order, 'mpmath', working_precision)
+
+        with mpmath.workdps(working_precision):
+            mu_m = mpmath.mpf(mu_m)
+
+        def f(t):
+            with mpmath.workdps(working_precision):
+                return compiled(mu_m, (t+1)/2, 1)
+
+        return chebyshev_coefficients(f, decimal_precision)
+
+    def get(self, beam_type, mode, order=0, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """
+        Returns the Chebyshev series of the `order`-th derivative of `Y_m` for
+        `a=1`, in terms of `t = 2*y/a - 1`
+        """
+        coefficients = self._coefficients(decimal_precision)
+        mu_m = find_best_root(beam_type, mode, decimal_precision)
+
+        # Coefficients computed from a since changed root are stale
+        key = (beam_type.id, mode, order)
+        if key not in coefficients or coefficients[key][0] != mu_m:
+            unsaved = self._unsaved.setdefault((self.disk_cache_dir, decimal_precision), {})
+            coefficients[key] = unsaved[key] = (
+                mu_m, self._compute(beam_type, mode, order, mu_m, decimal_precision)
+            )
+
+        return ChebyshevSeries(coefficients[key][1])
+
+    def regenerate(self, max_mode, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        """Expands all mode shapes of all beam types, up to `max_mode`"""
+        for beam_type in BaseBeamType.plugins.instances: #@UndefinedVariable
+            for mode in range(1, max_mode+1):
+                for order in range(3):
+                    self.get(beam_type, mode, order, decimal_precision)
+
+        self.flush()
+
+
+def integrate_spectrally(integral, beam_type, a, m=None, t=None, v=None, n=None, decimal_precision=DEFAULT_DECIMAL_PRECISION, error=False):
+    """
+    Integrates the products of the mode shape Chebyshev series. Raises
+    `UnsupportedExpressionError` if the integrand isn't a polynomial in mode
+    shapes and their derivatives.
+    """
+    with mpmath.workdps(decimal_precision + GUARD_DIGITS):
+        a = mpmath.mpf(a)
+
+    def shape(order):
+        def wrapper(mode):
+            series = chebyshev_cache.get(beam_type, mode, order, decimal_precision)
+            with mpmath.workdps(decimal_precision + GUARD_DIGITS):
+                return series * (1/a**order)
+
+        return wrapper
+
+    with mpmath.workdps(decimal_precision + GUARD_DIGITS):
+        try:
+            integrand = integral._integrand(shape(0), shape(1), shape(2), m, t, v, n)
+        except (TypeError, AttributeError, ValueError, SympifyError), e:
+            raise UnsupportedExpressionError("Unable to expand the integrand: %s" % e)
+
+        if not isinstance(integrand, ChebyshevSeries):
+            raise UnsupportedExpressionError("Integrand isn't a polynomial in mode shapes")
+
+        # `dy = a/2 * dt`
+        result = tuple(x * a/2 for x in integrand.integrate())
+
+    with mpmath.workdps(decimal_precision):
+        # If not converted to `sympy.Float` precision will be lost after the
+        # original `mpmath` context is restored
+        result = tuple(Float(x, decimal_precision) for x in result)
+
+    return result if error else result[0]
+
+
+chebyshev_cache = ChebyshevCache()
+
+# Coefficients computed on demand are saved once, on exit
+atexit.register(lambda: chebyshev_cache.flush())
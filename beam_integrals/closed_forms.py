@@ -0,0 +1,223 @@
+from sympy import Add, cos, cosh, exp, expand, Float, mpmath, Mul, Number, S, sin, sinh
+from sympy.core.sympify import SympifyError
+from . import y, DEFAULT_DECIMAL_PRECISION
+from .characteristic_equation_solvers import find_best_root
+from .compilers import compile_function, estimate_cancellation_digits
+from .exceptions import UnsupportedExpressionError
+
+
+# Maps each supported function of `k*y` to its `(factor, unit)` terms, so that
+# `func(k*y) = sum(factor * exp(unit*k*y))`
+_EXPONENTIAL_FORMS = {
+    sin:  ((-0.5j, 1j), (0.5j, -1j)),
+    cos:  ((0.5, 1j), (0.5, -1j)),
+    sinh: ((0.5, 1), (-0.5, -1)),
+    cosh: ((0.5, 1), (0.5, -1)),
+    exp:  ((1, 1),),
+}
+
+
+class ExponentialSeries(object):
+    """
+    Sum of `c * y**p * exp(l*y)` terms, stored as a `{(p, l): c}` dict, which
+    supports addition and multiplication with other series and numbers
+    """
+
+    def __init__(self, terms=None):
+        self.terms = terms or {}
+
+    @staticmethod
+    def _coerce(other):
+        if isinstance(other, ExponentialSeries):
+            return other
+
+        if isinstance(other, Number):
+            other = mpmath.mpf(other) if other.is_Float else mpmath.mpf(other.p)/other.q
+        elif not isinstance(other, (int, long, float, complex, mpmath.mpf, mpmath.mpc)):
+            raise TypeError("Unsupported operand type: %s" % type(other))
+
+        return ExponentialSeries({(0, mpmath.mpc(0)): mpmath.mpc(other)})
+
+    def __add__(self, other):
+        try:
+            other = self._coerce(other)
+        except TypeError:
+            return NotImplemented
+
+        terms = dict(self.terms)
+        for key, c in other.terms.items():
+            terms[key] = terms.get(key, 0) + c
+
+        return ExponentialSeries(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return ExponentialSeries(dict((key, -c) for key, c in self.terms.items()))
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __mul__(self, other):
+        try:
+            other = self._coerce(other)
+        except TypeError:
+            return NotImplemented
+
+        terms = {}
+        for (p1, l1), c1 in self.terms.items():
+            for (p2, l2), c2 in other.terms.items():
+                key = (p1+p2, l1+l2)
+                terms[key] = terms.get(key, 0) + c1*c2
+
+        return ExponentialSeries(terms)
+
+    __rmul__ = __mul__
+
+    def integrate(self, a):
+        """
+        Integrates the series over `[0, a]` in closed form, returning a
+        `(result, error)` tuple, where `error` bounds the rounding error
+        """
+        result = magnitude = 0
+        for (p, l), c in self.terms.items():
+            if l == 0:
+                value = c * a**(p+1) / (p+1)
+            else:
+                # Repeated integration by parts of `y**p * exp(l*y)`
+                exp_la = mpmath.exp(l*a)
+                value = -(-1)**p * mpmath.factorial(p) / l**(p+1)
+                for j in range(p+1):
+                    value += (-1)**j * mpmath.factorial(p)/mpmath.factorial(p-j) * a**(p-j) * exp_la / l**(j+1)
+                value *= c
+
+            result += value
+            magnitude += abs(value)
+
+        return mpmath.re(result), magnitude * mpmath.eps
+
+
+def exponential_terms(expr):
+    """
+    Splits `expr` into a list of `(coefficient, p, factor, unit, k)` terms,
+    each representing `factor * coefficient * y**p * exp(unit*k*y)`, where
+    `coefficient` and `k` are independent of `y`
+    """
+    terms = []
+    for term in Add.make_args(expand(expr)):
+        coefficient, p, k, forms = [], 0, S.Zero, None
+        for factor in Mul.make_args(term):
+            if not factor.has(y):
+                coefficient.append(factor)
+            elif factor == y:
+                p += 1
+            elif factor.is_Pow and factor.args[0] == y and factor.args[1].is_Integer and factor.args[1] > 0:
+                p += int(factor.args[1])
+            elif factor.func in _EXPONENTIAL_FORMS and forms is None:
+                k, rest = factor.args[0].as_independent(y)
+                if rest != y:
+                    raise UnsupportedExpressionError("Unsupported argument in '%s'" % factor)
+
+                forms = _EXPONENTIAL_FORMS[factor.func]
+            else:
+                raise UnsupportedExpressionError("Unsupported factor '%s'" % factor)
+
+        for factor, unit in forms or ((1, 0),):
+            terms.append((Mul(*coefficient), p, factor, unit, k))
+
+    return terms
+
+
+_exponential_terms_cache = {}
+def _get_exponential_terms(beam_type, mode, order):
+    # Mode shapes only differ for modes with a mode-specific boundary condition
+    key = mode if mode in beam_type.dont_improve_mu_m_for_modes else None
+    cache_key = (beam_type.id, key, order)
+    if cache_key not in _exponential_terms_cache:
+        expr = beam_type.Y_m_derivative_from_cache(mode, order) if order else beam_type.Y_m(mode)
+        _exponential_terms_cache[cache_key] = (expr, exponential_terms(expr))
+
+    return _exponential_terms_cache[cache_key]
+
+_compiled_exponential_terms_cache = {}
+def _get_compiled_exponential_terms(beam_type, mode, order, working_precision):
+    key = mode if mode in beam_type.dont_improve_mu_m_for_modes else None
+    cache_key = (beam_type.id, key, order, working_precision)
+    if cache_key not in _compiled_exponential_terms_cache:
+        _, terms = _get_exponential_terms(beam_type, mode, order)
+        _compiled_exponential_terms_cache[cache_key] = [
+            (
+                compile_function(coefficient, ('mu_m', 'a'), 'mpmath', working_precision),
+                p,
+                mpmath.mpc(factor),
+                mpmath.mpc(unit),
+                compile_function(k, ('mu_m', 'a'), 'mpmath', working_precision),
+            )
+            for coefficient, p, factor, unit, k in terms
+        ]
+
+    return _compiled_exponential_terms_cache[cache_key]
+
+def cancellation_digits(beam_type, mode, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+    """Decimal digits lost to cancellation when expanding `Y_m` of `mode`"""
+    expr, _ = _get_exponential_terms(beam_type, mode, 0)
+    mu_m = find_best_root(beam_type, mode, decimal_precision)
+    return estimate_cancellation_digits(expr, {'y': 'a', 'mu_m': mu_m})
+
+def mode_shape_series(beam_type, mode, order, a, decimal_precision=DEFAULT_DECIMAL_PRECISION, working_precision=None):
+    """
+    Returns the `order`-th derivative of `Y_m` for `mode` as an
+    `ExponentialSeries`, with coefficients computed at `working_precision`
+    """
+    working_precision = working_precision or \
+        decimal_precision + cancellation_digits(beam_type, mode, decimal_precision)
+    terms = _get_compiled_exponential_terms(beam_type, mode, order, working_precision)
+    mu_m = find_best_root(beam_type, mode, decimal_precision)
+
+    with mpmath.workdps(working_precision):
+        mu_m = mpmath.mpf(mu_m)
+        a = mpmath.mpf(a)
+        series = ExponentialSeries()
+        for coefficient, p, factor, unit, k in terms:
+            series += ExponentialSeries({
+                (p, unit * k(mu_m, a)): factor * coefficient(mu_m, a)
+            })
+
+    return series
+
+def integrate_analytically(integral, beam_type, a, m=None, t=None, v=None, n=None, decimal_precision=DEFAULT_DECIMAL_PRECISION, error=False):
+    """
+    Integrates in closed form. Raises `UnsupportedExpressionError` if the
+    integrand isn't a polynomial in mode shapes and their derivatives.
+    """
+    working_precision = decimal_precision + sum(
+        cancellation_digits(beam_type, mode, decimal_precision)
+        for mode in (m, t, v, n)
+        if mode is not None
+    )
+
+    def shape(order):
+        return lambda mode: mode_shape_series(
+            beam_type, mode, order, a, decimal_precision, working_precision
+        )
+
+    with mpmath.workdps(working_precision):
+        try:
+            integrand = integral._integrand(shape(0), shape(1), shape(2), m, t, v, n)
+        except (TypeError, AttributeError, ValueError, SympifyError), e:
+            raise UnsupportedExpressionError("Unable to expand the integrand: %s" % e)
+
+        if not isinstance(integrand, ExponentialSeries):
+            raise UnsupportedExpressionError("Integrand isn't a polynomial in mode shapes")
+
+        result = integrand.integrate(mpmath.mpf(a))
+
+    with mpmath.workdps(decimal_precision):
+        # If not converted to `sympy.Float` precision will be lost after the
+        # original `mpmath` context is restored
+        result = tuple(Float(x, decimal_precision) for x in result)
+
+    return result if error else result[0]
@@ -0,0 +1,154 @@
+import math
+from sympy import cosh, exp, mpmath, S, sinh, sympify
+from . import exceptions as exc
+
+try:
+    import numpy
+except ImportError: #pragma: no cover
+    numpy = None
+
+
+SUPPORTED_MODULES = ('mpmath', 'numpy', 'math')
+SUPPORTED_FUNCTIONS = ('sin', 'cos', 'tan', 'sinh', 'cosh', 'tanh', 'exp', 'log', 'sqrt')
+
+
+def _get_module(module):
+    if module not in SUPPORTED_MODULES:
+        raise ValueError(
+            "Unsupported module '%s', expected one of: %s" %
+            (module, ', '.join(SUPPORTED_MODULES))
+        )
+
+    if module == 'numpy':
+        if numpy is None: #pragma: no cover
+            raise ImportError("NumPy is required to compile into 'numpy' functions")
+        return numpy
+
+    return mpmath if module == 'mpmath' else math
+
+
+class _Printer(object):
+    """
+    Prints a SymPy expression as a Python expression string of `args`.
+    Subexpressions which don't depend on `args` are evaluated only once, and
+    stored in the namespace together with the other numeric constants.
+    """
+
+    def __init__(self, args, module='mpmath', decimal_precision=None, constants=None):
+        self.args = set(sympify(arg) for arg in args)
+        self.module = module
+        self.decimal_precision = decimal_precision or mpmath.mp.dps
+        self.constants = dict((str(k), sympify(v)) for k, v in (constants or {}).items())
+
+        numeric_module = _get_module(module)
+        self.namespace = dict(
+            (name, getattr(numeric_module, name))
+            for name in SUPPORTED_FUNCTIONS
+        )
+
+    def _store(self, value):
+        name = "_c%d" % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def _constant(self, expr):
+        if self.module != 'mpmath':
+            return self._store(float(expr))
+
+        # Numbers are converted exactly, while constants like `pi` are
+        # evaluated at the requested precision
+        if expr.is_Float:
+            return self._store(mpmath.mp.make_mpf(expr._mpf_))
+
+        with mpmath.workdps(self.decimal_precision):
+            return self._store(mpmath.mp.make_mpf(expr._as_mpf_val(mpmath.mp.prec)))
+
+    def _fold(self, expr):
+        code = self._print(expr)
+        with mpmath.workdps(self.decimal_precision):
+            return self._store(eval(code, self.namespace))
+
+    def doprint(self, expr):
+        if not expr.is_Atom and not (expr.free_symbols & self.args):
+            return self._fold(expr)
+
+        return self._print(expr)
+
+    def _print(self, expr):
+        if expr.is_Symbol:
+            if expr.name in self.constants:
+                return self._constant(self.constants[expr.name])
+            return expr.name
+
+        if expr.is_Integer:
+            return "%d" % expr.p
+
+        if expr.is_Rational or expr.is_Float or expr.is_NumberSymbol:
+            return self._constant(expr)
+
+        if expr.is_Add:
+            return "(%s)" % ' + '.join(self.doprint(arg) for arg in expr.args)
+
+        if expr.is_Mul:
+            return "(%s)" % '*'.join(self.doprint(arg) for arg in expr.args)
+
+        if expr.is_Pow:
+            base, exponent = expr.args
+            if exponent is S.Half:
+                return "sqrt(%s)" % self.doprint(base)
+
+            return "(%s)**(%s)" % (self.doprint(base), self.doprint(exponent))
+
+        if expr.is_Function and expr.func.__name__ in SUPPORTED_FUNCTIONS:
+            return "%s(%s)" % (
+                expr.func.__name__,
+                ', '.join(self.doprint(arg) for arg in expr.args)
+            )
+
+        raise exc.UnsupportedExpressionError(
+            "Unable to compile '%s' into a numeric function" % expr
+        )
+
+
+def compile_function(expr, args, module='mpmath', decimal_precision=None, constants=None):
+    """
+    Compiles a SymPy expression into a plain Python function of `args`, using
+    the numeric functions of `module`. Symbols found in `constants` are
+    replaced by their exact values.
+
+    Functions compiled for `mpmath` have to be called from within the
+    desired `mpmath` working precision, while `decimal_precision` only
+    controls the precision of the numeric constants.
+    """
+    expr = sympify(expr)
+    printer = _Printer(args, module, decimal_precision, constants)
+    unknown_symbols = [
+        str(symbol) for symbol in expr.free_symbols - printer.args
+        if str(symbol) not in printer.constants
+    ]
+    if unknown_symbols:
+        raise exc.UnsupportedExpressionError(
+            "Unable to compile '%s', unknown symbols: %s" %
+            (expr, ', '.join(sorted(unknown_symbols)))
+        )
+
+    body = printer.doprint(expr)
+
+    return eval("lambda %s: %s" % (', '.join(str(arg) for arg in args), body), printer.namespace)
+
+def estimate_cancellation_digits(expr, subs):
+    """
+    Estimates the number of decimal digits lost to the cancellation of
+    exponentially growing terms, with `subs` providing the worst case values
+    of the growth determining symbols.
+    """
+    max_growth = 0
+    for atom in expr.atoms(sinh, cosh, exp):
+        arg = atom.args[0].subs(subs)
+        if not arg.is_Number:
+            continue
+
+        growth = float(arg) if isinstance(atom, exp) else abs(float(arg))
+        max_growth = max(max_growth, growth)
+
+    return int(math.ceil(max_growth / math.log(10)))
@@ -14,10 +14,18 @@ class UndefinedRootError(RootfinderError):
     """Root is undefined for the given mode"""
 
 
+class RootfinderCancelledError(RootfinderError):
+    """Rootfinder was cancelled before finding the root"""
+
+
 class MultipleRootsError(RootfinderError):
     """Multiple roots found while guessing the optimal `mu_m` search interval"""
 
 
+class MissingRootError(RootfinderError):
+    """No root found for the given mode while sweeping for roots"""
+
+
 class BestRootsCacheError(RootfinderError):
     """Exception raised when something causes a best roots cache error"""
 
@@ -26,6 +34,10 @@ class UnableToLoadBestRootsCacheError(BestRootsCacheError):
     """Unable to load the best roots cache"""
 
 
+class UnsupportedCacheFormatError(BestRootsCacheError):
+    """Cache file isn't in a supported format"""
+
+
 class BeamTypeNotFoundInCacheError(BestRootsCacheError):
     """Given beam type not found in the best roots cache"""
 
@@ -38,5 +50,21 @@ class UnableToGuessScaleFunctionError(BeamTypesException):
     """Unable to guess the scale function"""
 
 
+class IntegralsCacheError(BeamTypesException):
+    """Exception raised when something causes an integrals cache error"""
+
+
+class UnableToLoadIntegralsCacheError(IntegralsCacheError):
+    """Unable to load the integrals cache"""
+
+
+class IntegralNotFoundInCacheError(IntegralsCacheError):
+    """Given integral, beam type or modes not found in the integrals cache"""
+
+
+class UnsupportedExpressionError(BeamTypesException):
+    """Expression can't be compiled into a numeric function"""
+
+
 class ShellCommandError(Exception):
     """Exception raised when a shell command causes an error"""
@@ -0,0 +1,77 @@
+"""
+File locking and atomic writes shared by the disk caches.
+"""
+import collections
+from contextlib import contextmanager
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError: #pragma: no cover
+    fcntl = None # Not available on Windows
+
+
+def write_atomically(filename, write):
+    """
+    Calls `write(f)` on a temporary file, which then replaces `filename`, so
+    readers see either the old or the new file, never a partially written one
+    """
+    fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Temporary files are only readable by the owner
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_filename, 0666 & ~umask)
+
+        if os.name == 'nt' and os.path.exists(filename): #pragma: no cover
+            os.remove(filename) # Windows can't rename over an existing file
+        os.rename(temp_filename, filename)
+    except:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+_file_locks = collections.defaultdict(threading.RLock)
+_file_locks_depth = collections.defaultdict(int)
+_file_locks_guard = threading.Lock()
+_file_locks_pid = os.getpid()
+
+@contextmanager
+def locked(filename):
+    """
+    Advisory lock on `filename`, exclusive across both processes and
+    threads. Reentrant, so locked operations can be nested.
+    """
+    global _file_locks_pid
+
+    with _file_locks_guard:
+        if _file_locks_pid != os.getpid():
+            # Locks held by the parent aren't held by the forked children
+            _file_locks.clear()
+            _file_locks_depth.clear()
+            _file_locks_pid = os.getpid()
+
+        thread_lock = _file_locks[filename]
+
+    with thread_lock:
+        if not _file_locks_depth[filename]:
+            f = open(filename + '.lock', 'a')
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+        _file_locks_depth[filename] += 1
+        try:
+            yield
+        finally:
+            _file_locks_depth[filename] -= 1
+            if not _file_locks_depth[filename]:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                f.close()
@@ -1,11 +1,30 @@
 import itertools
+import math
+import multiprocessing
+import operator
+import os
+import cPickle as pickle
 import re
 from friendly_name_mixin import FriendlyNameFromClassMixin
-from simple_plugins import PluginMount
+from simple_plugins import AttrDict, PluginMount
 from sympy import Float, factor, mpmath, Symbol
-from . import a, DEFAULT_DECIMAL_PRECISION
+from sympy.mpmath.calculus.quadrature import GaussLegendre
+from . import a, y, PROJECT_SETTINGS_DIR, DEFAULT_MAX_MODE, DEFAULT_DECIMAL_PRECISION
+from . import beam_types
+from . import exceptions as exc
+from . import characteristic_equation_solvers as ces
+from .beam_types import BaseBeamType
 from .characteristic_equation_solvers import find_best_root
-from .exceptions import UnableToGuessScaleFunctionError
+from .chebyshev import chebyshev_cache, integrate_spectrally
+from .closed_forms import integrate_analytically
+from .compilers import compile_function, estimate_cancellation_digits
+from .exceptions import UnableToGuessScaleFunctionError, UnsupportedExpressionError
+from .file_utils import locked, write_atomically
+
+try:
+    import numpy
+except ImportError: #pragma: no cover
+    numpy = None
 
 
 class BaseIntegral(FriendlyNameFromClassMixin):
@@ -41,6 +60,14 @@ class BaseIntegral(FriendlyNameFromClassMixin):
     def has_parent(cls):
         return cls.parent_id() is not None
     
+    @classmethod
+    def root_id(cls):
+        id = cls.plugins.class_to_id[cls] #@ReservedAssignment
+        while id in cls.plugins.child_id_to_parent_id:
+            id = cls.plugins.child_id_to_parent_id[id] #@ReservedAssignment
+        
+        return id
+    
     def iterate_over_used_variables(self, max_mode, start_mode=1):
         modes = range(start_mode, max_mode+1)
         get_modes = lambda var: modes if var in self.used_variables else (None,)
@@ -55,6 +82,10 @@ class BaseIntegral(FriendlyNameFromClassMixin):
             for idx, var in enumerate(self.used_variables)
         )
     
+    def mode_key(self, m, t, v, n):
+        d = locals()
+        return tuple(d[var] for var in self.used_variables)
+    
     def integrand(self, beam_type, m, t, v, n, decimal_precision=DEFAULT_DECIMAL_PRECISION):
         def resolve_mu_m(func, *args, **kwargs):
             def wrapper(mode):
@@ -73,6 +104,50 @@ class BaseIntegral(FriendlyNameFromClassMixin):
     def _integrand(self, Y_m, dY_m, ddY_m, m, t, v, n):
         raise NotImplementedError
     
+    _compiled_integrands_cache = {}
+    def compiled_integrand(self, beam_type, m, t, v, n, decimal_precision=DEFAULT_DECIMAL_PRECISION, module='mpmath'):
+        """
+        Returns the integrand compiled into a numeric `f(y, a)` function, cached
+        per integral family, beam type, modes, decimal precision and module
+        """
+        key = (
+            self.root_id(), beam_type.id, beam_type.mode_shape_form, (m, t, v, n),
+            decimal_precision, module
+        )
+        if key not in self._compiled_integrands_cache:
+            # Each mode gets its own `mu_m` symbol, replaced by its best root
+            # only when compiling, so functions of `mu_m` get evaluated exactly
+            # instead of being rounded to `decimal_precision` by SymPy
+            mu = lambda mode: Symbol("mu_%d" % mode)
+            def resolve_mu_m(order):
+                return lambda mode: beam_type.mode_shape(mode, order).subs('mu_m', mu(mode))
+            
+            integrand = self._integrand(
+                resolve_mu_m(0), resolve_mu_m(1), resolve_mu_m(2), m, t, v, n
+            )
+            roots = dict(
+                (mu(mode), find_best_root(beam_type, mode, decimal_precision))
+                for mode in set([m, t, v, n]) - set([None])
+            )
+            
+            if module == 'mpmath':
+                # Extra working precision absorbs the cancellation of the
+                # exponentially growing terms
+                working_precision = decimal_precision + estimate_cancellation_digits(
+                    integrand, dict(roots.items() + [(y, a)])
+                )
+                func = compile_function(integrand, ('y', 'a'), module, working_precision, roots)
+                
+                def compiled(y, a):
+                    with mpmath.workdps(working_precision):
+                        return func(mpmath.mpf(y), mpmath.mpf(a))
+            else:
+                compiled = compile_function(integrand, ('y', 'a'), module, constants=roots)
+            
+            self._compiled_integrands_cache[key] = compiled
+        
+        return self._compiled_integrands_cache[key]
+    
     def guess_scale_function(self, beam_type, m, t, v, n):
         # Special case for these modes due to the mode-specific boundary condition
         if set([m, t, v, n]) & set(beam_type.dont_improve_mu_m_for_modes):
@@ -108,6 +183,10 @@ class BaseIntegralWithSymetricVariables(BaseIntegral):
             val * max_mode**idx
             for idx, val in enumerate(values)
         )
+    
+    def mode_key(self, m, t, v, n):
+        d = locals()
+        return tuple(sorted(d[var] for var in self.used_variables))
 
 
 class I1(BaseIntegralWithSymetricVariables):
@@ -158,9 +237,30 @@ class I7(BaseIntegralWithSymetricVariables):
 class I24(I7): pass
 
 
+_integrators_without_quadrature = {
+    'analytic': integrate_analytically,
+    'chebyshev': integrate_spectrally,
+}
+
 def integrate(integral, beam_type, a, m=None, t=None, v=None, n=None, decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
-    cached_subs = integral(beam_type, m, t, v, n, decimal_precision).subs('a', a)
-    f = lambda y: cached_subs.evalf(n=decimal_precision, subs={'y': y})
+    integrate_without_quadrature = _integrators_without_quadrature.get(kwargs.get('method'))
+    if integrate_without_quadrature is not None:
+        try:
+            return integrate_without_quadrature(
+                integral, beam_type, a, m, t, v, n, decimal_precision,
+                error=kwargs.get('error', False)
+            )
+        except UnsupportedExpressionError:
+            # Fall back to quadrature, e.g. for user defined integrals
+            del kwargs['method']
+    
+    try:
+        compiled = integral.compiled_integrand(beam_type, m, t, v, n, decimal_precision)
+        f = lambda y: compiled(y, a)
+    except UnsupportedExpressionError:
+        # Fall back to `evalf`, as the integrand can't be compiled
+        cached_subs = integral(beam_type, m, t, v, n, decimal_precision).subs('a', a)
+        f = lambda y: cached_subs.evalf(n=decimal_precision, subs={'y': y})
     
     with mpmath.workdps(decimal_precision):
         result = mpmath.quad(f, (0., a), **kwargs)
@@ -171,3 +271,357 @@ def integrate(integral, beam_type, a, m=None, t=None, v=None, n=None, decimal_pr
             return tuple(Float(x, decimal_precision) for x in result)
         else:
             return Float(result, decimal_precision)
+
+_scale_factors_cache = {}
+_reference_integrals_cache = {}
+def integrate_by_scaling(integral, beam_type, a, m=None, t=None, v=None, n=None, decimal_precision=DEFAULT_DECIMAL_PRECISION, reference_a=1., **kwargs):
+    """
+    Integrates once for the `reference_a` beam length, and scales that result
+    by `(a/reference_a)**scale_factor` for any other beam length. Falls back
+    to a direct integration when the scale factor can't be guessed.
+    """
+    # Special case for these modes due to the mode-specific boundary condition
+    if set([m, t, v, n]) & set(beam_type.dont_improve_mu_m_for_modes):
+        return integrate(integral, beam_type, a, m, t, v, n, decimal_precision, **kwargs)
+    
+    # Scale factor doesn't depend on the modes, as they all share `mu_m`
+    scale_factor_key = (integral.root_id(), beam_type.id)
+    if scale_factor_key not in _scale_factors_cache:
+        try:
+            scale_factor = int(integral.guess_scale_factor(beam_type, m, t, v, n))
+        except UnableToGuessScaleFunctionError:
+            scale_factor = None
+        
+        _scale_factors_cache[scale_factor_key] = scale_factor
+    
+    scale_factor = _scale_factors_cache[scale_factor_key]
+    if scale_factor is None:
+        return integrate(integral, beam_type, a, m, t, v, n, decimal_precision, **kwargs)
+    
+    reference_key = scale_factor_key + (
+        integral.mode_key(m, t, v, n), float(reference_a), decimal_precision,
+        tuple(sorted(kwargs.items()))
+    )
+    if reference_key not in _reference_integrals_cache:
+        _reference_integrals_cache[reference_key] = integrate(
+            integral, beam_type, reference_a, m, t, v, n, decimal_precision, **kwargs
+        )
+    
+    result = _reference_integrals_cache[reference_key]
+    with mpmath.workdps(decimal_precision):
+        scale_by = Float((mpmath.mpf(a) / mpmath.mpf(reference_a)) ** scale_factor, decimal_precision)
+    
+    if isinstance(result, tuple): # Integration error included
+        return tuple(x * scale_by for x in result)
+    else:
+        return result * scale_by
+
+def iterate_over_integrals(max_mode=DEFAULT_MAX_MODE):
+    """
+    Iterates over `(integral_id, beam_type_id, m, t, v, n)` tasks of all
+    integrals without parents and all beam types, skipping equivalent modes
+    """
+    for integral in BaseIntegral.plugins.instances_sorted_by_id: #@UndefinedVariable
+        # Child integrals behave the same as their parents
+        if integral.has_parent():
+            continue
+        
+        for beam_type in BaseBeamType.plugins.instances_sorted_by_id: #@UndefinedVariable
+            mode_keys_seen = set()
+            for m, t, v, n in integral.iterate_over_used_variables(max_mode):
+                mode_key = integral.mode_key(m, t, v, n)
+                if mode_key not in mode_keys_seen:
+                    mode_keys_seen.add(mode_key)
+                    yield integral.id, beam_type.id, m, t, v, n
+
+def _expected_cost(task):
+    # Higher modes oscillate more, and need more quadrature nodes
+    return sum(mode for mode in task[2:] if mode is not None)
+
+def _init_integrate_pool(*data): #pragma: no cover
+    global _integrate_pool_data
+    
+    data_keys = 'a, decimal_precision, shared_roots, warm_up_tasks, kwargs'.split(', ')
+    _integrate_pool_data = AttrDict(zip(data_keys, data))
+    _integrate_pool_data.shared_roots.attach(ces.best_roots_cache)
+    
+    # Compiled integrands, and the mode shape derivatives they're built from,
+    # are cached for the worker's lifetime
+    for integral_id, beam_type_id, m, t, v, n in _integrate_pool_data.warm_up_tasks:
+        try:
+            BaseIntegral.coerce(integral_id).compiled_integrand( #@UndefinedVariable
+                BaseBeamType.coerce(beam_type_id), m, t, v, n, #@UndefinedVariable
+                _integrate_pool_data.decimal_precision
+            )
+        except UnsupportedExpressionError:
+            pass # Integrated with `evalf` instead
+
+def _integrate_worker(task): #pragma: no cover
+    c = _integrate_pool_data
+    integral_id, beam_type_id, m, t, v, n = task
+    result = integrate(
+        BaseIntegral.coerce(integral_id), BaseBeamType.coerce(beam_type_id), #@UndefinedVariable
+        c.a, m, t, v, n, c.decimal_precision, **c.kwargs
+    )
+    
+    # Workers exit without running the `atexit` handlers, so anything cached
+    # while integrating is saved right away
+    beam_types.derivatives_cache.flush()
+    chebyshev_cache.flush()
+    
+    return result
+
+def integrate_many(tasks, a, decimal_precision=DEFAULT_DECIMAL_PRECISION, processes=None, chunksize=None, **kwargs):
+    """
+    Integrates `(integral_id, beam_type_id, m, t, v, n)` tasks over a process
+    pool, yielding `(task, result)` tuples as they're done. Most expensive
+    tasks are sent out, and yielded, first, while tasks of the same expected
+    cost keep their order, so the order is always deterministic. Each worker
+    compiles the integrands of all integral ids upfront when integrating by
+    quadrature.
+    """
+    tasks = sorted(tasks, key=_expected_cost, reverse=True)
+    if not tasks:
+        return
+    
+    warm_up_tasks = []
+    if kwargs.get('method') not in _integrators_without_quadrature:
+        # One task for each distinct integral family and beam type
+        seen = set()
+        for integral_id, beam_type_id, m, t, v, n in tasks:
+            key = (BaseIntegral.coerce(integral_id).root_id(), beam_type_id) #@UndefinedVariable
+            if key not in seen:
+                seen.add(key)
+                warm_up_tasks.append((integral_id, beam_type_id, m, t, v, n))
+    
+    # Workers share the best roots published here, so they don't have to load
+    # them themselves, and loading errors are raised here
+    shared_roots = ces.best_roots_cache.publish(decimal_precision)
+    
+    processes = processes or multiprocessing.cpu_count()
+    chunksize = chunksize or max(1, len(tasks) // (processes*4))
+    
+    try:
+        pool = multiprocessing.Pool(
+            processes=processes,
+            initializer=_init_integrate_pool,
+            initargs=(a, decimal_precision, shared_roots, warm_up_tasks, kwargs)
+        )
+        try:
+            for task, result in itertools.izip(tasks, pool.imap(_integrate_worker, tasks, chunksize)):
+                yield task, result
+        except GeneratorExit:
+            raise # Stopped early, tasks already sent out are finished below
+        except:
+            pool.terminate()
+            raise
+        finally:
+            # Terminating busy workers may leave the pool's queues locked
+            pool.close()
+            pool.join()
+    finally:
+        shared_roots.close()
+
+
+class _NodeValues(object):
+    """Values at the quadrature nodes, supporting elementwise arithmetic"""
+    
+    def __init__(self, values):
+        self.values = values
+    
+    def _apply(self, op, other):
+        if isinstance(other, _NodeValues):
+            return _NodeValues(map(op, self.values, other.values))
+        
+        return _NodeValues([op(x, other) for x in self.values])
+    
+    def __add__(self, other):
+        return self._apply(operator.add, other)
+    
+    __radd__ = __add__
+    
+    def __sub__(self, other):
+        return self._apply(operator.sub, other)
+    
+    def __rsub__(self, other):
+        return -self + other
+    
+    def __mul__(self, other):
+        return self._apply(operator.mul, other)
+    
+    __rmul__ = __mul__
+    
+    def __neg__(self):
+        return _NodeValues([-x for x in self.values])
+
+def gauss_legendre_degree(max_mu_m, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+    """
+    Returns the lowest `mpmath` Gauss-Legendre degree (with `3*2**(degree-1)`
+    nodes) able to integrate products of mode shapes with roots up to
+    `max_mu_m` to `decimal_precision` digits
+    """
+    max_mu_m = max(float(max_mu_m), 1.)
+    degree = 1
+    while True:
+        nodes = 3 * 2**(degree-1)
+        ratio = 4.*nodes / (math.e*max_mu_m)
+        if ratio > 1 and 2*nodes*math.log10(ratio) >= decimal_precision:
+            return degree
+        
+        degree += 1
+
+def integrate_matrix(integral, beam_type, a, max_mode=DEFAULT_MAX_MODE, decimal_precision=DEFAULT_DECIMAL_PRECISION, module='mpmath', degree=None):
+    """
+    Integrates `integral` for all `(m, n)` mode pairs up to `max_mode` with a
+    single Gauss-Legendre rule, evaluating each mode shape only once at its
+    nodes. Returns a `max_mode x max_mode` `mpmath` matrix, or a NumPy array
+    of floats if `module='numpy'`.
+    """
+    if set(integral.used_variables) != set(['m', 'n']):
+        raise ValueError("%s: only integrals of modes 'm' and 'n' are supported" % integral)
+    
+    if module not in ('mpmath', 'numpy'):
+        raise ValueError("Unsupported module '%s', expected one of: mpmath, numpy" % module)
+    
+    if module == 'numpy' and numpy is None: #pragma: no cover
+        raise ImportError("NumPy is required to integrate into 'numpy' matrices")
+    
+    modes = range(1, max_mode+1)
+    roots = dict((mode, find_best_root(beam_type, mode, decimal_precision)) for mode in modes)
+    
+    # Extra working precision absorbs the cancellation of the exponentially
+    # growing terms, which is done separately for each mode
+    working_precisions = dict(
+        (mode, decimal_precision + estimate_cancellation_digits(
+            beam_type.mode_shape(mode), {'y': 'a', 'mu_m': roots[mode]}
+        ))
+        for mode in modes
+    )
+    
+    degree = degree or gauss_legendre_degree(max(roots.values()), decimal_precision)
+    with mpmath.workdps(max(working_precisions.values())):
+        nodes = GaussLegendre(mpmath.mp).calc_nodes(degree, mpmath.mp.prec)
+        half_a = mpmath.mpf(a) / 2
+        ys = [(x+1) * half_a for x, _ in nodes]
+        weights = [w * half_a for _, w in nodes]
+    
+    node_values_cache = {}
+    def node_values(order):
+        def wrapper(mode):
+            key = (mode, order)
+            if key not in node_values_cache:
+                expr = beam_type.mode_shape(mode, order)
+                f = compile_function(
+                    expr, ('y',), 'mpmath', working_precisions[mode],
+                    constants={'mu_m': roots[mode], 'a': a}
+                )
+                with mpmath.workdps(working_precisions[mode]):
+                    values = [f(y) for y in ys]
+                
+                if module == 'numpy':
+                    node_values_cache[key] = numpy.array([float(x) for x in values])
+                else:
+                    node_values_cache[key] = _NodeValues(values)
+            
+            return node_values_cache[key]
+        
+        return wrapper
+    
+    Y_m, dY_m, ddY_m = node_values(0), node_values(1), node_values(2)
+    symmetric = isinstance(integral, BaseIntegralWithSymetricVariables)
+    
+    if module == 'numpy':
+        result = numpy.empty((max_mode, max_mode))
+        weights = numpy.array([float(w) for w in weights])
+        dot = lambda values: numpy.dot(weights, values)
+    else:
+        result = mpmath.matrix(max_mode)
+        dot = lambda values: mpmath.fdot(weights, values.values)
+    
+    with mpmath.workdps(decimal_precision):
+        for m in modes:
+            for n in modes:
+                if symmetric and n < m: # Already computed in the upper triangle
+                    result[m-1, n-1] = result[n-1, m-1]
+                    continue
+                
+                result[m-1, n-1] = dot(integral._integrand(Y_m, dY_m, ddY_m, m, None, None, n))
+    
+    return result
+
+
+class IntegralsCache(object):
+    disk_cache_dir = os.path.join(PROJECT_SETTINGS_DIR, 'cache', 'integrals')
+    _ram_cache = {}
+    
+    def __init__(self, disk_cache_dir=None):
+        self.disk_cache_dir = disk_cache_dir or self.disk_cache_dir
+        if not os.path.exists(self.disk_cache_dir):
+            os.makedirs(self.disk_cache_dir)
+    
+    def disk_cache_filename(self, a=1., decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        return os.path.join(
+            self.disk_cache_dir,
+            "integrals.a=%r.decimal-precision=%d.pickle" % (float(a), decimal_precision)
+        )
+    
+    def regenerate(self, max_mode=DEFAULT_MAX_MODE, a=1., decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
+        kwargs.setdefault('method', 'analytic')
+        
+        # Child integrals are resolved to their parents on lookup
+        results = {}
+        tasks = iterate_over_integrals(max_mode)
+        for task, result in integrate_many(tasks, a, decimal_precision, **kwargs):
+            integral_id, beam_type_id, m, t, v, n = task
+            integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+            
+            mode_key_to_result = results.setdefault(integral_id, {}).setdefault(beam_type_id, {})
+            mode_key_to_result[integral.mode_key(m, t, v, n)] = result
+        
+        filename = self.disk_cache_filename(a, decimal_precision)
+        with locked(filename):
+            write_atomically(filename, lambda f: pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL))
+        
+        cache_key = (float(a), decimal_precision)
+        if cache_key in self._ram_cache: # Clear out the old RAM cache
+            del self._ram_cache[cache_key]
+    
+    def _load_disk_cache(self, a=1., decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        filename = self.disk_cache_filename(a, decimal_precision)
+        try:
+            with open(filename, 'rb') as f:
+                self._ram_cache[(float(a), decimal_precision)] = pickle.load(f)
+        except (IOError, pickle.UnpicklingError), e:
+            raise exc.UnableToLoadIntegralsCacheError(
+                "Unable to load cache from '%s': %s. You'll need to "\
+                "regenerate the cache by calling the console app "\
+                "'beam_integrals integrals-regenerate-cache' or by using "\
+                "'beam_integrals.integrals.integrals_cache.regenerate' "\
+                "Python API call." %
+                (filename, e)
+            )
+    
+    def get(self, integral, beam_type, a=1., m=None, t=None, v=None, n=None, decimal_precision=DEFAULT_DECIMAL_PRECISION):
+        cache_key = (float(a), decimal_precision)
+        if cache_key not in self._ram_cache:
+            self._load_disk_cache(a, decimal_precision)
+        
+        mode_key = integral.mode_key(m, t, v, n)
+        if not all(mode > 0 for mode in mode_key):
+            raise exc.InvalidModeError("Modes have to be positive numbers (%s given)" % (mode_key,))
+        
+        try:
+            return self._ram_cache[cache_key][integral.root_id()][beam_type.id][mode_key]
+        except KeyError:
+            raise exc.IntegralNotFoundInCacheError(
+                "No %s found in cache for %s when modes = %s. You'll need to "\
+                "regenerate the cache by calling the console app "\
+                "'beam_integrals integrals-regenerate-cache' or by using "\
+                "'beam_integrals.integrals.integrals_cache.regenerate' "\
+                "Python API call. Please remember to increase max_mode to the "\
+                "desired limit." %
+                (integral, beam_type, mode_key)
+            )
+
+
+integrals_cache = IntegralsCache()
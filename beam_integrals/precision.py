@@ -0,0 +1,140 @@
+"""
+Plans the lowest decimal precision needed for a target accuracy, so low modes
+don't have to be computed at the precision the highest modes need.
+"""
+import math
+from sympy import Float, mpmath
+from . import DEFAULT_DECIMAL_PRECISION
+from .compilers import estimate_cancellation_digits
+from .integrals import integrate
+
+
+# Safety margin on top of the estimated digit losses
+GUARD_DIGITS = 3
+
+MIN_DECIMAL_PRECISION = 15
+
+# Bound of the `Y_m` magnitude, so that `|Y_m^(k)| <= MODE_SHAPE_BOUND*(mu_m/a)**k`
+MODE_SHAPE_BOUND = 3
+
+
+def _digits(x):
+    return int(math.ceil(math.log10(x))) if x > 1 else 0
+
+def mu_m_estimate(beam_type, mode):
+    """Cheap estimate of `mu_m`, good enough for planning the precision"""
+    return float(beam_type.mu_m_initial_guess(mode))
+
+def root_condition_digits(beam_type, mode):
+    """
+    Decimal digits of `mu_m` lost to the conditioning of the characteristic
+    equation root, relative to the decimal precision it was found at
+    """
+    # Special case for these modes, as their `mu_m` is exact
+    if mode in beam_type.dont_improve_mu_m_for_modes:
+        return 0
+
+    mu = mu_m_estimate(beam_type, mode)
+
+    # Rounding error of the characteristic function grows with its terms
+    scale_digits = estimate_cancellation_digits(beam_type.characteristic_function, {'mu_m': mu})
+    working_precision = MIN_DECIMAL_PRECISION + scale_digits
+    f = beam_type.compiled_characteristic_function(1, working_precision)
+    with mpmath.workdps(working_precision):
+        slope = abs(f(mpmath.mpf(mu)))
+
+    # Absolute error of `mu_m`, in units of the decimal precision, combines the
+    # rounding of `mu_m` itself and the rounding of the characteristic function
+    return _digits(mu + float(10**scale_digits / slope))
+
+def mode_digits_lost(beam_type, mode, order=0):
+    """
+    Decimal digits lost when evaluating the `order`-th derivative of `Y_m`,
+    to both the root conditioning and the cancellation of growing terms
+    """
+    mu = max(mu_m_estimate(beam_type, mode), 1.)
+    return root_condition_digits(beam_type, mode) + estimate_cancellation_digits(
+        beam_type.mode_shape(mode, order), {'y': 'a', 'mu_m': mu}
+    )
+
+def mode_decimal_precision(beam_type, mode, accuracy, order=0, a=1.):
+    """
+    Returns the decimal precision needed to evaluate the `order`-th derivative
+    of `Y_m` to the absolute `accuracy`
+    """
+    magnitude = MODE_SHAPE_BOUND * (max(mu_m_estimate(beam_type, mode), 1.)/a)**order
+    return max(
+        MIN_DECIMAL_PRECISION,
+        _digits(magnitude/accuracy) + mode_digits_lost(beam_type, mode, order) + GUARD_DIGITS
+    )
+
+def magnitude_bound(integral, beam_type, a, m=None, t=None, v=None, n=None):
+    """
+    Estimates the upper bound of the integral magnitude, from the bounds of
+    the mode shapes and their derivatives
+    """
+    a = float(a)
+    def bound(order):
+        return lambda mode: MODE_SHAPE_BOUND * (max(mu_m_estimate(beam_type, mode), 1.)/a)**order
+
+    return abs(a * integral._integrand(bound(0), bound(1), bound(2), m, t, v, n))
+
+def _digits_lost(beam_type, m, t, v, n):
+    # All derivatives used by the integrals are covered by the 2nd derivative
+    return max(
+        mode_digits_lost(beam_type, mode, order)
+        for mode in set([m, t, v, n]) - set([None])
+        for order in range(3)
+    )
+
+def plan_decimal_precision(integral, beam_type, a, m=None, t=None, v=None, n=None, accuracy=None, relative_accuracy=None):
+    """
+    Returns the lowest decimal precision integrating to the absolute
+    `accuracy`, or to the `relative_accuracy` of the integral magnitude bound
+    """
+    if (accuracy is None) == (relative_accuracy is None):
+        raise ValueError("Exactly one of 'accuracy' or 'relative_accuracy' is required")
+
+    magnitude = magnitude_bound(integral, beam_type, a, m, t, v, n)
+    if accuracy is None:
+        accuracy = relative_accuracy * magnitude
+
+    return max(
+        MIN_DECIMAL_PRECISION,
+        _digits(magnitude/accuracy) + _digits_lost(beam_type, m, t, v, n) + GUARD_DIGITS
+    )
+
+def integrate_to_accuracy(integral, beam_type, a, m=None, t=None, v=None, n=None, accuracy=None, relative_accuracy=None, max_decimal_precision=DEFAULT_DECIMAL_PRECISION, **kwargs):
+    """
+    Integrates at the lowest decimal precision meeting the absolute `accuracy`
+    or the `relative_accuracy` of the integral magnitude bound, as planned by
+    `plan_decimal_precision`. Precision is raised when the
+    achieved error falls short, up to `max_decimal_precision`. Returns a
+    `(result, error, decimal_precision)` tuple, where `error` is the achieved
+    error estimate.
+    """
+    kwargs.setdefault('method', 'analytic')
+
+    decimal_precision = min(
+        max_decimal_precision,
+        plan_decimal_precision(integral, beam_type, a, m, t, v, n, accuracy, relative_accuracy)
+    )
+    digits_lost = _digits_lost(beam_type, m, t, v, n)
+    magnitude = magnitude_bound(integral, beam_type, a, m, t, v, n)
+
+    # Same target as planned, as results of orthogonal modes are close to 0
+    target = accuracy if accuracy is not None else relative_accuracy * magnitude
+
+    while True:
+        result, error = integrate(
+            integral, beam_type, a, m, t, v, n, decimal_precision, error=True, **kwargs
+        )
+
+        # Add the propagated rounding error of the roots and mode shapes
+        error += Float(magnitude * 10**(digits_lost-decimal_precision), decimal_precision)
+
+        if error <= target or decimal_precision >= max_decimal_precision:
+            return result, error, decimal_precision
+
+        missing_digits = _digits(float(error/target))
+        decimal_precision = min(max_decimal_precision, decimal_precision + max(missing_digits, GUARD_DIGITS))
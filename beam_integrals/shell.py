@@ -2,7 +2,10 @@
 import argparse
 import sys
 import beam_integrals as b
+from beam_integrals import beam_types
 from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals import chebyshev
+from beam_integrals import integrals
 from beam_integrals.exceptions import ShellCommandError
 
 
@@ -97,15 +100,92 @@ class Shell(object):
     
     @arg('--max-mode', metavar='<mode>', type=int, default=b.DEFAULT_MAX_MODE, help='Maximum mode')
     @arg('--decimal-precision', metavar='<precision>', type=int, default=b.DEFAULT_DECIMAL_PRECISION, help='Decimal precision')
+    @arg('--extend', action='store_true', help='Only find the roots missing from the existing cache')
+    @arg('--resume', action='store_true', help='Reuse the roots already found by an interrupted regeneration')
+    @arg('--processes', metavar='<processes>', type=int, default=None, help='Number of worker processes (defaults to the number of CPUs)')
     def do_best_roots_of_characteristic_equations_regenerate_cache(self, args):
         """
         Regenerate the best roots of characteristic equations cache, for all
         supported beam types
         """
-        ces.best_roots_cache.regenerate(
+        if args.extend and args.resume:
+            raise ShellCommandError("'--extend' and '--resume' can't be used together")
+        
+        kwargs = dict(
+            max_mode=args.max_mode,
+            decimal_precision=args.decimal_precision,
+            processes=args.processes,
+            progress=print_progress
+        )
+        if args.extend:
+            ces.best_roots_cache.extend(**kwargs)
+        else:
+            ces.best_roots_cache.regenerate(resume=args.resume, **kwargs)
+    
+    def do_best_roots_of_characteristic_equations_convert_cache(self, args):
+        """
+        Convert the old pickled best roots of characteristic equations caches
+        into the indexed format
+        """
+        ces.best_roots_cache.convert_legacy_disk_caches()
+    
+    @arg('--max-order', metavar='<order>', type=int, default=beam_types.DerivativesCache.max_order, help='Maximum derivative order')
+    def do_mode_shape_derivatives_regenerate_cache(self, args):
+        """
+        Regenerate the mode shape derivatives cache, for all supported beam
+        types
+        """
+        beam_types.derivatives_cache.regenerate(max_order=args.max_order)
+    
+    @arg('--max-mode', metavar='<mode>', type=int, default=b.DEFAULT_MAX_MODE, help='Maximum mode')
+    @arg('--decimal-precision', metavar='<precision>', type=int, default=b.DEFAULT_DECIMAL_PRECISION, help='Decimal precision')
+    def do_chebyshev_series_regenerate_cache(self, args):
+        """
+        Regenerate the cache of mode shape Chebyshev series, for all supported
+        beam types
+        """
+        chebyshev.chebyshev_cache.regenerate(
             max_mode=args.max_mode,
             decimal_precision=args.decimal_precision
         )
+    
+    @arg('--max-mode', metavar='<mode>', type=int, default=b.DEFAULT_MAX_MODE, help='Maximum mode')
+    @arg('--a', metavar='<length>', type=float, default=1., help='Beam length')
+    @arg('--decimal-precision', metavar='<precision>', type=int, default=b.DEFAULT_DECIMAL_PRECISION, help='Decimal precision')
+    def do_integrals_regenerate_cache(self, args):
+        """
+        Regenerate the integrals cache, for all supported integrals and beam
+        types
+        """
+        integrals.integrals_cache.regenerate(
+            max_mode=args.max_mode,
+            a=args.a,
+            decimal_precision=args.decimal_precision
+        )
+    
+    @arg('--max-mode', metavar='<mode>', type=int, default=b.DEFAULT_MAX_MODE, help='Maximum mode')
+    @arg('--a', metavar='<length>', type=float, default=1., help='Beam length')
+    @arg('--decimal-precision', metavar='<precision>', type=int, default=b.DEFAULT_DECIMAL_PRECISION, help='Decimal precision')
+    @arg('--processes', metavar='<processes>', type=int, default=None, help='Number of worker processes (defaults to the number of CPUs)')
+    def do_integrate_many(self, args):
+        """
+        Integrate all supported integrals and beam types in parallel, printing
+        "integral_id,beam_type_id,m,t,v,n,result" lines
+        """
+        tasks = integrals.iterate_over_integrals(args.max_mode)
+        results = integrals.integrate_many(
+            tasks, args.a, args.decimal_precision, processes=args.processes
+        )
+        for task, result in results:
+            values = ['' if x is None else str(x) for x in task + (result,)]
+            print ','.join(values)
+            sys.stdout.flush()
+
+
+def print_progress(done, total, eta):
+    print >> sys.stderr, "\r%d/%d roots found, ETA %ds" % (done, total, eta),
+    if done == total:
+        print >> sys.stderr
 
 
 def main(): #pragma: no cover
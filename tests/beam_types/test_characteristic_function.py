@@ -0,0 +1,33 @@
+from nose_extra_tools import assert_almost_equal, assert_is #@UnresolvedImport
+from sympy import diff, Float, mpmath
+from beam_integrals import mu_m
+from beam_integrals.beam_types import BaseBeamType
+import tests as t
+
+
+MU_M_VALUES = ('0.5', '4.73004074486270402602404810083388868', '30.25')
+
+
+def test_compiled_characteristic_function():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for order in (0, 1, 2):
+            yield check_compiled_characteristic_function, beam_type_id, order
+
+def check_compiled_characteristic_function(beam_type_id, order):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    compiled = beam_type.compiled_characteristic_function(order, t.DECIMAL_PRECISION)
+    expr = diff(beam_type.characteristic_function, mu_m, order)
+    
+    # Compare with plenty of guard digits, as `cosh` grows exponentially
+    working_precision = 2*t.DECIMAL_PRECISION
+    for value in MU_M_VALUES:
+        with mpmath.workdps(working_precision):
+            result = compiled(mpmath.mpf(value))
+        
+        expected = expr.evalf(n=working_precision, subs={'mu_m': Float(value, working_precision)})
+        assert_almost_equal(result, expected, delta=t.MAX_ERROR_TOLERANCE)
+    
+    # Continuous cache hits should return same objects
+    cache_hit = beam_type.compiled_characteristic_function(order, t.DECIMAL_PRECISION)
+    assert_is(cache_hit, compiled)
@@ -0,0 +1,81 @@
+from nose.tools import eq_, raises
+from nose.plugins.skip import SkipTest
+from nose_extra_tools import assert_almost_equal, assert_is #@UnresolvedImport
+import shutil
+from sympy import Float
+import tempfile
+from beam_integrals import a, y, mu_m
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals import beam_types
+from beam_integrals.beam_types import BaseBeamType
+import tests as t
+
+
+# Lower than defaults to speed up tests
+MAX_MODE = 3
+DECIMAL_PRECISION = 30
+
+A = 2.5
+Y_VALUES = (0., 0.25, 1.125, 2.5) # Exact in binary, so all paths see the same `y`
+
+
+def setup():
+    global disk_cache_dir, _old_best_roots_cache
+    
+    _old_best_roots_cache = ces.best_roots_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    ces.best_roots_cache = ces.BestRootsCache(disk_cache_dir)
+    ces.best_roots_cache.regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+def teardown():
+    ces.best_roots_cache = _old_best_roots_cache
+    shutil.rmtree(disk_cache_dir)
+
+def expected_value(beam_type, mode, order, y_value):
+    expr = beam_type.Y_m_derivative_from_cache(mode, order) if order else beam_type.Y_m(mode)
+    root = ces.find_best_root(beam_type, mode, DECIMAL_PRECISION)
+    return expr.subs({
+        mu_m: root,
+        a: Float(A, DECIMAL_PRECISION),
+        y: Float(y_value, DECIMAL_PRECISION),
+    }).evalf(n=DECIMAL_PRECISION)
+
+def test_evaluate():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for order in range(3):
+            for dtype in ('float64', 'mpf'):
+                yield check_evaluate, beam_type_id, order, dtype
+
+def check_evaluate(beam_type_id, order, dtype):
+    if dtype == 'float64' and beam_types.numpy is None:
+        raise SkipTest
+    
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    modes = range(1, MAX_MODE+1)
+    result = beam_type.evaluate(modes, Y_VALUES, order, A, dtype, DECIMAL_PRECISION)
+    
+    if dtype == 'float64':
+        eq_(result.shape, (len(modes), len(Y_VALUES)))
+        # Cancellation of the exponentially growing terms is allowed to wipe
+        # out some of the `float64` accuracy
+        tolerance = lambda expected: \
+            10**(beam_types.MAX_FLOAT64_CANCELLATION_DIGITS-15) * max(1, abs(float(expected)))
+    else:
+        eq_((result.rows, result.cols), (len(modes), len(Y_VALUES)))
+        tolerance = lambda expected: t.MAX_ERROR_TOLERANCE * max(1, abs(expected))
+    
+    for i, mode in enumerate(modes):
+        for j, y_value in enumerate(Y_VALUES):
+            expected = expected_value(beam_type, mode, order, y_value)
+            assert_almost_equal(result[i, j], expected, delta=tolerance(expected))
+
+def test_compiled_mode_shapes_are_shared():
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    assert_is(
+        beam_type.compiled_mode_shape(1, 1, 'mpmath', DECIMAL_PRECISION),
+        beam_type.compiled_mode_shape(2, 1, 'mpmath', DECIMAL_PRECISION)
+    )
+
+@raises(ValueError)
+def test_unsupported_dtype():
+    BaseBeamType.coerce(1).evaluate([1], Y_VALUES, dtype='float32') #@UndefinedVariable
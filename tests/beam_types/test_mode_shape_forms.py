@@ -0,0 +1,50 @@
+from nose.tools import raises
+from nose_extra_tools import assert_almost_equal, assert_equal, assert_is #@UnresolvedImport
+from sympy import mpmath
+from beam_integrals.beam_types import BaseBeamType, MODE_SHAPE_FORMS
+from beam_integrals.compilers import compile_function, estimate_cancellation_digits
+
+
+MODES = (1, 2, 3) # Covers all mode-specific boundary conditions
+MU_M_VALUES = (4.7, 37.3, 150.2) # Forms are equal for any `mu_m`, not only roots
+Y_VALUES = (0., 0.3, 1.1, 2.5)
+A = 2.5
+
+# `standard` form needs to absorb the cancellation of `exp(mu_m)` sized terms
+REFERENCE_PRECISION = 100
+
+
+def test_decaying_form():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for mode in MODES:
+            for order in range(3):
+                yield check_decaying_form, beam_type_id, mode, order
+
+def check_decaying_form(beam_type_id, mode, order):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    decaying = beam_type.mode_shape(mode, order, 'decaying')
+    
+    # No cancellation, so `float64` is enough
+    assert_equal(estimate_cancellation_digits(decaying, {'y': 'a', 'mu_m': max(MU_M_VALUES)}), 0)
+    
+    expected_f = compile_function(
+        beam_type.mode_shape(mode, order, 'standard'), ('mu_m', 'y', 'a'),
+        'mpmath', REFERENCE_PRECISION
+    )
+    f = compile_function(decaying, ('mu_m', 'y', 'a'), 'math')
+    for mu_m in MU_M_VALUES:
+        for y in Y_VALUES:
+            with mpmath.workdps(REFERENCE_PRECISION):
+                expected = expected_f(mpmath.mpf(mu_m), mpmath.mpf(y), mpmath.mpf(A))
+            
+            # Derivatives scale with `mu_m**order`
+            assert_almost_equal(f(mu_m, y, A), float(expected), delta=1e-13 * mu_m**order)
+
+def test_caching():
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    for form in MODE_SHAPE_FORMS:
+        assert_is(beam_type.mode_shape(2, 1, form), beam_type.mode_shape(2, 1, form))
+
+@raises(ValueError)
+def test_unsupported_form():
+    BaseBeamType.coerce(2).mode_shape(2, 0, 'unknown') #@UndefinedVariable
@@ -1,19 +1,37 @@
-from nose.tools import eq_
+import mock
+from nose.tools import eq_, raises
 from nose_extra_tools import assert_is #@UnresolvedImport
+import shutil
 from sympy import diff
+import tempfile
 from beam_integrals import y
-from beam_integrals.beam_types import BaseBeamType
+from beam_integrals import beam_types
+from beam_integrals.beam_types import BaseBeamType, DerivativesCache
 import tests as t
 
 
-def setup():
-    # Clear the derivative caches before any tests
+def clear_ram_caches():
     for beam_type in BaseBeamType.plugins.instances: #@UndefinedVariable
         beam_type._Y_m_derivatives_cache = None
 
+def setup():
+    global disk_cache_dir, _old_derivatives_cache
+    
+    _old_derivatives_cache = beam_types.derivatives_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    beam_types.derivatives_cache = DerivativesCache(disk_cache_dir)
+    
+    # Clear the derivative caches before any tests
+    clear_ram_caches()
+
+def teardown():
+    beam_types.derivatives_cache = _old_derivatives_cache
+    clear_ram_caches()
+    shutil.rmtree(disk_cache_dir)
+
 def test_caching():
     modes = range(1, t.MAX_MODE+1)
-    orders = range(1, BaseBeamType._Y_M_DERIVATIVES_CACHE_MAX_ORDER+1)
+    orders = range(1, beam_types.derivatives_cache.max_order+1)
     for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
         for mode in modes:
             for order in orders:
@@ -29,3 +47,57 @@ def check_caching(beam_type_id, mode, order):
     # Continuous cache hits should return same objects
     cache_hit = beam_type.Y_m_derivative_from_cache(mode, order)
     assert_is(cache_hit, cached_derivative)
+
+def test_derivatives_are_loaded_from_disk():
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    expected = beam_types.derivatives_cache.get(beam_type, 3, 3)
+    beam_types.derivatives_cache.flush()
+    
+    # New processes start off with an empty RAM cache
+    derivatives_cache = DerivativesCache(disk_cache_dir)
+    with mock.patch.object(beam_types, 'diff') as m:
+        eq_(derivatives_cache.get(beam_type, 3, 3), expected)
+    
+    eq_(m.call_count, 0)
+
+def test_stale_derivatives_are_differentiated_again():
+    beam_type = BaseBeamType.coerce(1) #@UndefinedVariable
+    derivatives_cache = DerivativesCache(disk_cache_dir)
+    derivatives_cache.get(beam_type, 1, 1)
+    derivatives_cache.flush()
+    
+    Y_m = 2*beam_type.Y_m(1)
+    with mock.patch.object(beam_type, 'Y_m', return_value=Y_m):
+        eq_(DerivativesCache(disk_cache_dir).get(beam_type, 1, 1), diff(Y_m, y))
+
+def test_derivatives_are_saved_in_batches():
+    beam_type = BaseBeamType.coerce(3) #@UndefinedVariable
+    derivatives_cache = DerivativesCache(tempfile.mkdtemp())
+    try:
+        with mock.patch.object(beam_types, 'write_atomically', wraps=beam_types.write_atomically) as m:
+            for order in (1, 2, 3):
+                derivatives_cache.get(beam_type, 2, order)
+            
+            eq_(m.call_count, 0)
+            
+            derivatives_cache.flush()
+            derivatives_cache.flush() # Nothing left to save
+            eq_(m.call_count, 1)
+        
+        eq_(len(DerivativesCache(derivatives_cache.disk_cache_dir)._read_disk_cache()), 3)
+    finally:
+        shutil.rmtree(derivatives_cache.disk_cache_dir)
+
+def test_regenerate():
+    derivatives_cache = DerivativesCache(tempfile.mkdtemp(), max_order=2)
+    try:
+        derivatives_cache.regenerate()
+        
+        # 2 forms and 2 orders of the 9 distinct mode shapes
+        eq_(len(DerivativesCache(derivatives_cache.disk_cache_dir)._read_disk_cache()), 2*2*9)
+    finally:
+        shutil.rmtree(derivatives_cache.disk_cache_dir)
+
+@raises(ValueError)
+def test_unsupported_order():
+    beam_types.derivatives_cache.get(BaseBeamType.coerce(1), 1, beam_types.derivatives_cache.max_order+1) #@UndefinedVariable
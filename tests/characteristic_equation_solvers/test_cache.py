@@ -1,11 +1,17 @@
-from nose.tools import eq_, raises
-from nose_extra_tools import assert_is, assert_not_in #@UnresolvedImport
+import mock
+from nose.tools import assert_false, assert_raises, assert_true, eq_, raises
+from nose_extra_tools import assert_almost_equal, assert_greater_equal, assert_in, assert_is, assert_not_in #@UnresolvedImport
 import os
+import cPickle as pickle
 import shutil
 import tempfile
+import threading
+import time
+from sympy import Float, nan
 from beam_integrals import characteristic_equation_solvers as ces
 from beam_integrals import exceptions as exc
-from beam_integrals.beam_types import SimplySupportedBeam
+from beam_integrals.beam_types import BaseBeamType, SimplySupportedBeam
+from beam_integrals.file_utils import locked
 
 
 class TestBestRootsCache(object):
@@ -23,6 +29,10 @@ class TestBestRootsCache(object):
         self.cache = ces.BestRootsCache(self.disk_cache_dir)
     
     def teardown(self):
+        # RAM cache is shared by all instances
+        for decimal_precision in (self.decimal_precision, 2*self.decimal_precision):
+            self.cache._ram_cache.pop(decimal_precision, None)
+        
         shutil.rmtree(self.disk_cache_dir)
     
     def regenerate_cache(self):
@@ -50,9 +60,11 @@ class TestBestRootsCache(object):
     @raises(exc.BeamTypeNotFoundInCacheError)
     def test_beam_type_not_found_in_cache_error(self):
         self.regenerate_cache()
-        self.cache._load_disk_cache(self.decimal_precision)
         
-        del self.cache._ram_cache[self.decimal_precision][self.beam_type.id]
+        results = self.cache._read_disk_cache(self.decimal_precision)
+        del results[self.beam_type.id]
+        self.cache._save_disk_cache(results, self.decimal_precision)
+        
         self.find_best_root()
     
     @raises(exc.ModeNotFoundInCacheError)
@@ -85,4 +97,359 @@ class TestBestRootsCache(object):
         
         beam_type_id_to_best_roots = self.cache._ram_cache[self.decimal_precision]
         for mode_list in beam_type_id_to_best_roots.values():
-            eq_(mode_list, sorted(mode_list))
+            eq_(list(mode_list), sorted(mode_list))
+    
+    def test_regenerate_with_precision_ladder(self):
+        self.regenerate_cache()
+        
+        decimal_precision = 2*self.decimal_precision
+        self.cache.regenerate(
+            self.max_mode, decimal_precision,
+            precision_ladder=True,
+            start_decimal_precision=self.decimal_precision
+        )
+        
+        for mode in range(1, self.max_mode+1):
+            expected = ces.find_best_root(self.beam_type, mode, decimal_precision, use_cache=False)
+            assert_almost_equal(
+                self.find_best_root(mode, decimal_precision), expected,
+                delta=10**-(decimal_precision-1)
+            )
+    
+    def test_regenerate_with_sweep(self):
+        self.cache.regenerate(self.max_mode, self.decimal_precision, sweep=True)
+        
+        for mode in range(1, self.max_mode+1):
+            expected = ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False)
+            assert_almost_equal(
+                self.find_best_root(mode), expected,
+                delta=10**-(self.decimal_precision-1)
+            )
+    
+    def test_regenerate_with_sweep_rejects_rootfinder_options(self):
+        for kwargs in (dict(race=True), dict(precision_ladder=True), dict(race_tolerance=1e-10)):
+            assert_raises(
+                ValueError, self.cache.regenerate, self.max_mode, self.decimal_precision,
+                sweep=True, **kwargs
+            )
+        
+        # Options matching the sweep are passed on
+        with mock.patch.object(ces, 'schedule_roots', wraps=ces.schedule_roots) as m:
+            self.cache.regenerate(
+                self.max_mode, self.decimal_precision, sweep=True, race=False,
+                start_decimal_precision=None
+            )
+        eq_(m.call_args[1]['race'], False)
+        assert_in('start_decimal_precision', m.call_args[1])
+    
+    def test_regenerate_resume(self):
+        journal_filename = self.cache.journal_filename(self.decimal_precision)
+        
+        # Mimics a regeneration interrupted after finding a single root
+        journaled = []
+        def interrupted(tasks, *args, **kwargs):
+            beam_type_id, mode, _ = tasks[0]
+            kwargs['callback'](beam_type_id, mode, (Float(mode), nan))
+            journaled.append((beam_type_id, mode))
+            raise KeyboardInterrupt
+        
+        with mock.patch.object(ces, 'schedule_roots', side_effect=interrupted):
+            assert_raises(KeyboardInterrupt, self.regenerate_cache)
+        with open(journal_filename, 'ab') as f:
+            f.write('1 2 f0') # Partially written entry
+        
+        with mock.patch.object(ces, 'schedule_roots', wraps=ces.schedule_roots) as m:
+            self.cache.regenerate(self.max_mode, self.decimal_precision, resume=True)
+        
+        # Journaled root is reused, instead of being found again
+        beam_type_id, mode = journaled[0]
+        assert_not_in(journaled[0], [task[:2] for task in m.call_args[0][0]])
+        beam_types_count = len(BaseBeamType.plugins.valid_ids) #@UndefinedVariable
+        eq_(len(m.call_args[0][0]), beam_types_count*self.max_mode - 1)
+        eq_(ces.find_best_root(
+            BaseBeamType.coerce(beam_type_id), mode, self.decimal_precision, #@UndefinedVariable
+            include_error=True, cache_instance=self.cache
+        ), (Float(mode), nan))
+        
+        # Journal is compacted into the cache
+        assert_false(os.path.exists(journal_filename))
+    
+    def test_regenerate_records_rootfinder_wins(self):
+        self.regenerate_cache()
+        
+        with open(self.cache.rootfinder_wins_filename(), 'rb') as f:
+            wins = pickle.load(f)
+        
+        # Lower modes of free-free beams are special, and never take the
+        # asymptotic fast path
+        assert_greater_equal(sum(wins[6].values()), self.max_mode)
+    
+    def test_extend(self):
+        self.regenerate_cache()
+        expected = [self.find_best_root(mode) for mode in range(1, self.max_mode+1)]
+        
+        with mock.patch.object(ces, 'schedule_roots', wraps=ces.schedule_roots) as m:
+            self.cache.extend(2*self.max_mode, self.decimal_precision)
+        
+        # Only the missing modes are computed
+        eq_(m.call_count, 1)
+        modes = [mode for _, mode, _ in m.call_args[0][0]]
+        eq_(sorted(set(modes)), range(self.max_mode+1, 2*self.max_mode+1))
+        
+        eq_([self.find_best_root(mode) for mode in range(1, self.max_mode+1)], expected)
+        for mode in range(self.max_mode+1, 2*self.max_mode+1):
+            assert_almost_equal(
+                self.find_best_root(mode),
+                ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False),
+                delta=10**-(self.decimal_precision-1)
+            )
+        
+        # Nothing left to compute
+        with mock.patch.object(ces, 'schedule_roots') as m:
+            self.cache.extend(2*self.max_mode, self.decimal_precision)
+        eq_(m.call_count, 0)
+        
+        # No temporary files left behind
+        eq_([f for f in os.listdir(self.disk_cache_dir) if f.startswith('tmp')], [])
+    
+    def test_extend_missing_beam_type(self):
+        self.regenerate_cache()
+        
+        # Mimics a cache generated before this beam type plugin was added
+        results = self.cache._read_disk_cache(self.decimal_precision)
+        del results[self.beam_type.id]
+        self.cache._save_disk_cache(results, self.decimal_precision)
+        
+        self.cache.extend(self.max_mode, self.decimal_precision)
+        assert_almost_equal(
+            self.find_best_root(),
+            ces.find_best_root(self.beam_type, self.max_mode, self.decimal_precision, use_cache=False),
+            delta=10**-(self.decimal_precision-1)
+        )
+    
+    def test_extend_empty_cache(self):
+        self.cache.extend(self.max_mode, self.decimal_precision, sweep=True)
+        assert_almost_equal(
+            self.find_best_root(),
+            ces.find_best_root(self.beam_type, self.max_mode, self.decimal_precision, use_cache=False),
+            delta=10**-(self.decimal_precision-1)
+        )
+    
+    def test_compute_on_miss(self):
+        self.cache.compute_on_miss = True
+        
+        # Cold start, leaving holes for the modes not asked for
+        mode = 2*self.max_mode
+        expected = ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False)
+        assert_almost_equal(self.find_best_root(mode), expected, delta=10**-(self.decimal_precision-1))
+        
+        # Written back to disk
+        self.cache._ram_cache.pop(self.decimal_precision, None)
+        self.cache.compute_on_miss = False
+        assert_almost_equal(self.find_best_root(mode), expected, delta=10**-(self.decimal_precision-1))
+        assert_raises(exc.ModeNotFoundInCacheError, self.find_best_root, 1)
+        
+        # Holes are filled in on demand
+        self.cache.compute_on_miss = True
+        assert_almost_equal(
+            self.find_best_root(1),
+            ces.find_best_root(self.beam_type, 1, self.decimal_precision, use_cache=False),
+            delta=10**-(self.decimal_precision-1)
+        )
+    
+    def test_prefetch(self):
+        self.cache.prefetch(self.max_mode, self.decimal_precision, [self.beam_type]).join()
+        
+        for mode in range(1, self.max_mode+1):
+            assert_almost_equal(
+                self.find_best_root(mode),
+                ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False),
+                delta=10**-(self.decimal_precision-1)
+            )
+        
+        # Only the other beam types are left to `extend`
+        with mock.patch.object(ces, 'schedule_roots', wraps=ces.schedule_roots) as m:
+            self.cache.extend(self.max_mode, self.decimal_precision)
+        assert_not_in(self.beam_type.id, [beam_type_id for beam_type_id, _, _ in m.call_args[0][0]])
+    
+    def test_convert_legacy_disk_caches(self):
+        self.regenerate_cache()
+        results = self.cache._read_disk_cache(self.decimal_precision)
+        
+        os.remove(self.cache.disk_cache_filename(self.decimal_precision))
+        with open(self.cache.legacy_disk_cache_filename(self.decimal_precision), 'wb') as f:
+            pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        
+        with assert_raises(exc.UnableToLoadBestRootsCacheError) as cm:
+            self.find_best_root()
+        assert_in('convert', str(cm.exception))
+        
+        eq_(self.cache.convert_legacy_disk_caches(), [self.decimal_precision])
+        eq_(self.cache._read_disk_cache(self.decimal_precision), results)
+    
+    @raises(exc.UnableToLoadBestRootsCacheError)
+    def test_unable_to_load_unsupported_cache_format(self):
+        with open(self.cache.disk_cache_filename(self.decimal_precision), 'wb') as f:
+            pickle.dump({}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        
+        self.find_best_root()
+    
+    def test_lower_precision_served_from_higher_precision_cache(self):
+        decimal_precision = 2*self.decimal_precision
+        self.cache.regenerate(self.max_mode, decimal_precision)
+        
+        for mode in range(1, self.max_mode+1):
+            expected = ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False)
+            assert_almost_equal(
+                self.find_best_root(mode), expected,
+                delta=10**-(self.decimal_precision-1)
+            )
+        
+        # Continuous cache hits should return same objects
+        assert_is(self.find_best_root(), self.find_best_root())
+        
+        # Higher precisions still aren't served
+        assert_raises(
+            exc.UnableToLoadBestRootsCacheError,
+            self.find_best_root, decimal_precision=decimal_precision+1
+        )
+    
+    def test_compute_on_miss_keeps_higher_precision_roots(self):
+        self.cache.regenerate(self.max_mode, 2*self.decimal_precision)
+        
+        # Missing mode is written to a new lower precision cache
+        self.cache.compute_on_miss = True
+        mode = self.max_mode+1
+        assert_almost_equal(
+            self.find_best_root(mode),
+            ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False),
+            delta=10**-(self.decimal_precision-1)
+        )
+        
+        # Which still holds the rounded down roots
+        self.cache._ram_cache.pop(self.decimal_precision, None)
+        self.cache.compute_on_miss = False
+        for mode in range(1, self.max_mode+1):
+            assert_almost_equal(
+                self.find_best_root(mode),
+                ces.find_best_root(self.beam_type, mode, self.decimal_precision, use_cache=False),
+                delta=10**-(self.decimal_precision-1)
+            )
+
+    
+    def run_concurrently(self, func, count=4):
+        threads = [threading.Thread(target=func) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        
+        time.sleep(0.2) # Give the threads time to block
+        
+        return threads
+    
+    def test_concurrent_regenerations_are_coalesced(self):
+        with mock.patch.object(self.cache, '_find_roots', wraps=self.cache._find_roots) as m:
+            with locked(self.cache.disk_cache_filename(self.decimal_precision)):
+                threads = self.run_concurrently(self.regenerate_cache)
+            
+            for thread in threads:
+                thread.join()
+        
+        eq_(m.call_count, 1)
+        self.find_best_root()
+    
+    def test_single_flight_loading(self):
+        self.regenerate_cache()
+        
+        with mock.patch.object(ces, 'RootsFile', wraps=ces.RootsFile) as m:
+            with self.cache._load_lock:
+                threads = self.run_concurrently(self.find_best_root)
+            
+            for thread in threads:
+                thread.join()
+        
+        eq_(m.call_count, 1)
+    
+    def test_cache_hits_take_the_fast_path(self):
+        self.regenerate_cache()
+        expected = self.find_best_root()
+        
+        with mock.patch.object(self.cache, '_get') as m:
+            eq_(self.find_best_root(), expected)
+        eq_(m.call_count, 0)
+    
+    def test_publish(self):
+        self.regenerate_cache()
+        
+        shared_roots = self.cache.publish(self.decimal_precision)
+        try:
+            eq_(shared_roots.filename, self.cache.disk_cache_filename(self.decimal_precision))
+            
+            # Mimics a worker attaching to the published roots
+            other_cache = ces.BestRootsCache(tempfile.mkdtemp())
+            shared_roots = pickle.loads(pickle.dumps(shared_roots))
+            shared_roots.attach(other_cache)
+            eq_(
+                ces.find_best_root(self.beam_type, self.max_mode, self.decimal_precision, cache_instance=other_cache),
+                self.find_best_root()
+            )
+        finally:
+            shared_roots.close()
+            shutil.rmtree(other_cache.disk_cache_dir)
+        
+        # Cache files are never removed
+        assert_true(os.path.exists(shared_roots.filename))
+    
+    def test_publish_rounded_down_roots(self):
+        self.cache.regenerate(self.max_mode, 2*self.decimal_precision)
+        self.cache._ram_cache.pop(self.decimal_precision, None)
+        
+        shared_roots = self.cache.publish(self.decimal_precision)
+        try:
+            shared_roots.attach(self.cache)
+            assert_almost_equal(
+                self.find_best_root(),
+                ces.find_best_root(self.beam_type, self.max_mode, self.decimal_precision, use_cache=False),
+                delta=10**-(self.decimal_precision-1)
+            )
+        finally:
+            shared_roots.close()
+        
+        # Temporary files are removed once closed
+        assert_false(os.path.exists(shared_roots.filename))
+
+def test_lru_dict():
+    d = ces._LRUDict(max_size=2)
+    d[1] = 'a'
+    d[2] = 'b'
+    d[1] # Most recently used
+    d[3] = 'c'
+    
+    eq_(sorted(d.keys()), [1, 3])
+    eq_(len(d), 2)
+    
+    d.get(1) # Most recently used
+    d[4] = 'd'
+    eq_(sorted(d.keys()), [1, 4])
+    
+    eq_(d.pop(4), 'd')
+    eq_(d.pop(4, None), None)
+    eq_(d.keys(), [1])
+
+def test_schedule_roots():
+    tasks = [
+        (beam_type_id, mode, None)
+        for beam_type_id in BaseBeamType.plugins.valid_ids #@UndefinedVariable
+        for mode in (1, 2, 3)
+    ]
+    progress = mock.Mock()
+    results = ces.schedule_roots(tasks, 15, processes=2, progress=progress)
+    
+    eq_(sorted(results), sorted((beam_type_id, mode) for beam_type_id, mode, _ in tasks))
+    for (beam_type_id, mode), result in results.items():
+        beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+        eq_(result, ces.find_best_root(beam_type, mode, 15, include_error=True, use_cache=False))
+    
+    # Progress is reported after each task, with the ETA reaching zero
+    eq_(progress.call_count, len(tasks))
+    done, total, eta = progress.call_args[0]
+    eq_((done, total, eta), (len(tasks), len(tasks), 0))
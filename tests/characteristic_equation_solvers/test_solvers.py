@@ -1,9 +1,15 @@
+import mock
+import multiprocessing.pool
 from nose.tools import raises
 from nose.plugins.skip import SkipTest
-from nose_extra_tools import assert_less_equal #@UnresolvedImport
+from nose.tools import eq_
+from nose_extra_tools import assert_almost_equal, assert_greater_equal, assert_in, assert_is_none, assert_less_equal #@UnresolvedImport
+from sympy import mpmath, pi
 from sympy.mpmath.libmp.libmpf import prec_to_dps
 from beam_integrals.beam_types import BaseBeamType
-from beam_integrals.characteristic_equation_solvers import find_best_root
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals.characteristic_equation_solvers import characteristic_function, find_asymptotic_root, find_best_root, BaseRootfinder, SecantRootfinder
+from beam_integrals import exceptions as exc
 import tests as t
 
 
@@ -53,3 +59,213 @@ def check_fail_for_ieee_754_floating_point_precision(binary_precision):
                 continue
             
             assert_less_equal(mu_m_error, t.MAX_ERROR_TOLERANCE)
+
+def test_characteristic_function_guard_digits():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        yield check_characteristic_function_guard_digits, beam_type_id
+
+def check_characteristic_function_guard_digits(beam_type_id):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    mu_m = beam_type.mu_m_initial_guess(3).evalf()
+    
+    # Report the working precision instead of evaluating
+    with mock.patch.object(beam_type, 'compiled_characteristic_function', return_value=lambda mu_m: mpmath.mp.dps):
+        working_precision = ces.characteristic_function(beam_type, 15)(mu_m)
+    
+    assert_greater_equal(working_precision, 15 + ces.GUARD_DIGITS)
+
+def test_find_asymptotic_root():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for mode in (t.MAX_MODE/4, t.MAX_MODE/2, t.MAX_MODE):
+            yield check_find_asymptotic_root, beam_type_id, mode
+
+def check_find_asymptotic_root(beam_type_id, mode):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    mu_m, mu_m_error = find_asymptotic_root(beam_type, mode, t.DECIMAL_PRECISION)
+    expected, _ = SecantRootfinder()(beam_type, mode, t.DECIMAL_PRECISION)
+    
+    assert_almost_equal(mu_m, expected, delta=expected * 10**-(t.DECIMAL_PRECISION-1))
+    assert_less_equal(mu_m_error, t.MAX_ERROR_TOLERANCE)
+
+def test_find_asymptotic_root_gives_up():
+    # Special case for these modes, due to the mode-specific boundary condition
+    assert_is_none(find_asymptotic_root(BaseBeamType.coerce(6), 1)) #@UndefinedVariable
+    
+    # Convergence for lower modes is too slow to beat the decimal precision
+    assert_is_none(find_asymptotic_root(BaseBeamType.coerce(2), 1, max_terms=1)) #@UndefinedVariable
+
+def test_rootfinders_agree():
+    for solver_name in BaseRootfinder.plugins.valid_ids: #@UndefinedVariable
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            for mode in (1, 2, 3, t.MAX_MODE/10):
+                yield check_rootfinders_agree, solver_name, beam_type_id, mode
+
+def check_rootfinders_agree(solver_name, beam_type_id, mode):
+    rootfinder = BaseRootfinder.coerce(solver_name) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    mu_m, _ = rootfinder(beam_type, mode, t.DECIMAL_PRECISION)
+    expected, _ = SecantRootfinder()(beam_type, mode, t.DECIMAL_PRECISION)
+    
+    assert_almost_equal(mu_m, expected, delta=expected * 10**-(t.DECIMAL_PRECISION-1))
+
+def test_derivative_rootfinders_stop_early():
+    for solver_name in ('newton', 'halley'):
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            for mode in (1, 2, 3, 4, t.MAX_MODE/10):
+                yield check_derivative_rootfinders_stop_early, solver_name, beam_type_id, mode
+
+def check_derivative_rootfinders_stop_early(solver_name, beam_type_id, mode):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    if mode in beam_type.dont_improve_mu_m_for_modes:
+        raise SkipTest
+    
+    def count_evaluations(solver_name):
+        evaluations = []
+        def counted_characteristic_function(*args, **kwargs):
+            f = characteristic_function(*args, **kwargs)
+            def wrapper(mu_m):
+                evaluations.append(mu_m)
+                return f(mu_m)
+            
+            return wrapper
+        
+        with mock.patch.object(ces, 'characteristic_function', counted_characteristic_function):
+            BaseRootfinder.coerce(solver_name).improve_mu_m(beam_type, mode, t.DECIMAL_PRECISION) #@UndefinedVariable
+        
+        return len(evaluations)
+    
+    # Iterations have to stop at the rounding noise of the characteristic
+    # function, instead of running up to `max_iterations`
+    assert_less_equal(count_evaluations(solver_name), 2*count_evaluations('secant'))
+
+def test_precision_ladder():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for mode in (1, 2, 3, t.MAX_MODE/10):
+            yield check_precision_ladder, beam_type_id, mode
+
+def check_precision_ladder(beam_type_id, mode):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    def base_find_best_root(**kwargs):
+        return find_best_root(
+            beam_type,
+            mode,
+            t.DECIMAL_PRECISION,
+            include_error=True,
+            use_cache=False,
+            **kwargs
+        )
+    
+    mu_m, mu_m_error = base_find_best_root(precision_ladder=True)
+    expected, _ = base_find_best_root()
+    
+    assert_almost_equal(mu_m, expected, delta=expected * 10**-(t.DECIMAL_PRECISION-1))
+    
+    # Special case for this mode, don't check the `mu_m_error`
+    if mode not in beam_type.dont_improve_mu_m_for_modes:
+        assert_less_equal(mu_m_error, t.MAX_ERROR_TOLERANCE)
+
+def test_race():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for mode in (1, 2, 3):
+            for concurrently in (False, True):
+                yield check_race, beam_type_id, mode, concurrently
+
+def check_race(beam_type_id, mode, concurrently):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    solver_name, (mu_m, _) = ces.race_root_candidates(
+        beam_type, mode, t.DECIMAL_PRECISION, concurrent=concurrently
+    )
+    assert_in(solver_name, BaseRootfinder.plugins.valid_ids) #@UndefinedVariable
+    
+    expected = find_best_root(beam_type, mode, t.DECIMAL_PRECISION, use_cache=False)
+    assert_almost_equal(mu_m, expected, delta=expected * 10**-(t.DECIMAL_PRECISION-1))
+
+@mock.patch.object(multiprocessing.pool.Pool, 'terminate')
+def test_race_cancels_losing_rootfinders(m):
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    ces.race_root_candidates(beam_type, 1, t.DECIMAL_PRECISION, concurrent=True)
+    
+    # Terminating busy workers could deadlock the pool
+    eq_(m.call_count, 0)
+
+def test_races_share_a_pool():
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    ces.race_root_candidates(beam_type, 1, t.DECIMAL_PRECISION, concurrent=True)
+    
+    with mock.patch.object(multiprocessing, 'Pool') as m:
+        for mode in (2, 3):
+            solver_name, (mu_m, _) = ces.race_root_candidates(beam_type, mode, t.DECIMAL_PRECISION, concurrent=True)
+            
+            expected = find_best_root(beam_type, mode, t.DECIMAL_PRECISION, use_cache=False)
+            assert_almost_equal(mu_m, expected, delta=expected * 10**-(t.DECIMAL_PRECISION-1))
+    
+    eq_(m.call_count, 0)
+
+@raises(exc.RootfinderCancelledError)
+def test_cancelled_rootfinder():
+    rootfinder = SecantRootfinder()
+    rootfinder.cancelled = multiprocessing.Event()
+    rootfinder.cancelled.set()
+    
+    rootfinder(BaseBeamType.coerce(2), 1, t.DECIMAL_PRECISION) #@UndefinedVariable
+
+def test_race_records_wins():
+    old_rootfinder_wins = dict(ces.rootfinder_wins)
+    ces.rootfinder_wins.clear()
+    try:
+        beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+        find_best_root(beam_type, 1, t.DECIMAL_PRECISION, use_cache=False, race=True)
+        eq_(sum(ces.rootfinder_wins[beam_type.id].values()), 1)
+        
+        # Winner is tried first next time
+        winner = ces.rootfinder_wins[beam_type.id].keys()[0]
+        eq_(ces.preferred_rootfinders(beam_type)[0], winner)
+    finally:
+        ces.rootfinder_wins.clear()
+        ces.rootfinder_wins.update(old_rootfinder_wins)
+
+def test_enumerate_roots():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        yield check_enumerate_roots, beam_type_id
+
+def check_enumerate_roots(beam_type_id):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    max_mode = t.MAX_MODE/10
+    
+    results = ces.enumerate_roots(beam_type, max_mode, t.DECIMAL_PRECISION)
+    eq_(len(results), max_mode)
+    
+    for mode, (mu_m, mu_m_error) in enumerate(results, 1):
+        expected = find_best_root(beam_type, mode, t.DECIMAL_PRECISION, use_cache=False)
+        assert_almost_equal(mu_m, expected, delta=expected * 10**-(t.DECIMAL_PRECISION-1))
+        
+        # Special case for this mode, don't check the `mu_m_error`
+        if mode not in beam_type.dont_improve_mu_m_for_modes:
+            assert_less_equal(mu_m_error, t.MAX_ERROR_TOLERANCE)
+
+def test_sweep_brackets_skips_poles():
+    # `tan(mu_m) - tanh(mu_m)` changes sign at the poles of `tan(mu_m)` too
+    beam_type = BaseBeamType.coerce(4) #@UndefinedVariable
+    brackets = ces.sweep_brackets(beam_type, t.MAX_MODE)
+    
+    eq_(sorted(brackets), range(1, t.MAX_MODE+1))
+    for mode, (a, b) in brackets.items():
+        assert_less_equal(abs(beam_type.characteristic_function.subs('mu_m', (a+b)/2)), 10**-10)
+
+@raises(exc.MissingRootError)
+def test_sweep_brackets_missing_root_error():
+    beam_type = BaseBeamType.coerce(1) #@UndefinedVariable
+    
+    # Too wide a step steps over pairs of roots, as `sin(mu_m)` changes sign twice
+    with mock.patch.object(beam_type, 'mu_m_initial_search_width', 2*pi):
+        ces.sweep_brackets(beam_type, 10)
+
+@raises(exc.MultipleRootsError)
+def test_sweep_brackets_multiple_roots_error():
+    beam_type = BaseBeamType.coerce(1) #@UndefinedVariable
+    with mock.patch.object(beam_type, 'mu_m_initial_guess', lambda mode: 10*mode*pi):
+        ces.sweep_brackets(beam_type, 10)
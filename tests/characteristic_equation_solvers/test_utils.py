@@ -7,6 +7,8 @@ SOLVER_NAME_TO_CLASS = {
     'illinois': ces.IllinoisRootfinder,
     'pegasus': ces.PegasusRootfinder,
     'secant': ces.SecantRootfinder,
+    'newton': ces.NewtonRootfinder,
+    'halley': ces.HalleyRootfinder,
 }
 
 
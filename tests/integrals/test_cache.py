@@ -0,0 +1,139 @@
+import mock
+from nose.tools import assert_raises, eq_, raises
+from nose_extra_tools import assert_almost_equal, assert_is, assert_not_in #@UnresolvedImport
+import os
+import cPickle as pickle
+import shutil
+import tempfile
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals import exceptions as exc
+from beam_integrals.beam_types import ClampedClampedBeam
+from beam_integrals.integrals import BaseIntegral, IntegralsCache, integrate
+import tests
+
+
+class TestIntegralsCache(object):
+    def setup(self):
+        self.beam_type = ClampedClampedBeam()
+        
+        # Lower than defaults to speed up tests
+        self.max_mode = 2
+        self.decimal_precision = 15
+        self.a = 2.5
+        
+        self._old_best_roots_cache = ces.best_roots_cache
+        self.best_roots_cache_dir = tempfile.mkdtemp()
+        ces.best_roots_cache = ces.BestRootsCache(self.best_roots_cache_dir)
+        ces.best_roots_cache.regenerate(self.max_mode, self.decimal_precision)
+        
+        self.disk_cache_dir = os.path.join(
+            tempfile.mkdtemp(),
+            'need-a-non-existant-directory-for-100-percent-code-coverage'
+        )
+        self.cache = IntegralsCache(self.disk_cache_dir)
+    
+    def teardown(self):
+        # RAM cache is shared by all instances
+        self.cache._ram_cache.pop((self.a, self.decimal_precision), None)
+        
+        ces.best_roots_cache = self._old_best_roots_cache
+        shutil.rmtree(self.best_roots_cache_dir)
+        shutil.rmtree(self.disk_cache_dir)
+    
+    def regenerate_cache(self):
+        self.cache.regenerate(self.max_mode, self.a, self.decimal_precision)
+    
+    def get(self, integral_id=1, m=1, n=2, a=None, decimal_precision=None):
+        return self.cache.get(
+            BaseIntegral.coerce(integral_id), #@UndefinedVariable
+            self.beam_type,
+            a or self.a,
+            m=m, n=n,
+            decimal_precision=decimal_precision or self.decimal_precision
+        )
+    
+    @raises(exc.UnableToLoadIntegralsCacheError)
+    def test_unable_to_load_integrals_cache_error(self):
+        self.get()
+    
+    @raises(exc.InvalidModeError)
+    def test_invalid_mode_error(self):
+        self.regenerate_cache()
+        
+        self.get(m=0)
+    
+    @raises(exc.IntegralNotFoundInCacheError)
+    def test_integral_not_found_in_cache_error(self):
+        self.regenerate_cache()
+        
+        self.get(n=self.max_mode+1)
+    
+    @raises(exc.UnableToLoadIntegralsCacheError)
+    def test_different_decimal_precisions_dont_have_same_cache_key(self):
+        self.regenerate_cache()
+        
+        self.get(decimal_precision=self.decimal_precision+1)
+    
+    @raises(exc.UnableToLoadIntegralsCacheError)
+    def test_different_lengths_dont_have_same_cache_key(self):
+        self.regenerate_cache()
+        
+        self.get(a=self.a+1)
+    
+    def test_cached_results_match_integration(self):
+        self.regenerate_cache()
+        
+        for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+            integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+            for m, t, v, n in integral.iterate_over_used_variables(self.max_mode):
+                expected = integrate(
+                    integral, self.beam_type, self.a, m, t, v, n,
+                    self.decimal_precision
+                )
+                assert_almost_equal(
+                    self.get(integral_id, m, n), expected,
+                    delta=10**-(self.decimal_precision-5)
+                )
+    
+    def test_child_integrals_resolve_to_parents(self):
+        self.regenerate_cache()
+        
+        for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+            integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+            if integral.has_parent():
+                assert_is(self.get(integral_id), self.get(integral.root_id()))
+    
+    def test_symmetric_modes_share_results(self):
+        self.regenerate_cache()
+        
+        assert_is(self.get(1, m=1, n=2), self.get(1, m=2, n=1))
+    
+    def test_cached_get_returns_same_objects(self):
+        self.regenerate_cache()
+        
+        cache_hit_1 = self.get()
+        cache_hit_2 = self.get()
+        assert_is(cache_hit_1, cache_hit_2)
+    
+    def test_ram_cache_cleared_after_regeneration(self):
+        self.regenerate_cache()
+        
+        assert_not_in((self.a, self.decimal_precision), self.cache._ram_cache)
+    
+    def test_interrupted_regeneration_keeps_old_cache(self):
+        self.regenerate_cache()
+        expected = self.get()
+        self.cache._ram_cache.pop((self.a, self.decimal_precision))
+        
+        with mock.patch.object(pickle, 'dump', side_effect=IOError):
+            assert_raises(IOError, self.regenerate_cache)
+        
+        eq_(self.get(), expected)
+        
+        # Partially written temporary files are removed
+        filename = os.path.basename(self.cache.disk_cache_filename(self.a, self.decimal_precision))
+        eq_(sorted(os.listdir(self.disk_cache_dir)), [filename, filename + '.lock'])
+
+def test_mode_key():
+    eq_(BaseIntegral.coerce(1).mode_key(2, None, None, 1), (1, 2)) #@UndefinedVariable
+    eq_(BaseIntegral.coerce(3).mode_key(2, None, None, 1), (2, 1)) #@UndefinedVariable
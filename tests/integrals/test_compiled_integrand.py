@@ -0,0 +1,72 @@
+from nose_extra_tools import assert_almost_equal, assert_is #@UnresolvedImport
+import shutil
+from sympy import Float, mpmath
+import tempfile
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals.beam_types import BaseBeamType
+from beam_integrals.integrals import BaseIntegral
+import tests
+
+
+# Lower than defaults to speed up tests
+MAX_MODE = 2
+DECIMAL_PRECISION = 30
+
+A = 2.5
+Y_VALUES = (0.25, 1.125, 2.) # Exact in binary, so both paths see the same `y`
+
+
+def setup():
+    global disk_cache_dir, _old_best_roots_cache
+
+    _old_best_roots_cache = ces.best_roots_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    ces.best_roots_cache = ces.BestRootsCache(disk_cache_dir)
+    ces.best_roots_cache.regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+def teardown():
+    ces.best_roots_cache = _old_best_roots_cache
+    shutil.rmtree(disk_cache_dir)
+
+def test_compiled_integrand():
+    for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+        integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+
+        # Skip integrals with parents, as they behave the same
+        if integral.has_parent():
+            continue
+
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            for m, t, v, n in integral.iterate_over_used_variables(MAX_MODE):
+                yield check_compiled_integrand, integral_id, beam_type_id, m, t, v, n
+
+def check_compiled_integrand(integral_id, beam_type_id, m, t, v, n):
+    integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+
+    compiled = integral.compiled_integrand(beam_type, m, t, v, n, DECIMAL_PRECISION)
+    integrand = integral(beam_type, m, t, v, n, DECIMAL_PRECISION).subs('a', Float(A, DECIMAL_PRECISION))
+
+    for y in Y_VALUES:
+        expected = integrand.evalf(n=DECIMAL_PRECISION, subs={'y': y})
+        with mpmath.workdps(DECIMAL_PRECISION):
+            result = compiled(y, A)
+
+        assert_almost_equal(result, expected, delta=tests.MAX_ERROR_TOLERANCE)
+
+    # Continuous cache hits should return same objects
+    cache_hit = integral.compiled_integrand(beam_type, m, t, v, n, DECIMAL_PRECISION)
+    assert_is(cache_hit, compiled)
+
+def test_child_integrals_share_compiled_integrands():
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+        integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+        if not integral.has_parent():
+            continue
+
+        parent = BaseIntegral.coerce(integral.parent_id()) #@UndefinedVariable
+        assert_is(
+            integral.compiled_integrand(beam_type, 1, None, None, 2, DECIMAL_PRECISION),
+            parent.compiled_integrand(beam_type, 1, None, None, 2, DECIMAL_PRECISION)
+        )
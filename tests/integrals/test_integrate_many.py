@@ -0,0 +1,113 @@
+import mock
+import multiprocessing.pool
+from nose_extra_tools import assert_almost_equal, assert_equal, assert_true #@UnresolvedImport
+import shutil
+import tempfile
+from beam_integrals import beam_types
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals.beam_types import BaseBeamType, DerivativesCache
+from beam_integrals.chebyshev import ChebyshevCache
+from beam_integrals.integrals import _expected_cost, BaseIntegral, integrate, integrate_many, iterate_over_integrals
+
+
+# Lower than defaults to speed up tests
+MAX_MODE = 2
+DECIMAL_PRECISION = 15
+
+A = 2.5
+
+
+def setup():
+    global disk_cache_dir, _old_best_roots_cache
+    
+    _old_best_roots_cache = ces.best_roots_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    ces.best_roots_cache = ces.BestRootsCache(disk_cache_dir)
+    ces.best_roots_cache.regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+def teardown():
+    ces.best_roots_cache = _old_best_roots_cache
+    shutil.rmtree(disk_cache_dir)
+
+def test_iterate_over_integrals():
+    tasks = list(iterate_over_integrals(MAX_MODE))
+    
+    # Integrals with symmetric variables skip the equivalent modes
+    assert_equal(len(tasks), (3*3 + 2*4) * len(BaseBeamType.plugins.valid_ids)) #@UndefinedVariable
+    assert_equal(len(tasks), len(set(tasks)))
+
+def test_integrate_many():
+    tasks = list(iterate_over_integrals(MAX_MODE))
+    results = list(integrate_many(tasks, A, DECIMAL_PRECISION, processes=2, method='analytic'))
+    
+    # Most expensive tasks are done first, in a deterministic order
+    assert_equal([task for task, _ in results], sorted(tasks, key=_expected_cost, reverse=True))
+    assert_equal(results[0][0][2:], (MAX_MODE, None, None, MAX_MODE))
+    
+    for task, result in results:
+        integral_id, beam_type_id, m, t, v, n = task
+        expected = integrate(
+            BaseIntegral.coerce(integral_id), BaseBeamType.coerce(beam_type_id), #@UndefinedVariable
+            A, m, t, v, n, DECIMAL_PRECISION, method='analytic'
+        )
+        assert_almost_equal(result, expected, delta=10**-(DECIMAL_PRECISION-5))
+
+def test_integrate_many_by_quadrature():
+    tasks = list(iterate_over_integrals(MAX_MODE))[:4]
+    tasks.reverse() # Cheapest tasks come first
+    
+    results = list(integrate_many(tasks, A, DECIMAL_PRECISION, processes=2))
+    assert_equal([task for task, _ in results], sorted(tasks, key=_expected_cost, reverse=True))
+    
+    for task, result in results:
+        integral_id, beam_type_id, m, t, v, n = task
+        expected = integrate(
+            BaseIntegral.coerce(integral_id), BaseBeamType.coerce(beam_type_id), #@UndefinedVariable
+            A, m, t, v, n, DECIMAL_PRECISION
+        )
+        assert_almost_equal(result, expected, delta=10**-(DECIMAL_PRECISION-5))
+
+@mock.patch.object(multiprocessing.pool.Pool, 'terminate')
+def test_integrate_many_stopped_early(m):
+    tasks = list(iterate_over_integrals(MAX_MODE))
+    for _ in integrate_many(tasks, A, DECIMAL_PRECISION, processes=2, method='analytic'):
+        break
+    
+    # Terminating busy workers could deadlock the pool
+    assert_equal(m.call_count, 0)
+
+def test_integrate_many_saves_chebyshev_coefficients():
+    tasks = list(iterate_over_integrals(MAX_MODE))[:4]
+    list(integrate_many(tasks, A, DECIMAL_PRECISION, processes=2, method='chebyshev'))
+    
+    # Saved by the workers themselves, as they don't run the `atexit` handlers
+    assert_true(ChebyshevCache()._read_disk_cache(DECIMAL_PRECISION))
+
+def test_integrate_many_saves_derivatives():
+    tasks = [task for task in iterate_over_integrals(MAX_MODE) if task[0] == 2][:4]
+    derivatives_cache = DerivativesCache(tempfile.mkdtemp())
+    
+    # Workers start without any of the derivatives differentiated here before
+    patchers = [
+        mock.patch.object(beam_types, 'derivatives_cache', derivatives_cache),
+        mock.patch.dict(BaseIntegral._compiled_integrands_cache, clear=True),
+    ] + [
+        mock.patch.object(beam_type, '_Y_m_derivatives_cache', None)
+        for beam_type in BaseBeamType.plugins.instances #@UndefinedVariable
+    ]
+    for patcher in patchers:
+        patcher.start()
+    try:
+        list(integrate_many(tasks, A, DECIMAL_PRECISION, processes=2))
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+    
+    # Saved by the workers themselves, as they don't run the `atexit` handlers
+    try:
+        assert_true(derivatives_cache._read_disk_cache())
+    finally:
+        shutil.rmtree(derivatives_cache.disk_cache_dir)
+
+def test_integrate_many_without_tasks():
+    assert_equal(list(integrate_many([], A, DECIMAL_PRECISION)), [])
@@ -5,11 +5,11 @@ from nose_extra_tools import assert_almost_equal, assert_equal, assert_less_equa
 import shutil
 from sympy import Abs
 import tempfile
-from beam_integrals import a, mu_m
+from beam_integrals import a, y, mu_m
 from beam_integrals import characteristic_equation_solvers as ces
 from beam_integrals.beam_types import BaseBeamType
 from beam_integrals.exceptions import UnableToGuessScaleFunctionError
-from beam_integrals.integrals import BaseIntegral, integrate
+from beam_integrals.integrals import BaseIntegral, integrate, integrate_by_scaling
 import tests
 
 
@@ -158,6 +158,72 @@ def check_simply_supported_beam_closed_form(integral_id, m, t, v, n):
         })
         assert_almost_equal(result, closed_form_result, delta=tests.MAX_ERROR_TOLERANCE)
 
+def test_analytic_integration():
+    for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+        integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+        
+        # Skip integrals with parents, as they behave the same
+        if integral.has_parent():
+            continue
+        
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            # Clear out `cache_keys_seen` before testing a new
+            # beam_type/integral combination
+            cache_keys_seen.clear()
+            
+            for m, t, v, n in iterate_over_used_variables(integral):
+                yield check_analytic_integration, integral_id, beam_type_id, m, t, v, n
+
+def check_analytic_integration(integral_id, beam_type_id, m, t, v, n):
+    integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+    
+    cache_key = integral.cache_key(m, t, v, n, max_mode=tests.MAX_MODE)
+    if cache_key in cache_keys_seen: # Skip cached integrals
+        raise SkipTest
+    
+    cache_keys_seen.add(cache_key)
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    result = integrate(
+        integral, beam_type,
+        a=1.,
+        m=m, t=t, v=v, n=n,
+        decimal_precision=tests.DECIMAL_PRECISION,
+        method='analytic'
+    )
+    
+    # SPEED HACK: Quadrature already done in `test_integrate`
+    quad_result = integral_cache[integral_id][beam_type.id][(m, t, v, n)]
+    
+    assert_almost_equal(result, quad_result, delta=tests.MAX_ERROR_TOLERANCE)
+
+class TestAnalyticIntegrationFallback(object):
+    def setup(self):
+        class I99(BaseIntegral):
+            used_variables = ('m', 'n')
+            
+            def _integrand(self, Y_m, dY_m, ddY_m, m, t, v, n): #@UnusedVariable
+                # Has no closed form
+                return Y_m(m) * dY_m(n) / (1 + y)
+        
+        self.integral = I99()
+        self.beam_type = BaseBeamType.coerce(1) #@UndefinedVariable
+    
+    def teardown(self):
+        type(self.integral)._unregister_plugin() #@UndefinedVariable
+    
+    def test_fallback_to_quadrature(self):
+        def base_integrate(**kwargs):
+            return integrate(
+                self.integral, self.beam_type,
+                a=1.,
+                m=1, n=1,
+                decimal_precision=tests.DECIMAL_PRECISION,
+                **kwargs
+            )
+        
+        assert_equal(base_integrate(method='analytic'), base_integrate())
+
 def test_integral_scaling():
     for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
         integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
@@ -204,3 +270,35 @@ def check_integral_scaling(integral_id, beam_type_id, m, t, v, n):
     scaled_integral = normalized_integral * scale_by_value
     
     assert_almost_equal(scaled_integral, computed_integral, delta=ZERO_OUT_TRESHOLD)
+
+def test_integrate_by_scaling():
+    for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+        integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+        
+        # Skip integrals with parents, as they behave the same
+        if integral.has_parent():
+            continue
+        
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            for m, t, v, n in iterate_over_used_variables(integral):
+                yield check_integrate_by_scaling, integral_id, beam_type_id, m, t, v, n
+
+def check_integrate_by_scaling(integral_id, beam_type_id, m, t, v, n):
+    integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    # SPEED HACK: Closed-form integration has already been checked against
+    # the quadrature in `test_analytic_integration`
+    def base_integrate(func):
+        return func(
+            integral, beam_type, A, m, t, v, n,
+            decimal_precision=tests.DECIMAL_PRECISION,
+            method='analytic'
+        )
+    
+    # Also covers the direct integration fallback for the special modes
+    expected = base_integrate(integrate)
+    assert_almost_equal(
+        base_integrate(integrate_by_scaling), expected,
+        delta=tests.MAX_ERROR_TOLERANCE * max(1, Abs(expected))
+    )
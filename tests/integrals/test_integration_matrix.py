@@ -0,0 +1,69 @@
+from nose.plugins.skip import SkipTest
+from nose_extra_tools import assert_almost_equal, assert_equal #@UnresolvedImport
+import shutil
+import tempfile
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals.beam_types import BaseBeamType
+from beam_integrals.integrals import BaseIntegral, integrate, integrate_matrix, numpy
+import tests
+
+
+# Lower than defaults to speed up tests
+MAX_MODE = 4
+DECIMAL_PRECISION = 30
+
+A = 2.5
+
+
+def setup():
+    global disk_cache_dir, _old_best_roots_cache
+    
+    _old_best_roots_cache = ces.best_roots_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    ces.best_roots_cache = ces.BestRootsCache(disk_cache_dir)
+    ces.best_roots_cache.regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+def teardown():
+    ces.best_roots_cache = _old_best_roots_cache
+    shutil.rmtree(disk_cache_dir)
+
+def test_integrate_matrix():
+    for integral_id in BaseIntegral.plugins.valid_ids: #@UndefinedVariable
+        integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+        
+        # Skip integrals with parents, as they behave the same
+        if integral.has_parent():
+            continue
+        
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            yield check_integrate_matrix, integral_id, beam_type_id
+
+def check_integrate_matrix(integral_id, beam_type_id):
+    integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    
+    result = integrate_matrix(integral, beam_type, A, MAX_MODE, DECIMAL_PRECISION)
+    assert_equal((result.rows, result.cols), (MAX_MODE, MAX_MODE))
+    
+    for m, t, v, n in integral.iterate_over_used_variables(MAX_MODE): #@UnusedVariable
+        expected = integrate(
+            integral, beam_type, A, m=m, n=n,
+            decimal_precision=DECIMAL_PRECISION,
+            method='analytic'
+        )
+        assert_almost_equal(result[m-1, n-1], expected, delta=tests.MAX_ERROR_TOLERANCE)
+
+def test_integrate_numpy_matrix():
+    if numpy is None:
+        raise SkipTest
+    
+    integral = BaseIntegral.coerce(7) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    
+    expected = integrate_matrix(integral, beam_type, A, MAX_MODE, DECIMAL_PRECISION)
+    result = integrate_matrix(integral, beam_type, A, MAX_MODE, DECIMAL_PRECISION, module='numpy')
+    
+    assert_equal(result.shape, (MAX_MODE, MAX_MODE))
+    for m in range(MAX_MODE):
+        for n in range(MAX_MODE):
+            assert_almost_equal(result[m, n], float(expected[m, n]), delta=1e-9)
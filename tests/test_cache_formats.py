@@ -0,0 +1,85 @@
+from nose.tools import eq_, raises
+from nose_extra_tools import assert_is, assert_is_none #@UnresolvedImport
+import os
+import struct
+from sympy import Float, nan, S
+import tempfile
+from beam_integrals import cache_formats
+from beam_integrals.exceptions import UnsupportedCacheFormatError
+
+
+RESULTS = {
+    1: [
+        (Float('3.1415926535897932384626433832795028841971693993751', 50), Float('1e-52', 50)),
+        (Float('6.2831853071795864769252867665590057683943387987502', 50), Float('2e-52', 50)),
+    ],
+    6: [
+        (S.Zero, nan),
+        None, # Hole left by roots computed on demand
+        (Float('4.7300407448627040260240481008338848198983418007068', 50), Float('-3e-51', 22)),
+    ],
+}
+
+
+def setup():
+    global filename
+    fd, filename = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        cache_formats.write_roots_file(f, RESULTS)
+
+def teardown():
+    os.remove(filename)
+
+def test_round_trip_is_exact():
+    roots_file = cache_formats.RootsFile(filename)
+    eq_(sorted(roots_file), sorted(RESULTS))
+
+    for beam_type_id, mode_list in RESULTS.items():
+        eq_(len(roots_file[beam_type_id]), len(mode_list))
+        for expected, result in zip(mode_list, roots_file[beam_type_id]):
+            if expected is None:
+                assert_is_none(result)
+                continue
+
+            for x, y in zip(expected, result):
+                eq_(type(x), type(y))
+                eq_(getattr(x, '_mpf_', None), getattr(y, '_mpf_', None))
+                eq_(getattr(x, '_prec', None), getattr(y, '_prec', None))
+
+def test_roots_are_decoded_lazily():
+    roots_file = cache_formats.RootsFile(filename)
+    eq_(roots_file._decoded, {})
+
+    root = roots_file[1][1]
+    eq_(roots_file._decoded.keys(), [(1, 2)])
+
+    # Continuous cache hits should return same objects
+    assert_is(roots_file[1][1], root)
+
+def test_journal():
+    with tempfile.TemporaryFile() as f:
+        cache_formats.write_journal_entry(f, 1, 2, RESULTS[1][1])
+        cache_formats.write_journal_entry(f, 6, 1, RESULTS[6][0])
+        f.write('6 3 f0,') # Partially written entry
+
+        f.seek(0)
+        eq_(cache_formats.read_journal(f), {(1, 2): RESULTS[1][1], (6, 1): RESULTS[6][0]})
+
+def write_header(magic, version):
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<8sHI', magic, version, 0))
+
+@raises(UnsupportedCacheFormatError)
+def test_unsupported_version():
+    write_header(cache_formats.MAGIC, cache_formats.VERSION+1)
+    cache_formats.RootsFile(filename)
+
+@raises(UnsupportedCacheFormatError)
+def test_not_a_roots_file():
+    write_header('NOTROOTS', cache_formats.VERSION)
+    cache_formats.RootsFile(filename)
+
+@raises(UnsupportedCacheFormatError)
+def test_empty_file():
+    open(filename, 'wb').close()
+    cache_formats.RootsFile(filename)
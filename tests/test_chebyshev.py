@@ -0,0 +1,158 @@
+import mock
+from nose.tools import eq_, raises
+from nose_extra_tools import assert_almost_equal, assert_equal, assert_in #@UnresolvedImport
+import shutil
+import tempfile
+from beam_integrals import y
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals import chebyshev
+from beam_integrals.beam_types import BaseBeamType
+from beam_integrals.chebyshev import ChebyshevCache, ChebyshevSeries
+from beam_integrals.integrals import BaseIntegral, integrate
+import tests as t
+
+
+# Lower than defaults to speed up tests
+MAX_MODE = 3
+DECIMAL_PRECISION = 30
+
+A = 2.5
+Y_VALUES = (0., 0.25, 1.125, 2.5)
+
+# Covers products of `Y_m` and its 2nd derivative
+INTEGRAL_IDS = (1, 3, 7)
+
+
+def setup():
+    global disk_cache_dir, _old_best_roots_cache
+
+    _old_best_roots_cache = ces.best_roots_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    ces.best_roots_cache = ces.BestRootsCache(disk_cache_dir)
+    ces.best_roots_cache.regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+def teardown():
+    ces.best_roots_cache = _old_best_roots_cache
+    shutil.rmtree(disk_cache_dir)
+
+def test_chebyshev_series():
+    # `T_0 + 2*T_1 + 3*T_2 = 6*t**2 + 2*t - 2`
+    series = ChebyshevSeries([1, 2, 3])
+    assert_equal(series(0.5), 0.5)
+
+    # `T_1 * T_1 = (T_0 + T_2)/2`
+    eq_((ChebyshevSeries([0, 1]) * ChebyshevSeries([0, 1])).coefficients, [0.5, 0, 0.5])
+
+    # Integral of `6*t**2 + 2*t - 2` over `[-1, 1]`
+    result, error = series.integrate()
+    assert_almost_equal(result, 0, delta=1e-15)
+    assert_almost_equal(error, 0, delta=1e-14)
+
+def test_evaluate():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        for order in range(3):
+            yield check_evaluate, beam_type_id, order
+
+def check_evaluate(beam_type_id, order):
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+    modes = range(1, MAX_MODE+1)
+    expected = beam_type.evaluate(modes, Y_VALUES, order, A, 'mpf', DECIMAL_PRECISION)
+    result = beam_type.evaluate(modes, Y_VALUES, order, A, 'mpf', DECIMAL_PRECISION, method='chebyshev')
+
+    for i in range(len(modes)):
+        for j in range(len(Y_VALUES)):
+            assert_almost_equal(
+                result[i, j], expected[i, j],
+                delta=t.MAX_ERROR_TOLERANCE * max(1, abs(expected[i, j]))
+            )
+
+def test_integrate():
+    for integral_id in INTEGRAL_IDS:
+        integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            for m, t_, v, n in integral.iterate_over_used_variables(MAX_MODE):
+                yield check_integrate, integral_id, beam_type_id, m, t_, v, n
+
+def check_integrate(integral_id, beam_type_id, m, t_, v, n):
+    integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+
+    def base_integrate(method):
+        return integrate(
+            integral, beam_type, A, m, t_, v, n,
+            decimal_precision=DECIMAL_PRECISION, method=method
+        )
+
+    expected = base_integrate('analytic')
+    assert_almost_equal(
+        base_integrate('chebyshev'), expected,
+        delta=t.MAX_ERROR_TOLERANCE * max(1, abs(expected))
+    )
+
+class TestSpectralIntegrationFallback(object):
+    def setup(self):
+        class I99(BaseIntegral):
+            used_variables = ('m', 'n')
+
+            def _integrand(self, Y_m, dY_m, ddY_m, m, t, v, n): #@UnusedVariable
+                # Isn't a polynomial in mode shapes
+                return Y_m(m) * dY_m(n) / (1 + y)
+
+        self.integral = I99()
+        self.beam_type = BaseBeamType.coerce(1) #@UndefinedVariable
+
+    def teardown(self):
+        type(self.integral)._unregister_plugin() #@UndefinedVariable
+
+    def test_fallback_to_quadrature(self):
+        def base_integrate(**kwargs):
+            return integrate(
+                self.integral, self.beam_type,
+                a=1.,
+                m=1, n=1,
+                decimal_precision=DECIMAL_PRECISION,
+                **kwargs
+            )
+
+        assert_equal(base_integrate(method='chebyshev'), base_integrate())
+
+@raises(ValueError)
+def test_evaluate_unknown_method():
+    BaseBeamType.coerce(1).evaluate([1], Y_VALUES, method='taylor') #@UndefinedVariable
+
+def test_coefficients_are_loaded_from_disk():
+    beam_type = BaseBeamType.coerce(2) #@UndefinedVariable
+    expected = beam_type.chebyshev_series(2, 1, DECIMAL_PRECISION)
+    chebyshev.chebyshev_cache.flush()
+
+    # New processes start off with an empty RAM cache
+    ChebyshevCache._ram_cache.clear()
+    with mock.patch.object(chebyshev, 'chebyshev_coefficients') as m:
+        eq_(ChebyshevCache().get(beam_type, 2, 1, DECIMAL_PRECISION).coefficients, expected.coefficients)
+
+    eq_(m.call_count, 0)
+
+def test_coefficients_are_saved_in_batches():
+    beam_type = BaseBeamType.coerce(4) #@UndefinedVariable
+    cache = ChebyshevCache(tempfile.mkdtemp())
+    try:
+        with mock.patch.object(chebyshev, 'write_atomically', wraps=chebyshev.write_atomically) as m:
+            for order in range(3):
+                cache.get(beam_type, 3, order, DECIMAL_PRECISION)
+
+            eq_(m.call_count, 0)
+
+            cache.flush()
+            cache.flush() # Nothing left to save
+            eq_(m.call_count, 1)
+
+        for order in range(3):
+            assert_in((beam_type.id, 3, order), cache._read_disk_cache(DECIMAL_PRECISION))
+    finally:
+        shutil.rmtree(cache.disk_cache_dir)
+
+def test_regenerate():
+    ChebyshevCache().regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+    cache = ChebyshevCache()
+    eq_(len(cache._read_disk_cache(DECIMAL_PRECISION)), len(BaseBeamType.plugins.valid_ids) * MAX_MODE * 3) #@UndefinedVariable
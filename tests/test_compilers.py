@@ -0,0 +1,72 @@
+from nose.tools import raises
+from nose.plugins.skip import SkipTest
+from nose_extra_tools import assert_almost_equal, assert_equal #@UnresolvedImport
+from sympy import cos, cosh, exp, Float, gamma, mpmath, pi, Rational, sin, sinh, sqrt, tan, tanh
+from beam_integrals import a, y, mu_m
+from beam_integrals import compilers
+from beam_integrals.exceptions import UnsupportedExpressionError
+import tests as t
+
+
+EXPRESSIONS = (
+    sin(mu_m*y/a),
+    cos(mu_m)*cosh(mu_m) - 1,
+    tan(mu_m) - tanh(mu_m),
+    Rational(1, 3)*sinh(mu_m*y/a)**2 - exp(-mu_m*y/a)/a,
+    sqrt(mu_m) + pi*y,
+    Float('1.2345678901234567890123456789012345678901234567890', 50)*y,
+)
+
+VALUES = {'mu_m': Float('4.73004074486270402602404810083388868'), 'y': Float('0.3'), 'a': Float('1.5')}
+
+
+def test_mpmath_module():
+    for expr in EXPRESSIONS:
+        yield check_mpmath_module, expr
+
+def check_mpmath_module(expr):
+    func = compilers.compile_function(expr, ('mu_m', 'y', 'a'), 'mpmath', t.DECIMAL_PRECISION)
+
+    with mpmath.workdps(t.DECIMAL_PRECISION):
+        result = func(**VALUES)
+
+    expected = expr.evalf(n=t.DECIMAL_PRECISION, subs=VALUES)
+    assert_almost_equal(result, expected, delta=t.MAX_ERROR_TOLERANCE)
+
+def test_float_modules():
+    for module in ('math', 'numpy'):
+        for expr in EXPRESSIONS:
+            yield check_float_module, module, expr
+
+def check_float_module(module, expr):
+    if module == 'numpy' and compilers.numpy is None:
+        raise SkipTest
+
+    func = compilers.compile_function(expr, ('mu_m', 'y', 'a'), module)
+    result = func(**dict((k, float(v)) for k, v in VALUES.items()))
+
+    expected = float(expr.evalf(subs=VALUES))
+    assert_almost_equal(result, expected, delta=1e-12)
+
+def test_numpy_module_is_vectorised():
+    if compilers.numpy is None:
+        raise SkipTest
+
+    func = compilers.compile_function(sin(mu_m*y/a), ('mu_m', 'y', 'a'), 'numpy')
+    result = func(float(pi), compilers.numpy.linspace(0., 1., 5), 1.)
+    assert_equal(result.shape, (5,))
+
+@raises(UnsupportedExpressionError)
+def test_unsupported_expression_error():
+    compilers.compile_function(gamma(y), ('y',))
+
+@raises(ValueError)
+def test_unsupported_module():
+    compilers.compile_function(y, ('y',), 'unknown')
+
+def test_estimate_cancellation_digits():
+    assert_equal(compilers.estimate_cancellation_digits(sin(mu_m*y/a), {y: a}), 0)
+    assert_equal(compilers.estimate_cancellation_digits(exp(-10*y/a), {y: a}), 0)
+
+    # `cosh(100) ~ 10**43`
+    assert_equal(compilers.estimate_cancellation_digits(cosh(100*y/a), {y: a}), 44)
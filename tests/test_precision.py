@@ -0,0 +1,79 @@
+from nose.tools import raises
+from nose_extra_tools import assert_equal, assert_less, assert_less_equal #@UnresolvedImport
+import shutil
+import tempfile
+from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals import precision
+from beam_integrals.beam_types import BaseBeamType
+from beam_integrals.integrals import BaseIntegral, integrate
+
+
+# Lower than defaults to speed up tests
+MAX_MODE = 3
+DECIMAL_PRECISION = 60
+
+A = 2.5
+ACCURACY = 1e-20
+
+
+def setup():
+    global disk_cache_dir, _old_best_roots_cache
+
+    _old_best_roots_cache = ces.best_roots_cache
+    disk_cache_dir = tempfile.mkdtemp()
+    ces.best_roots_cache = ces.BestRootsCache(disk_cache_dir)
+    ces.best_roots_cache.regenerate(MAX_MODE, DECIMAL_PRECISION)
+
+def teardown():
+    ces.best_roots_cache = _old_best_roots_cache
+    shutil.rmtree(disk_cache_dir)
+
+def test_exact_roots_are_perfectly_conditioned():
+    beam_type = BaseBeamType.coerce(6) #@UndefinedVariable
+    for mode in beam_type.dont_improve_mu_m_for_modes:
+        assert_equal(precision.root_condition_digits(beam_type, mode), 0)
+
+def test_higher_modes_need_more_precision():
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+        for order in range(3):
+            assert_less_equal(
+                precision.mode_decimal_precision(beam_type, 1, ACCURACY, order),
+                precision.mode_decimal_precision(beam_type, 100, ACCURACY, order)
+            )
+
+def test_plan_is_below_default_precision():
+    integral = BaseIntegral.coerce(7) #@UndefinedVariable
+    for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+        beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+        assert_less(
+            precision.plan_decimal_precision(integral, beam_type, A, m=100, n=100, accuracy=ACCURACY),
+            DECIMAL_PRECISION
+        )
+
+def test_integrate_to_accuracy():
+    for integral_id in (1, 3, 7):
+        for beam_type_id in BaseBeamType.plugins.valid_ids: #@UndefinedVariable
+            for kwargs in ({'accuracy': ACCURACY}, {'relative_accuracy': ACCURACY}):
+                # Off-diagonal results of orthogonal modes are close to 0
+                for m, n in ((MAX_MODE, MAX_MODE), (1, MAX_MODE)):
+                    yield check_integrate_to_accuracy, integral_id, beam_type_id, m, n, kwargs
+
+def check_integrate_to_accuracy(integral_id, beam_type_id, m, n, kwargs):
+    integral = BaseIntegral.coerce(integral_id) #@UndefinedVariable
+    beam_type = BaseBeamType.coerce(beam_type_id) #@UndefinedVariable
+
+    result, error, decimal_precision = precision.integrate_to_accuracy(
+        integral, beam_type, A, m=m, n=n, **kwargs
+    )
+    expected = integrate(integral, beam_type, A, m=m, n=n, decimal_precision=DECIMAL_PRECISION)
+
+    target = kwargs.get('accuracy') or \
+        kwargs['relative_accuracy'] * precision.magnitude_bound(integral, beam_type, A, m=m, n=n)
+    assert_less_equal(error, target)
+    assert_less_equal(abs(result - expected), target)
+    assert_less(decimal_precision, DECIMAL_PRECISION)
+
+@raises(ValueError)
+def test_accuracy_is_required():
+    precision.plan_decimal_precision(BaseIntegral.coerce(1), BaseBeamType.coerce(1), A, m=1, n=1) #@UndefinedVariable
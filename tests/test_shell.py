@@ -1,9 +1,13 @@
 import mock
+from nose.tools import eq_
 from nose_extra_tools import assert_raises #@UnresolvedImport
 import beam_integrals as b
+from beam_integrals import beam_types
 from beam_integrals import characteristic_equation_solvers as ces
+from beam_integrals import chebyshev
+from beam_integrals import integrals
 from beam_integrals.exceptions import ShellCommandError
-from beam_integrals.shell import Shell
+from beam_integrals.shell import print_progress, Shell
 
 
 def setup():
@@ -27,16 +31,118 @@ def test_help():
         shell('help best-roots-of-characteristic-equations-regenerate-cache')
         m.assert_called_with()
     
+    @mock.patch.object(_shell.subcommands['best-roots-of-characteristic-equations-convert-cache'], 'print_help')
+    def test_help_best_roots_of_characteristic_equations_convert_cache(m):
+        shell('help best-roots-of-characteristic-equations-convert-cache')
+        m.assert_called_with()
+    
+    @mock.patch.object(_shell.subcommands['mode-shape-derivatives-regenerate-cache'], 'print_help')
+    def test_help_mode_shape_derivatives_regenerate_cache(m):
+        shell('help mode-shape-derivatives-regenerate-cache')
+        m.assert_called_with()
+    
+    @mock.patch.object(_shell.subcommands['chebyshev-series-regenerate-cache'], 'print_help')
+    def test_help_chebyshev_series_regenerate_cache(m):
+        shell('help chebyshev-series-regenerate-cache')
+        m.assert_called_with()
+    
+    @mock.patch.object(_shell.subcommands['integrals-regenerate-cache'], 'print_help')
+    def test_help_integrals_regenerate_cache(m):
+        shell('help integrals-regenerate-cache')
+        m.assert_called_with()
+    
+    @mock.patch.object(_shell.subcommands['integrate-many'], 'print_help')
+    def test_help_integrate_many(m):
+        shell('help integrate-many')
+        m.assert_called_with()
+    
     test_help()
     test_help_no_args()
     test_help_best_roots_of_characteristic_equations_regenerate_cache()
+    test_help_best_roots_of_characteristic_equations_convert_cache()
+    test_help_mode_shape_derivatives_regenerate_cache()
+    test_help_chebyshev_series_regenerate_cache()
+    test_help_integrals_regenerate_cache()
+    test_help_integrate_many()
     
     assert_raises(ShellCommandError, shell, 'help invalid-command')
 
 @mock.patch.object(ces.best_roots_cache, 'regenerate')
 def test_best_roots_of_characteristic_equations_regenerate_cache(m):
     shell('best-roots-of-characteristic-equations-regenerate-cache')
+    m.assert_called_with(
+        max_mode=b.DEFAULT_MAX_MODE, decimal_precision=b.DEFAULT_DECIMAL_PRECISION,
+        processes=None, progress=print_progress, resume=False
+    )
+    
+    shell('best-roots-of-characteristic-equations-regenerate-cache --max-mode=10 --decimal-precision=15 --processes=2 --resume')
+    m.assert_called_with(
+        max_mode=10, decimal_precision=15, processes=2, progress=print_progress, resume=True
+    )
+
+@mock.patch.object(ces.best_roots_cache, 'extend')
+def test_best_roots_of_characteristic_equations_extend_cache(m):
+    shell('best-roots-of-characteristic-equations-regenerate-cache --extend --max-mode=10')
+    m.assert_called_with(
+        max_mode=10, decimal_precision=b.DEFAULT_DECIMAL_PRECISION,
+        processes=None, progress=print_progress
+    )
+
+@mock.patch.object(ces.best_roots_cache, 'regenerate')
+@mock.patch.object(ces.best_roots_cache, 'extend')
+def test_best_roots_of_characteristic_equations_extend_cache_cant_resume(m_extend, m_regenerate):
+    assert_raises(
+        ShellCommandError,
+        shell, 'best-roots-of-characteristic-equations-regenerate-cache --extend --resume'
+    )
+    eq_(m_extend.call_count, 0)
+    eq_(m_regenerate.call_count, 0)
+
+def test_print_progress():
+    with mock.patch('sys.stderr') as m_stderr:
+        print_progress(1, 2, 3.5)
+    m_stderr.write.assert_any_call('\r1/2 roots found, ETA 3s')
+
+@mock.patch.object(ces.best_roots_cache, 'convert_legacy_disk_caches')
+def test_best_roots_of_characteristic_equations_convert_cache(m):
+    shell('best-roots-of-characteristic-equations-convert-cache')
+    m.assert_called_with()
+
+@mock.patch.object(beam_types.derivatives_cache, 'regenerate')
+def test_mode_shape_derivatives_regenerate_cache(m):
+    shell('mode-shape-derivatives-regenerate-cache')
+    m.assert_called_with(max_order=beam_types.DerivativesCache.max_order)
+    
+    shell('mode-shape-derivatives-regenerate-cache --max-order=6')
+    m.assert_called_with(max_order=6)
+
+@mock.patch.object(chebyshev.chebyshev_cache, 'regenerate')
+def test_chebyshev_series_regenerate_cache(m):
+    shell('chebyshev-series-regenerate-cache')
     m.assert_called_with(max_mode=b.DEFAULT_MAX_MODE, decimal_precision=b.DEFAULT_DECIMAL_PRECISION)
     
-    shell('best-roots-of-characteristic-equations-regenerate-cache --max-mode=10 --decimal-precision=15')
+    shell('chebyshev-series-regenerate-cache --max-mode=10 --decimal-precision=15')
     m.assert_called_with(max_mode=10, decimal_precision=15)
+
+@mock.patch.object(integrals.integrals_cache, 'regenerate')
+def test_integrals_regenerate_cache(m):
+    shell('integrals-regenerate-cache')
+    m.assert_called_with(max_mode=b.DEFAULT_MAX_MODE, a=1., decimal_precision=b.DEFAULT_DECIMAL_PRECISION)
+    
+    shell('integrals-regenerate-cache --max-mode=10 --a=2.5 --decimal-precision=15')
+    m.assert_called_with(max_mode=10, a=2.5, decimal_precision=15)
+
+@mock.patch.object(integrals, 'integrate_many')
+@mock.patch.object(integrals, 'iterate_over_integrals')
+def test_integrate_many(m_tasks, m_integrate_many):
+    m_integrate_many.return_value = [((1, 2, 1, None, None, 2), 0.5)]
+    with mock.patch('sys.stdout') as m_stdout:
+        shell('integrate-many')
+    
+    m_tasks.assert_called_with(b.DEFAULT_MAX_MODE)
+    m_integrate_many.assert_called_with(m_tasks.return_value, 1., b.DEFAULT_DECIMAL_PRECISION, processes=None)
+    m_stdout.write.assert_any_call('1,2,1,,,2,0.5')
+    
+    shell('integrate-many --max-mode=10 --a=2.5 --decimal-precision=15 --processes=2')
+    m_tasks.assert_called_with(10)
+    m_integrate_many.assert_called_with(m_tasks.return_value, 2.5, 15, processes=2)